@@ -0,0 +1,327 @@
+"""End-to-end throughput benchmark for scripts/cleansing_pipeline.py.
+
+Runs the full `CleansingPipeline.process` loop against synthetic catalogs at several
+scales, with an in-memory Firestore and a stubbed Gemini (ReplayClient + synthetic
+responder) whose latency is configurable. Each scale runs in its own subprocess so
+peak RSS is measured per scale.
+
+Usage:
+    python3 scripts/benchmarks/bench_cleansing_pipeline.py --scales 1000x250,10000x2000
+    python3 scripts/benchmarks/bench_cleansing_pipeline.py --json-out bench.json
+    python3 scripts/benchmarks/bench_cleansing_pipeline.py --baseline bench.json   # fails on regressions
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cleansing_pipeline
+from cleansing_pipeline import CleansingPipeline, HabitatPreFilter
+from common.genai_replay import FixtureStore, ReplayClient
+from common.memory_firestore import MemoryFirestore
+from google.genai import types
+
+DEFAULT_SCALES = [f"{p}x{c}" for p in (1000, 10000, 100000) for c in (250, 2000, 20000)]
+POINTS_PER_AREA = 8
+AREAS_PER_ZONE = 10
+ZONES_PER_REGION = 5
+TOPOGRAPHY_WORDS = {key: words[0] for key, words in HabitatPreFilter.TOPOGRAPHY_KEYWORDS.items()}
+
+
+def build_catalog(db, n_points: int, n_creatures: int, seed: int = 0) -> List[str]:
+    """Write a synthetic location hierarchy and creature dictionary. Returns the creature IDs."""
+    rng = random.Random(seed)
+    n_areas = max(1, n_points // POINTS_PER_AREA)
+    n_zones = max(1, n_areas // AREAS_PER_ZONE)
+    n_regions = max(1, n_zones // ZONES_PER_REGION)
+    region_temps = [rng.randint(14, 26) for _ in range(n_regions)]
+    batch, pending = db.batch(), 0
+
+    def put(collection, doc_id, data):
+        nonlocal batch, pending
+        batch.set(db.collection(collection).document(doc_id), data)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+
+    for i in range(n_points):
+        a = i % n_areas
+        z = a % n_zones
+        r = z % n_regions
+        put('points', f"p{i:07d}", {
+            "name": f"ポイント{i}",
+            "maxDepth": rng.choice([10, 15, 20, 30, 40]),
+            "topography": rng.sample(list(TOPOGRAPHY_WORDS), rng.randint(1, 2)),
+            "waterTempRange": {"min": region_temps[r], "max": region_temps[r] + 4},
+            "region": f"リージョン{r}", "regionId": f"r{r:05d}",
+            "zone": f"ゾーン{z}", "zoneId": f"z{z:05d}",
+            "area": f"エリア{a}", "areaId": f"a{a:06d}",
+        })
+
+    creature_ids = []
+    for i in range(n_creatures):
+        creature_id = f"c{i:06d}"
+        creature_ids.append(creature_id)
+        low = rng.choice([0, 0, 5, 10, 20, 30, 50])
+        temp = rng.randint(12, 24)
+        habitats = rng.sample(list(TOPOGRAPHY_WORDS.values()), rng.randint(0, 2))
+        put('creatures', creature_id, {
+            "name": f"生物{i}",
+            "description": f"{'・'.join(habitats)}で見られる生物。" + "体長や色彩の特徴を説明する文章。" * 3,
+            "depthRange": {"min": low, "max": low + 20},
+            "waterTempRange": {"min": temp, "max": temp + 8},
+            "regions": [f"リージョン{r}" for r in rng.sample(range(n_regions), min(n_regions, rng.randint(0, 3)))],
+        })
+    if pending:
+        batch.commit()
+    db.ops.clear()
+    return creature_ids
+
+
+class SyntheticModel:
+    """Answers every pipeline request from its response schema, deterministically per (point, creature).
+
+    Output size follows the pipeline's own token estimates, and responses that would exceed
+    max_output_tokens are cut mid-element with finish_reason MAX_TOKENS, as the real model does.
+    """
+    CANDIDATES = re.compile(r"判定対象は次のIDの生物のみです（それ以外は出力しないでください）: (.*)")
+    BATCH_LINE = re.compile(r"^\s*- (c\d+): ", re.M)
+
+    def __init__(self, creature_ids: List[str], hit_rate: float, item_latency: float, cache_tokens: int):
+        self.creature_ids = creature_ids
+        self.hit_rate = hit_rate
+        self.item_latency = item_latency
+        self.cache_tokens = cache_tokens
+
+    @staticmethod
+    def _draw(key: str) -> float:
+        # CRC32 is linear, so draws for keys that differ in one prefix would be correlated
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big") / 2 ** 64
+
+    def _stage1(self, point_key: str, text: str) -> List[Dict[str, Any]]:
+        match = self.CANDIDATES.search(text)
+        ids = match.group(1).strip().split(", ") if match else self.creature_ids
+        return [{"creature_id": cid, "is_possible": True, "rarity": "Common",
+                 "confidence": round(self._draw(f"c|{point_key}|{cid}"), 2), "reasoning": "水深と地形が生息条件に合致する。"}
+                for cid in ids if self._draw(f"h|{point_key}|{cid}") < self.hit_rate]
+
+    def __call__(self, model: str, contents, config):
+        schema = config.response_schema
+        schema = json.dumps(schema if isinstance(schema, dict) else schema.model_dump(mode="json", exclude_none=True))
+        if '"point_id"' in schema:
+            items = []
+            for block in contents.split("■ point_id: ")[1:]:
+                point_id = block.split(None, 1)[0]
+                items.append({"point_id": point_id, "creatures": self._stage1(point_id, block)})
+            per_item = [120 * max(1, len(item["creatures"])) for item in items]
+        elif '"is_possible"' in schema:
+            items = self._stage1(re.search(r"「(.+?)」", contents).group(1), contents)
+            per_item = [120] * len(items)
+        elif '"presence"' in schema:
+            area = re.search(r"エリア「(.+?)」", contents).group(1)
+            items = []
+            for cid in self.BATCH_LINE.findall(contents):
+                draw = self._draw(f"a|{area}|{cid}")
+                items.append({"creature_id": cid, "presence": "widespread" if draw < 0.4 else "localized" if draw < 0.8 else "absent",
+                              "actual_existence": draw < 0.4 or (draw < 0.8 and self._draw(f"s2|{contents[:80]}|{cid}") < 0.7),
+                              "evidence": "エリア内の複数のログで確認。", "rarity": "Rare"})
+            per_item = [300] * len(items)
+        elif '"creature_id"' in schema:
+            items = [{"creature_id": cid, "actual_existence": self._draw(f"s2|{contents[:80]}|{cid}") < 0.7,
+                      "evidence": "ダイビングログで確認。", "rarity": "Rare"} for cid in self.BATCH_LINE.findall(contents)]
+            per_item = [250] * len(items)
+        else:
+            items = {"actual_existence": self._draw(contents) < 0.7, "evidence": "ダイビングログで確認。", "rarity": "Rare"}
+            per_item = [250]
+
+        finish = types.FinishReason.STOP
+        text = json.dumps(items, ensure_ascii=False)
+        if isinstance(items, list):
+            budget, keep = config.max_output_tokens or 8192, 0
+            while keep < len(items) and sum(per_item[:keep + 1]) <= budget:
+                keep += 1
+            if keep < len(items):
+                # Cut inside the first element that does not fit
+                head = json.dumps(items[:keep + 1], ensure_ascii=False)
+                text = head[:len(json.dumps(items[:keep], ensure_ascii=False)) + 20]
+                finish = types.FinishReason.MAX_TOKENS
+                per_item = per_item[:keep]
+        if self.item_latency:
+            time.sleep(self.item_latency * len(per_item))
+
+        prompt_tokens = len(contents) // 2
+        cached = self.cache_tokens if config.cached_content else 0
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]),
+                                        finish_reason=finish)],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens + cached, cached_content_token_count=cached,
+                candidates_token_count=sum(per_item)),
+        )
+
+
+def _timed(pipeline, split: Dict[str, float], name: str, label: str):
+    method = getattr(pipeline, name)
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            split[label] = split.get(label, 0.0) + time.perf_counter() - started
+    setattr(pipeline, name, wrapper)
+
+
+def run_scenario(scale: str, args) -> Dict[str, Any]:
+    n_points, n_creatures = (int(x) for x in scale.lower().split("x"))
+    db = MemoryFirestore()
+    started = time.perf_counter()
+    creature_ids = build_catalog(db, n_points, n_creatures, args.seed)
+    build_seconds = time.perf_counter() - started
+
+    model = SyntheticModel(creature_ids, args.hit_rate, args.item_latency, cache_tokens=n_creatures * 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        client = ReplayClient(FixtureStore(os.path.join(tmp, "none.jsonl")), latency=args.latency,
+                              jitter=args.jitter, error_rate=args.error_rate, seed=args.seed, fallback=model)
+        pipeline = CleansingPipeline(client=client, db=db)
+        # Time split per step (summed over worker threads, so it can exceed the wall time)
+        split: Dict[str, float] = {}
+        for name, label in (("load_data", "load"), ("create_context_cache", "contextCache"),
+                            ("_prepare_point", "prefilter"), ("_existing_mapping_keys", "existingLookup"),
+                            ("_store_mapping", "write")):
+            _timed(pipeline, split, name, label)
+
+        started = time.perf_counter()
+        pipeline.process(mode=args.mode, filters={}, limit=args.limit, concurrency=args.concurrency,
+                         sink=args.sink, min_habitat_score=args.min_habitat_score,
+                         points_per_request=args.points_per_request, area_grounding=args.area_grounding,
+                         stage2_batch_size=args.stage2_batch_size, stage2_budget=args.stage2_budget,
+                         max_inflight=args.max_inflight, stage1_model=args.stage1_model,
+                         escalation_share=args.escalation_share, pipeline=args.pipeline,
+                         stage2_workers=args.stage2_workers)
+        wall = time.perf_counter() - started
+
+    metrics = pipeline.metrics.summary()
+    for stage in metrics["stages"]:
+        label = "stage1" if stage["stage"].startswith("stage1") else "stage2"
+        split[label] = split.get(label, 0.0) + stage["latency"]["sum"]
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    points = len(pipeline.points)
+    per_point = lambda value: round(value / points, 3) if points else 0.0
+    return {
+        "scale": scale,
+        "points": points,
+        "creatures": n_creatures,
+        "mappings": pipeline.processed_count,
+        "wallSeconds": round(wall, 3),
+        "pointsPerMinute": round(points / wall * 60, 1) if wall else 0.0,
+        "mappingsPerMinute": round(pipeline.processed_count / wall * 60, 1) if wall else 0.0,
+        "firestoreOpsPerPoint": {op: per_point(count) for op, count in sorted(db.ops.items())},
+        "genaiCallsPerPoint": per_point(metrics["totals"]["calls"]),
+        "groundedRequests": metrics["totals"]["grounded"],
+        "outputTokensPerPoint": per_point(metrics["totals"]["outputTokens"]),
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        "peakRssMb": round(peak_kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+        "secondsPerStep": {k: round(v, 3) for k, v in sorted(split.items())},
+        "catalogBuildSeconds": round(build_seconds, 3),
+    }
+
+
+def print_table(results: List[Dict[str, Any]]):
+    header = f"{'scale':>13} {'pts/min':>10} {'maps/min':>10} {'fs ops/pt':>10} {'calls/pt':>9} {'RSS MB':>8}  time per step (s)"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        ops = sum(r["firestoreOpsPerPoint"].values())
+        steps = " ".join(f"{k}={v}" for k, v in r["secondsPerStep"].items())
+        print(f"{r['scale']:>13} {r['pointsPerMinute']:>10} {r['mappingsPerMinute']:>10} {ops:>10.2f} "
+              f"{r['genaiCallsPerPoint']:>9} {r['peakRssMb']:>8}  {steps}")
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> bool:
+    """True if no scale got slower than the baseline by more than `tolerance`."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["scale"]: r for r in json.load(f)["results"]}
+    ok = True
+    for r in results:
+        before = baseline.get(r["scale"])
+        if not before or not before["pointsPerMinute"]:
+            continue
+        change = r["pointsPerMinute"] / before["pointsPerMinute"] - 1
+        status = "❌ REGRESSION" if change < -tolerance else "✅"
+        ok &= change >= -tolerance
+        print(f"{status} {r['scale']}: {before['pointsPerMinute']} -> {r['pointsPerMinute']} points/min ({change:+.1%})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the cleansing pipeline (offline, synthetic data)")
+    parser.add_argument("--scales", default=",".join(DEFAULT_SCALES), help="Comma-separated <points>x<creatures> scenarios")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stubbed model latency per Gemini call (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform extra latency per call (seconds)")
+    parser.add_argument("--item-latency", type=float, default=0.0, help="Stubbed generation time per output element (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stubbed Gemini calls failing with 429 RESOURCE_EXHAUSTED")
+    parser.add_argument("--hit-rate", type=float, default=0.08, help="Share of candidate creatures Stage 1 returns as possible (~20 of 255 in production)")
+    parser.add_argument("--mode", choices=["all", "new"], default="all")
+    parser.add_argument("--limit", type=int, default=10 ** 9)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-inflight", type=int, default=32)
+    parser.add_argument("--pipeline", action="store_true")
+    parser.add_argument("--stage2-workers", type=int, default=0)
+    parser.add_argument("--sink", choices=list(cleansing_pipeline.SINKS), default="batch")
+    parser.add_argument("--points-per-request", type=int, default=1)
+    parser.add_argument("--stage2-batch-size", type=int, default=1)
+    parser.add_argument("--stage1-model", help="Cheap Stage 1 model for tiered routing (default: main model only)")
+    parser.add_argument("--escalation-share", type=float, default=0.3)
+    parser.add_argument("--stage2-budget", help="Run Stage 2 through the priority scheduler with this budget (requests or 90s / 30m)")
+    # Same defaults as the pipeline, so a plain run measures what a plain cleansing run does
+    parser.add_argument("--area-grounding", choices=["confirm", "reuse", "off"], default="off")
+    parser.add_argument("--min-habitat-score", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-out", help="Write the results as JSON (usable as --baseline later)")
+    parser.add_argument("--baseline", help="Compare points/min against a previous --json-out and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed slowdown vs. --baseline (0.1 = 10%%)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING),
+                        format='%(asctime)s [%(levelname)s] %(message)s')
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args)))
+        return
+
+    results = []
+    for scale in [s.strip() for s in args.scales.split(",") if s.strip()]:
+        print(f"⏱️ Running {scale} ...", flush=True)
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", scale],
+                               stdout=subprocess.PIPE, text=True)
+        if child.returncode != 0:
+            print(f"❌ Scenario {scale} failed (exit {child.returncode})")
+            continue
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    print_table(results)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("child", "baseline", "json_out")},
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Results written to {args.json_out}")
+    if args.baseline and not compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,32 @@ print("🚀 Starting Cleansing Pipeline Script...", flush=True)
 
 import json
 import os
+import hashlib
+import heapq
 import argparse
 import time
 import logging
-from typing import List, Dict, Any
-from datetime import datetime, timezone
+import random
+import socket
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Any, Optional, Iterator, Iterable
+from datetime import datetime, timezone, timedelta
+import numpy as np
 from google import genai
 from google.genai import types
 import firebase_admin
 from firebase_admin import credentials, firestore
 import sys
+import queue
+from google.api_core import exceptions as gapi_exceptions
+from common.adaptive_limiter import AdaptiveConcurrencyLimiter, RetryPolicy, is_transient
+from common.json_stream import JsonArrayStreamParser, parse_json_array
 
 # --- Logging Configuration ---
 PROJECT_ID = os.environ.get("GCLOUD_PROJECT")
@@ -20,47 +36,1525 @@ LOCATION = os.environ.get("LOCATION") or os.environ.get("AI_AGENT_LOCATION")
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
 logger = logging.getLogger(__name__)
 
-class CleansingPipeline:
+# Bump whenever the Stage 2 prompt or schema changes so cached verdicts are not reused.
+# Single-creature and multi-creature prompts are versioned separately so their verdicts never mix.
+STAGE2_PROMPT_VERSION = "s2-v1"
+STAGE2_BATCH_PROMPT_VERSION = "s2-batch-v1"
+STAGE2_AREA_PROMPT_VERSION = "s2-area-v2"
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DEFAULT_SEED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "data")
+
+class GenAIMetrics:
+    """Counters, token usage and latency histograms of Gemini calls, per (stage, model)."""
+    LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+    # List prices in USD per 1M tokens; cached input is billed at 25% of regular input.
+    PRICES_PER_MTOK = {
+        "gemini-2.0-flash-001": {"input": 0.15, "cached": 0.0375, "output": 0.60},
+        "gemini-2.0-flash-lite-001": {"input": 0.075, "cached": 0.01875, "output": 0.30},
+    }
+    GROUNDING_PRICE_PER_REQUEST = 0.035
+
     def __init__(self):
+        self.started = time.monotonic()
+        self._series: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, stage: str, model: str) -> Dict[str, Any]:
+        series = self._series.get((stage, model))
+        if series is None:
+            series = self._series[(stage, model)] = {
+                "calls": 0, "errors": 0, "retries": 0, "grounded": 0,
+                "promptTokens": 0, "cachedTokens": 0, "outputTokens": 0,
+                "latencies": [],
+            }
+        return series
+
+    def record(self, stage: str, model: str, latency: float, usage=None, grounded: bool = False, error: bool = False):
+        with self._lock:
+            series = self._get(stage, model)
+            series["calls"] += 1
+            series["errors"] += int(error)
+            series["grounded"] += int(grounded)
+            series["latencies"].append(latency)
+            if usage is not None:
+                series["promptTokens"] += getattr(usage, 'prompt_token_count', None) or 0
+                series["cachedTokens"] += getattr(usage, 'cached_content_token_count', None) or 0
+                series["outputTokens"] += (getattr(usage, 'candidates_token_count', None) or 0) + \
+                                          (getattr(usage, 'thoughts_token_count', None) or 0)
+
+    def retry(self, stage: str, model: str):
+        with self._lock:
+            self._get(stage, model)["retries"] += 1
+
+    def total(self, field: str) -> int:
+        with self._lock:
+            return sum(series[field] for series in self._series.values())
+
+    def _cost(self, model: str, series: Dict[str, Any]) -> float:
+        price = self.PRICES_PER_MTOK.get(model)
+        cost = series["grounded"] * self.GROUNDING_PRICE_PER_REQUEST
+        if price:
+            uncached = series["promptTokens"] - series["cachedTokens"]
+            cost += (uncached * price["input"] + series["cachedTokens"] * price["cached"]
+                     + series["outputTokens"] * price["output"]) / 1e6
+        return cost
+
+    def summary(self, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self._lock:
+            items = [(key, dict(series, latencies=sorted(series["latencies"]))) for key, series in sorted(self._series.items())]
+        stages = []
+        for (stage, model), series in items:
+            latencies = series.pop("latencies")
+            pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+            stages.append(series | {
+                "stage": stage,
+                "model": model,
+                "cacheHitRatio": round(series["cachedTokens"] / series["promptTokens"], 4) if series["promptTokens"] else 0.0,
+                "latency": {
+                    "sum": round(sum(latencies), 3),
+                    "p50": round(pct(0.5), 3),
+                    "p95": round(pct(0.95), 3),
+                    "max": round(latencies[-1], 3) if latencies else 0.0,
+                    "buckets": {str(b): sum(1 for l in latencies if l <= b) for b in self.LATENCY_BUCKETS},
+                },
+                "estimatedCostUsd": round(self._cost(model, series), 6),
+            })
+        totals = {k: sum(st[k] for st in stages) for k in
+                  ("calls", "errors", "retries", "grounded", "promptTokens", "cachedTokens", "outputTokens")}
+        totals["estimatedCostUsd"] = round(sum(st["estimatedCostUsd"] for st in stages), 6)
+        totals["cacheHitRatio"] = round(totals["cachedTokens"] / totals["promptTokens"], 4) if totals["promptTokens"] else 0.0
+        return {"elapsedSeconds": round(time.monotonic() - self.started, 3), "run": extra or {}, "totals": totals, "stages": stages}
+
+    # (summary field, metric name, type, help) of the per-(stage, model) series
+    PROMETHEUS_SERIES = (
+        ("calls", "calls_total", "counter", "Gemini calls, including failed attempts"),
+        ("errors", "errors_total", "counter", "Failed Gemini calls"),
+        ("retries", "retries_total", "counter", "Gemini calls retried after a 429 / transient error"),
+        ("grounded", "grounded_requests_total", "counter", "Gemini calls with Google Search grounding"),
+        ("promptTokens", "prompt_tokens_total", "counter", "Prompt tokens, including cached tokens"),
+        ("cachedTokens", "cached_tokens_total", "counter", "Prompt tokens served from the context cache"),
+        ("outputTokens", "output_tokens_total", "counter", "Output (and thinking) tokens"),
+        ("estimatedCostUsd", "estimated_cost_usd", "gauge", "Estimated cost of the run at list prices (USD)"),
+    )
+
+    def to_prometheus(self, extra: Optional[Dict[str, Any]] = None) -> str:
+        """Prometheus text exposition format (e.g. for a node_exporter textfile collector)."""
+        summary = self.summary(extra)
+        lines = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        family("wedive_cleansing_elapsed_seconds", "gauge", "Wall-clock duration of the cleansing run")
+        lines.append(f"wedive_cleansing_elapsed_seconds {summary['elapsedSeconds']}")
+        run_fields = [(key, value) for key, value in summary["run"].items()
+                      if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        if run_fields:
+            family("wedive_cleansing_run", "gauge", "Run summary values (points, mappings, cache hits, ...) by field")
+            for key, value in run_fields:
+                lines.append(f'wedive_cleansing_run{{field="{key}"}} {value}')
+
+        labels = [(st, f'stage="{st["stage"]}",model="{st["model"]}"') for st in summary["stages"]]
+        if not labels:
+            return "\n".join(lines) + "\n"
+        for field, name, kind, help_text in self.PROMETHEUS_SERIES:
+            family(f"wedive_genai_{name}", kind, help_text)
+            for st, label in labels:
+                lines.append(f"wedive_genai_{name}{{{label}}} {st[field]}")
+        family("wedive_genai_latency_seconds", "histogram", "Latency of Gemini calls")
+        for st, label in labels:
+            for bucket, count in st["latency"]["buckets"].items():
+                lines.append(f'wedive_genai_latency_seconds_bucket{{{label},le="{bucket}"}} {count}')
+            lines.append(f'wedive_genai_latency_seconds_bucket{{{label},le="+Inf"}} {st["calls"]}')
+            lines.append(f"wedive_genai_latency_seconds_sum{{{label}}} {st['latency']['sum']}")
+            lines.append(f"wedive_genai_latency_seconds_count{{{label}}} {st['calls']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, extra: Optional[Dict[str, Any]] = None):
+        """Write the summary as Prometheus text if `path` ends in .prom, JSON otherwise."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus(extra))
+            else:
+                json.dump(self.summary(extra), f, ensure_ascii=False, indent=2)
+
+
+class MappingSink(ABC):
+    """Destination for accepted point_creatures mappings. Subclasses decide how writes are grouped."""
+    def __init__(self, db, flush_interval: float = 5.0):
+        self.collection = db.collection('point_creatures')
+        self.flush_interval = flush_interval
+        self.committed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        # Called with True after writes became durable, False after a failed commit.
+        self.on_commit = lambda ok: None
+
+    @abstractmethod
+    def write(self, key: str, entry: Dict[str, Any]):
+        ...
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class DirectSink(MappingSink):
+    """One `set` RPC per mapping (original behaviour)."""
+    def write(self, key: str, entry: Dict[str, Any]):
+        try:
+            self.collection.document(key).set(entry)
+            self.committed += 1
+            self.on_commit(True)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"  ❌ Failed to write {key}: {e}")
+            self.on_commit(False)
+
+
+class BatchSink(MappingSink):
+    """Groups writes into WriteBatches of up to 500 operations (Firestore limit).
+
+    A batch is committed when it is full or when its oldest write is older than
+    `flush_interval` seconds (checked on every write), and finally on `close()`.
+    """
+    MAX_BATCH_SIZE = 500
+
+    def __init__(self, db, flush_interval: float = 5.0, batch_size: int = MAX_BATCH_SIZE):
+        super().__init__(db, flush_interval)
+        self.db = db
+        self.batch_size = min(batch_size, self.MAX_BATCH_SIZE)
+        self._pending: List[str] = []
+        self._batch = None
+        self._opened_at = 0.0
+
+    def write(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            if self._batch is None:
+                self._batch = self.db.batch()
+                self._opened_at = time.monotonic()
+            self._batch.set(self.collection.document(key), entry)
+            self._pending.append(key)
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._opened_at >= self.flush_interval:
+                self._commit()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        if not self._pending:
+            return
+        batch, keys = self._batch, self._pending
+        self._batch, self._pending = None, []
+        try:
+            batch.commit()
+            self.committed += len(keys)
+            logger.info(f"  💾 Committed batch of {len(keys)} mappings.")
+            self.on_commit(True)
+        except Exception as e:
+            self.failed += len(keys)
+            logger.error(f"  ❌ Batch commit failed ({len(keys)} mappings, first key={keys[0]}): {e}")
+            self.on_commit(False)
+
+
+class BulkWriterSink(MappingSink):
+    """Streams writes through Firestore's BulkWriter, which commits batches in parallel and retries failures."""
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, db, flush_interval: float = 5.0):
+        super().__init__(db, flush_interval)
+        self._last_flush = time.monotonic()
+        self.writer = db.bulk_writer()
+        self.writer.on_write_result(self._on_result)
+        self.writer.on_write_error(self._on_error)
+
+    def _on_result(self, reference, result, writer):
+        with self._lock:
+            self.committed += 1
+
+    def _on_error(self, failure, writer) -> bool:
+        if failure.attempts < self.MAX_ATTEMPTS:
+            return True
+        with self._lock:
+            self.failed += 1
+        logger.error(f"  ❌ Failed to write {failure.operation.reference.id} after {failure.attempts} attempts: {failure.message}")
+        return False
+
+    def write(self, key: str, entry: Dict[str, Any]):
+        self.writer.set(self.collection.document(key), entry)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        failed_before = self.failed
+        self.writer.flush()
+        self._last_flush = time.monotonic()
+        self.on_commit(self.failed == failed_before)
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+SINKS = {"direct": DirectSink, "batch": BatchSink, "bulk": BulkWriterSink}
+
+
+class GroundingCache(ABC):
+    """Read-through / write-through cache of Stage 2 verdicts keyed by (point, creature, prompt version)."""
+    def __init__(self, ttl_days: float = 30):
+        self.ttl = timedelta(days=ttl_days)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(point_id: str, creature_id: str, prompt_version: str = STAGE2_PROMPT_VERSION) -> str:
+        return f"{point_id}_{creature_id}_{prompt_version}"
+
+    def get(self, point_id: str, creature_id: str,
+            prompt_version: str = STAGE2_PROMPT_VERSION) -> Optional[Dict[str, Any]]:
+        try:
+            verdict = self._read(self.make_key(point_id, creature_id, prompt_version), datetime.now(timezone.utc))
+        except Exception as e:
+            logger.warning(f"⚠️ Grounding cache read failed: {e}")
+            verdict = None
+        with self._lock:
+            if verdict is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return verdict
+
+    def put(self, point_id: str, creature_id: str, verdict: Dict[str, Any],
+            prompt_version: str = STAGE2_PROMPT_VERSION):
+        try:
+            self._write(self.make_key(point_id, creature_id, prompt_version), point_id, creature_id,
+                        prompt_version, verdict, datetime.now(timezone.utc) + self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ Grounding cache write failed: {e}")
+
+    @abstractmethod
+    def _read(self, key: str, now: datetime) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def _write(self, key: str, point_id: str, creature_id: str, prompt_version: str,
+               verdict: Dict[str, Any], expires_at: datetime):
+        ...
+
+
+class FirestoreGroundingCache(GroundingCache):
+    """Stores verdicts in `ai_grounding_cache` (see DATABASE_DESIGN.md 3.8)."""
+    def __init__(self, db, ttl_days: float = 30):
+        super().__init__(ttl_days)
+        self.collection = db.collection('ai_grounding_cache')
+
+    def _read(self, key, now):
+        doc = self.collection.document(key).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        expires_at = data.get('expiresAt')
+        if expires_at is None or expires_at <= now:
+            return None
+        return data.get('verdict')
+
+    def _write(self, key, point_id, creature_id, prompt_version, verdict, expires_at):
+        self.collection.document(key).set({
+            "pointId": point_id,
+            "creatureId": creature_id,
+            "promptVersion": prompt_version,
+            "verdict": verdict,
+            "createdAt": firestore.SERVER_TIMESTAMP,
+            "expiresAt": expires_at,
+        })
+
+
+class SQLiteGroundingCache(GroundingCache):
+    """Local file backend, useful for development runs without touching Firestore."""
+    def __init__(self, path: str, ttl_days: float = 30):
+        super().__init__(ttl_days)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS grounding_cache "
+            "(key TEXT PRIMARY KEY, verdict TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def _read(self, key, now):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT verdict FROM grounding_cache WHERE key = ? AND expires_at > ?", (key, now.timestamp())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, key, point_id, creature_id, prompt_version, verdict, expires_at):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO grounding_cache (key, verdict, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(verdict, ensure_ascii=False), expires_at.timestamp())
+            )
+            self.conn.commit()
+
+
+class AreaGroundingPlanner:
+    """Shares one Stage 2 area verdict per (area, creature) among the sibling points of a run.
+
+    The first point of an area that needs grounding for a set of creatures queries the ones
+    no sibling has asked for yet, in batched requests; siblings (including concurrent ones)
+    wait for and reuse the same verdicts. Areas with a single point in the run keep the
+    per-point query.
+    """
+    MAX_LISTED_POINTS = 20
+
+    def __init__(self, points: List[Dict[str, Any]], confirm_ambiguous: bool = True):
+        self.confirm_ambiguous = confirm_ambiguous
+        self.area_points: Dict[str, List[str]] = {}
+        for p in points:
+            if p.get('areaId'):
+                self.area_points.setdefault(p['areaId'], []).append(p['name'])
+        self.queries = 0
+        self.reused = 0
+        self.confirmations = 0
+        self._verdicts: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    def area_of(self, point) -> Optional[str]:
+        area_id = point.get('areaId')
+        return area_id if len(self.area_points.get(area_id) or []) > 1 else None
+
+    def sibling_names(self, area_id: str) -> List[str]:
+        return self.area_points.get(area_id, [])[:self.MAX_LISTED_POINTS]
+
+    def verdicts(self, area_id: str, creature_ids: List[str], query) -> Dict[str, Dict[str, Any]]:
+        """Return the area verdicts keyed by creature_id.
+
+        `query(owned_ids)` runs once for the creatures no sibling has asked for and returns
+        their verdicts keyed by creature_id; creatures it leaves out get an error verdict.
+        """
+        futures, owned = {}, []
+        with self._lock:
+            for creature_id in creature_ids:
+                future = self._verdicts.get((area_id, creature_id))
+                if future is None:
+                    future = self._verdicts[(area_id, creature_id)] = Future()
+                    owned.append(creature_id)
+                    self.queries += 1
+                else:
+                    self.reused += 1
+                futures[creature_id] = future
+        if owned:
+            try:
+                results = query(owned)
+            except BaseException as e:
+                for creature_id in owned:
+                    futures[creature_id].set_exception(e)
+                raise
+            for creature_id in owned:
+                result = results.get(creature_id) or {"presence": "localized", "evidence": "Missing from the area batch",
+                                                      "rarity": "Unknown", "error": True}
+                if result.get("error"):
+                    # Let the next sibling retry instead of sharing a failure
+                    with self._lock:
+                        self._verdicts.pop((area_id, creature_id), None)
+                futures[creature_id].set_result(result)
+        return {creature_id: future.result() for creature_id, future in futures.items()}
+
+    def confirmed(self):
+        with self._lock:
+            self.confirmations += 1
+
+
+class Stage1Router:
+    """Runs Stage 1 on a cheap model first and escalates only the points it is unsure about.
+
+    A point is escalated to the main model when the cheap answer is empty, fails schema
+    validation (missing fields, IDs outside the candidate list) or has too many possible
+    creatures in the ambiguous confidence band. The escalated answer replaces the cheap one.
+    """
+    AMBIGUOUS_BAND = (0.5, 0.85)
+
+    def __init__(self, cheap_model: str, strong_model: str, max_ambiguous_share: float = 0.3):
+        self.cheap_model = cheap_model
+        self.strong_model = strong_model
+        self.max_ambiguous_share = max_ambiguous_share
+        self.points = 0
+        self.escalations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _valid(item, allowed) -> bool:
+        confidence = item.get("confidence") if isinstance(item, dict) else None
+        return (isinstance(item, dict) and item.get("creature_id") in allowed
+                and isinstance(item.get("is_possible"), bool) and isinstance(item.get("rarity"), str)
+                and isinstance(confidence, (int, float)) and not isinstance(confidence, bool) and 0 <= confidence <= 1)
+
+    def review(self, items: List[Dict[str, Any]], allowed) -> Optional[str]:
+        """The reason to escalate a point's cheap Stage 1 answer, or None to keep it."""
+        reason = None
+        if not items:
+            reason = "empty"
+        elif not all(self._valid(item, allowed) for item in items):
+            reason = "invalid"
+        else:
+            low, high = self.AMBIGUOUS_BAND
+            possible = [item["confidence"] for item in items if item["is_possible"]]
+            ambiguous = sum(1 for confidence in possible if low <= confidence < high)
+            if possible and ambiguous / len(possible) > self.max_ambiguous_share:
+                reason = "ambiguous"
+        with self._lock:
+            self.points += 1
+            if reason:
+                self.escalations[reason] = self.escalations.get(reason, 0) + 1
+        return reason
+
+    def summary(self, metrics: Dict[str, Any]) -> Dict[str, Any]:
+        """Escalation rate plus the Stage 1 cost and latency saved against running every point on the main model."""
+        escalated = sum(self.escalations.values())
+        stage1 = [st for st in metrics["stages"] if st["stage"].startswith("stage1")]
+        cheap = [st for st in stage1 if st["model"] == self.cheap_model]
+        strong = [st for st in stage1 if st["model"] == self.strong_model]
+        price = GenAIMetrics.PRICES_PER_MTOK.get(self.strong_model)
+        saved_cost = 0.0
+        if price:
+            # Baseline: the cheap requests billed at main-model prices; escalations are extra spend
+            for st in cheap:
+                saved_cost += ((st["promptTokens"] - st["cachedTokens"]) * price["input"] + st["cachedTokens"] * price["cached"]
+                               + st["outputTokens"] * price["output"]) / 1e6 - st["estimatedCostUsd"]
+            saved_cost -= sum(st["estimatedCostUsd"] for st in strong)
+        p50 = lambda series: max((st["latency"]["p50"] for st in series), default=0.0)
+        cheap_calls = sum(st["calls"] for st in cheap)
+        return {
+            "points": self.points,
+            "escalated": escalated,
+            "escalationRate": round(escalated / self.points, 4) if self.points else 0.0,
+            "reasons": dict(self.escalations),
+            "latencyP50": {self.cheap_model: p50(cheap), self.strong_model: p50(strong)},
+            # Only measurable once some escalated calls have run on the main model
+            "latencySavedSeconds": round(cheap_calls * (p50(strong) - p50(cheap)) - sum(st["latency"]["sum"] for st in strong), 3) if strong else None,
+            "estimatedCostSavedUsd": round(saved_cost, 6),
+        }
+
+
+class Stage2BudgetExhausted(Exception):
+    """Raised instead of a grounded request once the Stage 2 scheduler's budget is spent."""
+
+
+class Stage2Scheduler:
+    """Spends a bounded Stage 2 budget on the uncertain creatures that matter most.
+
+    Uncertain Stage 1 results of the whole run are collected first, then verified in
+    priority order until the budget (grounded requests or seconds) runs out. The priority
+    favours confidences just below the threshold (the verdict is most likely to change),
+    popular creatures and bookmarked points. Creatures of the same point ride along in
+    one multi-creature request, best first. Every grounded request (batch, area, area
+    confirmation and per-creature fallback, retries included) is `charge`d against the
+    budget before it is sent.
+    """
+    CONFIDENCE_THRESHOLD = 0.85
+    WEIGHTS = {"confidence": 0.5, "popularity": 0.25, "bookmarks": 0.25}
+
+    def __init__(self, points: List[Dict[str, Any]], max_calls: Optional[int] = None,
+                 max_seconds: Optional[float] = None):
+        self.max_calls = max_calls
+        self.max_seconds = max_seconds
+        self._max_bookmarks = max([p.get('bookmarkCount') or 0 for p in points] + [1])
+        self._heap = []
+        self._by_point: Dict[str, List[tuple]] = {}
+        self._points: Dict[str, Dict[str, Any]] = {}
+        self._outstanding: Dict[str, int] = {}
+        self._held = set()
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.verified = 0
+        self.calls = 0
+        self._started: Optional[float] = None
+
+    @staticmethod
+    def parse_budget(text: str) -> tuple:
+        """'500' = grounded requests, '90s' / '30m' / '2h' = seconds. Returns (max_calls, max_seconds)."""
+        text = text.strip().lower()
+        units = {"s": 1, "m": 60, "h": 3600}
+        if text[-1:] in units:
+            return None, float(text[:-1]) * units[text[-1]]
+        return int(text), None
+
+    def priority(self, point, creature, res: Dict[str, Any]) -> float:
+        confidence = res.get("confidence", 0) or 0
+        closeness = max(0.0, 1 - abs(self.CONFIDENCE_THRESHOLD - confidence) / self.CONFIDENCE_THRESHOLD)
+        popularity = ((creature.get('stats') or {}).get('popularity') or 50) / 100
+        bookmarks = np.log1p(point.get('bookmarkCount') or 0) / np.log1p(self._max_bookmarks)
+        return float(self.WEIGHTS["confidence"] * closeness + self.WEIGHTS["popularity"] * popularity
+                     + self.WEIGHTS["bookmarks"] * bookmarks)
+
+    def add(self, point, key: str, res: Dict[str, Any], creature: Dict[str, Any]):
+        score = self.priority(point, creature, res)
+        with self._lock:
+            entry = (-score, self.queued, point['id'], key, res, creature)
+            heapq.heappush(self._heap, entry)
+            self._by_point.setdefault(point['id'], []).append(entry)
+            self._points[point['id']] = point
+            self._outstanding[point['id']] = self._outstanding.get(point['id'], 0) + 1
+            self.queued += 1
+
+    def outstanding(self, point_id: str) -> bool:
+        with self._lock:
+            return self._outstanding.get(point_id, 0) > 0
+
+    def hold(self, point_id: str):
+        """Remember a point whose Stage 1 finished but whose Stage 2 work is still queued."""
+        with self._lock:
+            self._held.add(point_id)
+
+    def _exhausted(self) -> bool:
+        return (self.max_calls is not None and self.calls >= self.max_calls) or \
+               (self.max_seconds is not None and self._started is not None
+                and time.monotonic() - self._started >= self.max_seconds)
+
+    def exhausted(self) -> bool:
+        with self._lock:
+            return self._exhausted()
+
+    def charge(self):
+        """Count one grounded request; raises Stage2BudgetExhausted instead when none are left."""
+        with self._lock:
+            if self._exhausted():
+                raise Stage2BudgetExhausted(f"Stage 2 budget exhausted after {self.calls} grounded requests")
+            self.calls += 1
+
+    def _next_batch(self, size: int) -> Optional[tuple]:
+        while self._heap:
+            best = heapq.heappop(self._heap)
+            entries = self._by_point.get(best[2])
+            if not entries or best not in entries:
+                continue
+            entries.sort()
+            batch, self._by_point[best[2]] = entries[:size], entries[size:]
+            return self._points[best[2]], batch
+        return None
+
+    def run(self, verify, store, batch_size, concurrency: int = 1) -> List[str]:
+        """Verify queued creatures best first and `store` their mappings, in priority order.
+
+        `verify(point, creatures)` returns verdicts keyed by creature_id and leaves out the
+        creatures it could not verify within the budget; `store(...)` returns False to stop
+        (e.g. --limit reached). Returns the held points whose queued creatures have all been stored.
+        """
+        self._started = time.monotonic()
+        logger.info(f"🎯 Stage 2 scheduler: {self.queued} uncertain creatures queued "
+                    f"(budget: {self.max_calls or '-'} requests, {self.max_seconds or '-'} s).")
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="stage2") as executor:
+            running = True
+            while running and not self.exhausted():
+                batches = []
+                for _ in range(max(1, concurrency)):
+                    size = batch_size()
+                    if self.max_calls is not None:
+                        # Never queue more requests than the budget has left
+                        with self._lock:
+                            if len(batches) >= self.max_calls - self.calls:
+                                break
+                    batch = self._next_batch(size)
+                    if batch is None: break
+                    batches.append(batch)
+                if not batches: break
+                results = executor.map(lambda b: verify(b[0], [e[5] for e in b[1]]), batches)
+                for (point, entries), verdicts in zip(batches, results):
+                    for _, _, point_id, key, res, creature in entries:
+                        verdict = verdicts.get(creature['id'])
+                        if verdict is None:
+                            # Budget ran out before this creature was verified
+                            continue
+                        if not running or not store(point, key, res, creature, verdict):
+                            running = False
+                            break
+                        self.verified += 1
+                        with self._lock:
+                            self._outstanding[point_id] -= 1
+
+        remaining = self.queued - self.verified
+        if remaining:
+            logger.info(f"🎯 Stage 2 budget exhausted: {self.verified} verified, {remaining} left for a later run.")
+        with self._lock:
+            return [point_id for point_id in self._held if self._outstanding.get(point_id, 0) == 0]
+
+
+class PointPrioritizer:
+    """Orders the points of a run so that `--limit` fills the most visible gaps first.
+
+    Points score higher the staler their mappings (latest `point_creatures.updatedAt`; never
+    processed counts as maximally stale), the more they are bookmarked and the fewer
+    approved mappings they have.
+    """
+    WEIGHTS = {"staleness": 0.5, "popularity": 0.25, "gap": 0.25}
+    STALE_DAYS_CAP = 365
+
+    def __init__(self, stats: Dict[str, Dict[str, Any]], now: Optional[datetime] = None):
+        """`stats`: per point ID, {"latest": datetime or None, "approved": int}."""
+        self.stats = stats
+        self.now = now or datetime.now(timezone.utc)
+
+    def score(self, point, max_bookmarks: int) -> float:
+        stats = self.stats.get(point['id']) or {}
+        latest = stats.get("latest")
+        days = (self.now - latest).total_seconds() / 86400 if latest else self.STALE_DAYS_CAP
+        staleness = min(max(days, 0), self.STALE_DAYS_CAP) / self.STALE_DAYS_CAP
+        popularity = np.log1p(point.get('bookmarkCount') or 0) / np.log1p(max_bookmarks)
+        gap = 1 / (1 + stats.get("approved", 0))
+        return float(self.WEIGHTS["staleness"] * staleness + self.WEIGHTS["popularity"] * popularity
+                     + self.WEIGHTS["gap"] * gap)
+
+    def order(self, points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        max_bookmarks = max([p.get('bookmarkCount') or 0 for p in points] + [1])
+        # Stable sort: ties keep the query order
+        return sorted(points, key=lambda p: -self.score(p, max_bookmarks))
+
+
+class Stage1Stream:
+    """Stage 1 results of one point that can be consumed while the request is still running.
+
+    `run()` performs the request on the calling thread and feeds the results; `start()` runs it
+    on a reader thread instead. Iterating yields results as they arrive and re-raises an
+    error of the request once the results received before it are consumed.
+    """
+    def __init__(self, produce):
+        self._produce = produce
+        self._items = queue.Queue()
+        self._end = object()
+        self._error = None
+
+    def run(self):
+        try:
+            self._produce(self._items.put)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._items.put(self._end)
+
+    def cancel(self):
+        """End the stream without running the request."""
+        self._items.put(self._end)
+
+    def start(self, name: str) -> "Stage1Stream":
+        threading.Thread(target=self.run, name=name, daemon=True).start()
+        return self
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        while True:
+            item = self._items.get()
+            if item is self._end:
+                break
+            yield item
+        if self._error is not None:
+            raise self._error
+
+
+class PipelineQueue:
+    """Bounded hand-off queue between pipeline stages that records depth and backpressure.
+
+    `put` blocks while the queue is full, so a slow consumer throttles its producers; the
+    time producers spent blocked and the depth seen at every hand-off are kept for tuning.
+    """
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.capacity = maxsize
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self.max_depth = 0
+        self._depth_sum = 0
+        self._samples = 0
+        self.blocked_seconds = 0.0
+
+    def _sample(self, blocked: float = 0.0):
+        depth = self._queue.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_sum += depth
+            self._samples += 1
+            self.blocked_seconds += blocked
+
+    def put(self, item):
+        started = time.monotonic()
+        self._queue.put(item)
+        self._sample(time.monotonic() - started)
+
+    def get(self):
+        item = self._queue.get()
+        self._sample()
+        return item
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "maxDepth": self.max_depth,
+                "avgDepth": round(self._depth_sum / self._samples, 2) if self._samples else 0.0,
+                "blockedSeconds": round(self.blocked_seconds, 3),
+            }
+
+
+class ProgressJournal(ABC):
+    """Durable record of the points a run has fully processed, so an interrupted run can resume.
+
+    A run is bound to its mode and filters: reusing its run ID with different ones is refused.
+    """
+    def __init__(self):
+        self.run_id = None
+
+    @staticmethod
+    def fingerprint(mode: str, filters: Dict[str, Any]) -> str:
+        return hashlib.sha1(json.dumps({"mode": mode, "filters": filters}, sort_keys=True).encode()).hexdigest()[:12]
+
+    def open(self, run_id: str, mode: str, filters: Dict[str, Any], resume: bool) -> set:
+        """Start (or resume) a run and return the IDs of points already completed.
+
+        An existing journal under the same run ID (e.g. a retried Cloud Run task) is continued
+        only if it has the same mode and filters; its completed points mean nothing otherwise.
+        """
+        self.run_id = run_id
+        fingerprint = self.fingerprint(mode, filters)
+        meta, completed = self._load()
+        if meta is None:
+            if resume:
+                raise ValueError(f"No progress journal found for run '{run_id}'.")
+            self._save_meta({"mode": mode, "filters": filters, "fingerprint": fingerprint})
+        elif meta.get("fingerprint") != fingerprint:
+            hint = "" if resume else " Use a different --run-id."
+            raise ValueError(f"Run '{run_id}' was started with different mode/filters: {meta.get('mode')} {meta.get('filters')}.{hint}")
+        return completed
+
+    @abstractmethod
+    def mark_completed(self, point_ids: List[str]):
+        ...
+
+    @abstractmethod
+    def _load(self):
+        ...
+
+    @abstractmethod
+    def _save_meta(self, meta: Dict[str, Any]):
+        ...
+
+
+class FirestoreProgressJournal(ProgressJournal):
+    """One empty document per completed point under `cleansing_runs/{runId}/completed`."""
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+
+    @property
+    def run_ref(self):
+        return self.db.collection('cleansing_runs').document(self.run_id)
+
+    def _load(self):
+        doc = self.run_ref.get()
+        meta = (doc.to_dict() or {}).get('journal') if doc.exists else None
+        completed = {d.id for d in self.run_ref.collection('completed').select([]).stream()} if meta else set()
+        return meta, completed
+
+    def _save_meta(self, meta):
+        self.run_ref.set({"journal": meta, "startedAt": firestore.SERVER_TIMESTAMP}, merge=True)
+
+    def mark_completed(self, point_ids):
+        for i in range(0, len(point_ids), 500):
+            batch = self.db.batch()
+            for point_id in point_ids[i:i + 500]:
+                batch.set(self.run_ref.collection('completed').document(point_id), {"at": firestore.SERVER_TIMESTAMP})
+            batch.commit()
+
+
+class LocalProgressJournal(ProgressJournal):
+    """JSON-lines file fallback: a meta line followed by one line per completed point."""
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"journal_{self.run_id}.jsonl")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return None, set()
+        meta, completed = None, set()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "meta" in record:
+                    meta = record["meta"]
+                else:
+                    completed.add(record["pointId"])
+        return meta, completed
+
+    def _append(self, records):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _save_meta(self, meta):
+        self._append([{"meta": meta}])
+
+    def mark_completed(self, point_ids):
+        self._append([{"pointId": point_id} for point_id in point_ids])
+
+
+class DeltaState(ABC):
+    """Fingerprints of the points and creatures a scope was last cleansed against (delta cleansing).
+
+    A point whose fingerprint changed (or is new) is re-judged against the whole catalog; the
+    other points only against creatures that are new or changed since the watermark. Point
+    fingerprints advance as points are committed, creature fingerprints and the watermark
+    only when a run has completed every point in scope.
+    """
+    # Everything that changes a point's Stage 1 prompt or its pre-filter candidates
+    POINT_FIELDS = ['name', 'maxDepth', 'topography', 'waterTemp', 'waterTempRange', 'areaId', 'zoneId', 'regionId']
+    CREATURE_FIELDS = ['name', 'description', 'depthRange', 'waterTempRange', 'areas', 'regions', 'tags',
+                       'specialAttributes']
+
+    def __init__(self):
+        self.scope = None
+        self.watermark: Optional[Dict[str, Any]] = None
+        self.points: Dict[str, str] = {}
+        self.creatures: Dict[str, str] = {}
+
+    @staticmethod
+    def scope_key(filters: Dict[str, Any], shard_index: int = 0, shard_count: int = 1) -> str:
+        scope = {"filters": filters, "shard": [shard_index, shard_count]}
+        return hashlib.sha1(json.dumps(scope, sort_keys=True).encode()).hexdigest()[:12]
+
+    @staticmethod
+    def fingerprint(doc: Dict[str, Any], fields: List[str]) -> str:
+        values = {field: doc.get(field) for field in fields}
+        return hashlib.sha1(json.dumps(values, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()[:16]
+
+    def open(self, scope: str):
+        self.scope = scope
+        self.watermark, self.points, self.creatures = self._load()
+
+    def save_points(self, fingerprints: Dict[str, str]):
+        if fingerprints:
+            self._write("points", fingerprints)
+            self.points.update(fingerprints)
+
+    def save_creatures(self, fingerprints: Dict[str, str], watermark: Dict[str, Any]):
+        changed = {cid: fp for cid, fp in fingerprints.items() if self.creatures.get(cid) != fp}
+        if changed:
+            self._write("creatures", changed)
+            self.creatures.update(changed)
+        self._save_watermark(watermark)
+        self.watermark = watermark
+
+    @abstractmethod
+    def _load(self):
+        ...
+
+    @abstractmethod
+    def _write(self, kind: str, fingerprints: Dict[str, str]):
+        ...
+
+    @abstractmethod
+    def _save_watermark(self, watermark: Dict[str, Any]):
+        ...
+
+
+class FirestoreDeltaState(DeltaState):
+    """`cleansing_delta/{scope}` holds the watermark; `points` / `creatures` sub-collections hold one fingerprint each."""
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+
+    @property
+    def scope_ref(self):
+        return self.db.collection('cleansing_delta').document(self.scope)
+
+    def _load(self):
+        doc = self.scope_ref.get()
+        watermark = (doc.to_dict() or {}).get('watermark') if doc.exists else None
+        fingerprints = {}
+        for kind in ("points", "creatures"):
+            fingerprints[kind] = {d.id: d.get('fp') for d in self.scope_ref.collection(kind).select(['fp']).stream()}
+        return watermark, fingerprints["points"], fingerprints["creatures"]
+
+    def _write(self, kind, fingerprints):
+        items = list(fingerprints.items())
+        for i in range(0, len(items), 500):
+            batch = self.db.batch()
+            for doc_id, fp in items[i:i + 500]:
+                batch.set(self.scope_ref.collection(kind).document(doc_id), {"fp": fp})
+            batch.commit()
+
+    def _save_watermark(self, watermark):
+        self.scope_ref.set({"watermark": watermark, "updatedAt": firestore.SERVER_TIMESTAMP}, merge=True)
+
+
+class LocalDeltaState(DeltaState):
+    """JSON file fallback: `delta_{scope}.json` with the watermark and both fingerprint maps."""
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"delta_{self.scope}.json")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return None, {}, {}
+        with open(self.path, encoding="utf-8") as f:
+            state = json.load(f)
+        return state.get("watermark"), state.get("points", {}), state.get("creatures", {})
+
+    def _dump(self, watermark, points, creatures):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"watermark": watermark, "points": points, "creatures": creatures}, f)
+        os.replace(tmp, self.path)
+
+    def _write(self, kind, fingerprints):
+        points = self.points | fingerprints if kind == "points" else self.points
+        creatures = self.creatures | fingerprints if kind == "creatures" else self.creatures
+        self._dump(self.watermark, points, creatures)
+
+    def _save_watermark(self, watermark):
+        self._dump(watermark, self.points, self.creatures)
+
+
+class WorkQueue(ABC):
+    """Points in scope as leased work items, so any number of workers can share one run (elastic mode).
+
+    Workers claim a few pending items at a time under a lease, renew the leases from a
+    heartbeat thread while they work and mark items done once their mappings are committed.
+    Items whose lease expired (dead or stalled worker) are claimed again by the others; an item
+    already claimed MAX_ATTEMPTS times is parked as failed instead of taking more workers down.
+    """
+    MAX_ATTEMPTS = 3
+    PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+    def __init__(self, lease_seconds: float = 600, worker_id: Optional[str] = None):
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.queue_id = None
+        self.held: set = set()
+        self.claimed = 0
+        self.completed = 0
+        self.released = 0
+        self.lost = 0
+        self._lock = threading.Lock()
+
+    def open(self, queue_id: str, fingerprint: str, point_ids: List[str]) -> int:
+        """Join queue `queue_id`; the first worker enqueues `point_ids` (in claim order). Returns the items added."""
+        self.queue_id = queue_id
+        return self._open(fingerprint, point_ids)
+
+    def claim(self, count: int) -> List[str]:
+        """Lease up to `count` pending (or expired) items to this worker."""
+        ids = self._claim(count, datetime.now(timezone.utc))
+        with self._lock:
+            self.held.update(ids)
+            self.claimed += len(ids)
+        return ids
+
+    def renew(self):
+        """Extend the leases of every held item; items another worker took over are dropped."""
+        with self._lock:
+            held = list(self.held)
+        if not held:
+            return
+        lost = self._renew(held, datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds))
+        if lost:
+            logger.warning(f"⚠️ Lost the lease on {len(lost)} work items (taken over after expiry): {sorted(lost)[:5]}")
+            with self._lock:
+                self.held.difference_update(lost)
+                self.lost += len(lost)
+
+    def complete(self, point_ids: List[str]):
+        self._complete(point_ids)
+        with self._lock:
+            self.held.difference_update(point_ids)
+            self.completed += len(point_ids)
+
+    def release(self, point_ids: List[str], attempted: bool = True):
+        """Hand unfinished items back. Items that were never started do not count as an attempt."""
+        point_ids = [pid for pid in point_ids if pid in self.held]
+        if not point_ids:
+            return
+        self._release(point_ids, attempted)
+        with self._lock:
+            self.held.difference_update(point_ids)
+            self.released += len(point_ids)
+
+    def unfinished(self, include_failed: bool = False) -> bool:
+        """True while any item is pending or leased (or failed, with `include_failed`)."""
+        statuses = [self.PENDING, self.LEASED] + ([self.FAILED] if include_failed else [])
+        return self._exists(statuses)
+
+    @contextmanager
+    def heartbeat(self):
+        """Renew the held leases every third of the lease time until the block exits."""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.renew()
+                except Exception as e:
+                    logger.warning(f"⚠️ Lease heartbeat failed: {e}")
+
+        thread = threading.Thread(target=beat, name="work-queue-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"claimed": self.claimed, "completed": self.completed, "released": self.released, "lost": self.lost}
+
+    @abstractmethod
+    def _open(self, fingerprint: str, point_ids: List[str]) -> int:
+        ...
+
+    @abstractmethod
+    def _claim(self, count: int, now: datetime) -> List[str]:
+        ...
+
+    @abstractmethod
+    def _renew(self, point_ids: List[str], expires_at: datetime) -> set:
+        ...
+
+    @abstractmethod
+    def _complete(self, point_ids: List[str]):
+        ...
+
+    @abstractmethod
+    def _release(self, point_ids: List[str], attempted: bool):
+        ...
+
+    @abstractmethod
+    def _exists(self, statuses: List[str]) -> bool:
+        ...
+
+
+class FirestoreWorkQueue(WorkQueue):
+    """`cleansing_queues/{queueId}` (meta) with one document per point under `items`.
+
+    Claims and lease renewals are conditional updates (`last_update_time` preconditions):
+    when two workers race for the same item, exactly one update succeeds and the other
+    moves on to the next candidate. The claim queries use the (status, rank) and
+    (status, leaseExpiresAt) indexes of firestore.indexes.json. There is deliberately no
+    local fallback: workers on other hosts could not see it.
+    """
+    # Candidates read per claimed item; claims are spread over them to reduce contention
+    CLAIM_SPREAD = 3
+    POLL_SECONDS = 2.0
+
+    def __init__(self, db, lease_seconds: float = 600, worker_id: Optional[str] = None):
+        super().__init__(lease_seconds, worker_id)
+        self.db = db
+
+    @property
+    def queue_ref(self):
+        return self.db.collection('cleansing_queues').document(self.queue_id)
+
+    @property
+    def items(self):
+        return self.queue_ref.collection('items')
+
+    def _open(self, fingerprint, point_ids):
+        try:
+            self.queue_ref.create({"fingerprint": fingerprint, "ready": False, "total": len(point_ids),
+                                   "createdBy": self.worker_id, "createdAt": firestore.SERVER_TIMESTAMP})
+        except gapi_exceptions.AlreadyExists:
+            # Another worker enqueues; wait for it (and take over if it died half-way)
+            deadline = time.monotonic() + self.lease_seconds
+            while True:
+                meta = self.queue_ref.get().to_dict() or {}
+                if meta.get("fingerprint") != fingerprint:
+                    raise ValueError(f"Work queue '{self.queue_id}' was created for different mode/filters.")
+                if meta.get("ready"):
+                    return 0
+                if time.monotonic() >= deadline:
+                    logger.warning(f"⚠️ Work queue '{self.queue_id}' was never marked ready by "
+                                   f"{meta.get('createdBy')}. Finishing the enqueue.")
+                    break
+                time.sleep(self.POLL_SECONDS)
+
+        existing = {d.id for d in self.items.select([]).stream()}
+        missing = [(rank, pid) for rank, pid in enumerate(point_ids) if pid not in existing]
+        for i in range(0, len(missing), 500):
+            batch = self.db.batch()
+            for rank, point_id in missing[i:i + 500]:
+                batch.set(self.items.document(point_id), {"status": self.PENDING, "rank": rank, "attempts": 0})
+            batch.commit()
+        self.queue_ref.update({"ready": True, "updatedAt": firestore.SERVER_TIMESTAMP})
+        return len(missing)
+
+    def _conditional_update(self, snapshot, data) -> bool:
+        try:
+            snapshot.reference.update(data, option=self.db.write_option(last_update_time=snapshot.update_time))
+            return True
+        except (gapi_exceptions.FailedPrecondition, gapi_exceptions.Conflict, gapi_exceptions.NotFound):
+            return False
+
+    def _claim(self, count, now):
+        limit = count * self.CLAIM_SPREAD
+        candidates = list(self.items.where('status', '==', self.PENDING).order_by('rank').limit(limit).stream())
+        if len(candidates) < limit:
+            candidates += list(self.items.where('status', '==', self.LEASED)
+                               .where('leaseExpiresAt', '<', now).limit(limit).stream())
+        random.shuffle(candidates)
+        claimed = []
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        for snapshot in candidates:
+            if len(claimed) >= count:
+                break
+            item = snapshot.to_dict()
+            if item.get('attempts', 0) >= self.MAX_ATTEMPTS:
+                if self._conditional_update(snapshot, {"status": self.FAILED, "updatedAt": firestore.SERVER_TIMESTAMP}):
+                    logger.warning(f"⚠️ Work item {snapshot.id} failed {item['attempts']} times; parked as failed.")
+                continue
+            if self._conditional_update(snapshot, {
+                "status": self.LEASED, "owner": self.worker_id, "leaseExpiresAt": expires_at,
+                "attempts": firestore.Increment(1), "updatedAt": firestore.SERVER_TIMESTAMP,
+            }):
+                claimed.append((item.get('rank', 0), snapshot.id))
+        return [point_id for _, point_id in sorted(claimed)]
+
+    def _owned(self, point_ids):
+        refs = [self.items.document(pid) for pid in point_ids]
+        owned, lost = [], set()
+        for snapshot in self.db.get_all(refs):
+            if snapshot.exists and snapshot.get('status') == self.LEASED and snapshot.get('owner') == self.worker_id:
+                owned.append(snapshot)
+            else:
+                lost.add(snapshot.id)
+        return owned, lost
+
+    def _renew(self, point_ids, expires_at):
+        owned, lost = self._owned(point_ids)
+        for snapshot in owned:
+            if not self._conditional_update(snapshot, {"leaseExpiresAt": expires_at}):
+                lost.add(snapshot.id)
+        return lost
+
+    def _complete(self, point_ids):
+        for i in range(0, len(point_ids), 500):
+            batch = self.db.batch()
+            for point_id in point_ids[i:i + 500]:
+                batch.update(self.items.document(point_id), {
+                    "status": self.DONE, "leaseExpiresAt": firestore.DELETE_FIELD,
+                    "updatedAt": firestore.SERVER_TIMESTAMP,
+                })
+            batch.commit()
+
+    def _release(self, point_ids, attempted):
+        owned, _ = self._owned(point_ids)
+        for snapshot in owned:
+            data = {"status": self.PENDING, "owner": firestore.DELETE_FIELD, "leaseExpiresAt": firestore.DELETE_FIELD,
+                    "updatedAt": firestore.SERVER_TIMESTAMP}
+            if not attempted:
+                data["attempts"] = firestore.Increment(-1)
+            self._conditional_update(snapshot, data)
+
+    def _exists(self, statuses):
+        return any(True for _ in self.items.where('status', 'in', statuses).select([]).limit(1).stream())
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """Local stand-in: workers on the same host share a SQLite file (claims run in IMMEDIATE transactions)."""
+    def __init__(self, path: str, lease_seconds: float = 600, worker_id: Optional[str] = None):
+        super().__init__(lease_seconds, worker_id)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS work_queues (queue_id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS work_items (queue_id TEXT NOT NULL, point_id TEXT NOT NULL, "
+                "rank INTEGER NOT NULL, status TEXT NOT NULL, owner TEXT, lease_expires REAL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (queue_id, point_id))"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        # One connection per operation: the heartbeat thread and other processes write concurrently
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _marks(values) -> str:
+        return ",".join("?" * len(values))
+
+    def _open(self, fingerprint, point_ids):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT fingerprint FROM work_queues WHERE queue_id = ?", (self.queue_id,)).fetchone()
+            if row and row[0] != fingerprint:
+                raise ValueError(f"Work queue '{self.queue_id}' was created for different mode/filters.")
+            if row:
+                return 0
+            conn.execute("INSERT INTO work_queues (queue_id, fingerprint) VALUES (?, ?)", (self.queue_id, fingerprint))
+            conn.executemany(
+                "INSERT OR IGNORE INTO work_items (queue_id, point_id, rank, status) VALUES (?, ?, ?, ?)",
+                [(self.queue_id, pid, rank, self.PENDING) for rank, pid in enumerate(point_ids)]
+            )
+        return len(point_ids)
+
+    def _claim(self, count, now):
+        now_ts = now.timestamp()
+        claimable = "queue_id = ? AND (status = ? OR (status = ? AND lease_expires < ?))"
+        args = (self.queue_id, self.PENDING, self.LEASED, now_ts)
+        with self._transaction() as conn:
+            parked = conn.execute(f"UPDATE work_items SET status = ? WHERE {claimable} AND attempts >= ?",
+                                  (self.FAILED, *args, self.MAX_ATTEMPTS)).rowcount
+            ids = [row[0] for row in conn.execute(
+                f"SELECT point_id FROM work_items WHERE {claimable} ORDER BY rank LIMIT ?", (*args, count))]
+            if ids:
+                conn.execute(
+                    f"UPDATE work_items SET status = ?, owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                    f"WHERE queue_id = ? AND point_id IN ({self._marks(ids)})",
+                    (self.LEASED, self.worker_id, now_ts + self.lease_seconds, self.queue_id, *ids)
+                )
+        if parked:
+            logger.warning(f"⚠️ {parked} work items failed {self.MAX_ATTEMPTS} times; parked as failed.")
+        return ids
+
+    def _renew(self, point_ids, expires_at):
+        owned_by_me = f"queue_id = ? AND owner = ? AND status = ? AND point_id IN ({self._marks(point_ids)})"
+        args = (self.queue_id, self.worker_id, self.LEASED, *point_ids)
+        with self._transaction() as conn:
+            conn.execute(f"UPDATE work_items SET lease_expires = ? WHERE {owned_by_me}", (expires_at.timestamp(), *args))
+            owned = {row[0] for row in conn.execute(f"SELECT point_id FROM work_items WHERE {owned_by_me}", args)}
+        return set(point_ids) - owned
+
+    def _complete(self, point_ids):
+        with self._transaction() as conn:
+            conn.execute(
+                f"UPDATE work_items SET status = ?, lease_expires = NULL "
+                f"WHERE queue_id = ? AND point_id IN ({self._marks(point_ids)})",
+                (self.DONE, self.queue_id, *point_ids)
+            )
+
+    def _release(self, point_ids, attempted):
+        with self._transaction() as conn:
+            conn.execute(
+                f"UPDATE work_items SET status = ?, owner = NULL, lease_expires = NULL, attempts = attempts - ? "
+                f"WHERE queue_id = ? AND owner = ? AND status = ? AND point_id IN ({self._marks(point_ids)})",
+                (self.PENDING, 0 if attempted else 1, self.queue_id, self.worker_id, self.LEASED, *point_ids)
+            )
+
+    def _exists(self, statuses):
+        with self._transaction() as conn:
+            return conn.execute(
+                f"SELECT 1 FROM work_items WHERE queue_id = ? AND status IN ({self._marks(statuses)}) LIMIT 1",
+                (self.queue_id, *statuses)
+            ).fetchone() is not None
+
+
+class HabitatPreFilter:
+    """Deterministic, vectorized pre-filter that drops creatures which cannot live at a point.
+
+    Every creature gets a score in [0, 1] per point (product of depth, water temperature,
+    hierarchy and topography factors). Missing data is always neutral (factor 1.0), so
+    the filter only removes creatures whose own attributes rule them out.
+    """
+    DEPTH_MARGIN = 10.0     # m beyond the point's maxDepth that still scores > 0
+    TEMP_MARGIN = 4.0       # °C outside the creature's range that still scores > 0
+    HIERARCHY_MISS = 0.3    # creature has area/region data, but none covers the point
+    TOPOGRAPHY_MISS = 0.7   # creature mentions habitats, but none of the point's topography
+    TOPOGRAPHY_KEYWORDS = {
+        "sand": ["砂", "sand"],
+        "rock": ["岩", "rock", "reef", "礁"],
+        "dropoff": ["ドロップオフ", "drop", "壁", "崖"],
+        "cave": ["洞窟", "洞穴", "cave", "アーチ"],
+        "muck": ["泥", "muck", "マクロ"],
+        "coral": ["サンゴ", "珊瑚", "coral"],
+        "seagrass": ["海草", "藻場", "seagrass"],
+    }
+
+    def __init__(self, creatures: List[Dict[str, Any]], min_score: float = 0.35):
+        self.min_score = min_score
+        self.ids = np.array([c['id'] for c in creatures], dtype=object)
+
+        def _range(c, field):
+            r = c.get(field)
+            lo, hi = (r.get('min'), r.get('max')) if isinstance(r, dict) else (None, None)
+            return (float(lo) if isinstance(lo, (int, float)) else np.nan,
+                    float(hi) if isinstance(hi, (int, float)) else np.nan)
+
+        self.depth_min = np.array([_range(c, 'depthRange')[0] for c in creatures], dtype=float)
+        temps = np.array([_range(c, 'waterTempRange') for c in creatures], dtype=float).reshape(-1, 2)
+        self.temp_min, self.temp_max = temps[:, 0], temps[:, 1]
+
+        # Hierarchy membership: name/ID -> boolean mask over creatures
+        self.has_hierarchy = np.zeros(len(creatures), dtype=bool)
+        self.membership: Dict[str, np.ndarray] = {}
+        for i, c in enumerate(creatures):
+            for place in (c.get('areas') or []) + (c.get('regions') or []):
+                mask = self.membership.setdefault(place, np.zeros(len(creatures), dtype=bool))
+                mask[i] = True
+                self.has_hierarchy[i] = True
+
+        # Topography hints found in the creature's own text
+        self.topo_keys = list(self.TOPOGRAPHY_KEYWORDS)
+        self.topography = np.zeros((len(creatures), len(self.topo_keys)), dtype=bool)
+        for i, c in enumerate(creatures):
+            text = " ".join([c.get('description', '')] + (c.get('tags') or []) + (c.get('specialAttributes') or [])).lower()
+            for j, key in enumerate(self.topo_keys):
+                self.topography[i, j] = any(word.lower() in text for word in self.TOPOGRAPHY_KEYWORDS[key])
+
+    def score(self, point: Dict[str, Any]) -> np.ndarray:
+        scores = np.ones(len(self.ids))
+
+        max_depth = point.get('maxDepth')
+        if isinstance(max_depth, (int, float)):
+            gap = np.nan_to_num(self.depth_min - max_depth, nan=0.0)
+            scores *= np.clip(1.0 - np.maximum(gap, 0.0) / self.DEPTH_MARGIN, 0.0, 1.0)
+
+        # Scalar or free-text temperatures (e.g. "24") carry no range: no temperature term then
+        water = next((w for w in (point.get('waterTemp'), point.get('waterTempRange')) if isinstance(w, dict)), {})
+        if isinstance(water.get('min'), (int, float)) and isinstance(water.get('max'), (int, float)):
+            gap = np.maximum(np.nan_to_num(self.temp_min - water['max'], nan=0.0),
+                             np.nan_to_num(water['min'] - self.temp_max, nan=0.0))
+            scores *= np.clip(1.0 - np.maximum(gap, 0.0) / self.TEMP_MARGIN, 0.0, 1.0)
+
+        covered = np.zeros(len(self.ids), dtype=bool)
+        for place in (point.get('area'), point.get('areaId'), point.get('zone'), point.get('zoneId'),
+                      point.get('region'), point.get('regionId')):
+            if place in self.membership:
+                covered |= self.membership[place]
+        scores *= np.where(self.has_hierarchy & ~covered, self.HIERARCHY_MISS, 1.0)
+
+        point_topo = np.array([key in (point.get('topography') or []) for key in self.topo_keys])
+        if point_topo.any():
+            matches = (self.topography & point_topo).any(axis=1)
+            scores *= np.where(self.topography.any(axis=1) & ~matches, self.TOPOGRAPHY_MISS, 1.0)
+
+        return scores
+
+    def candidates(self, point: Dict[str, Any]) -> List[str]:
+        return list(self.ids[self.score(point) >= self.min_score])
+
+
+class CleansingPipeline:
+    # Vertex AI refuses caches below a minimum size, and small contexts are cheaper inline anyway.
+    MIN_CACHE_TOKENS = 4096
+    # A cache about to expire is not worth reusing; a new one would be created mid-run anyway.
+    CACHE_MIN_REMAINING_SECONDS = 600
+
+    # Fields read by load_data: everything the prompts and the habitat pre-filter use, nothing else.
+    CREATURE_FIELDS = ['name', 'description', 'depthRange', 'waterTempRange', 'areas', 'regions',
+                       'tags', 'specialAttributes', 'stats']
+    POINT_FIELDS = ['name', 'maxDepth', 'topography', 'region', 'zone', 'area', 'regionId', 'zoneId', 'areaId',
+                    'waterTemp', 'waterTempRange', 'bookmarkCount']
+    LOAD_PAGE_SIZE = 1000
+    # Multi-point Stage 1 sizing: expected output per point vs. the 8192-token output cap
+    STAGE1_OUTPUT_BUDGET = 6000
+    STAGE1_TOKENS_PER_RESULT = 120
+    STAGE1_TOKENS_PER_POINT = 20
+    STAGE1_EXPECTED_RESULTS = 20
+    # Catalog sharding: never send fewer creatures than this per Stage 1 request
+    STAGE1_MIN_SHARD = 20
+    # Multi-creature Stage 2 sizing: verdict size per creature vs. the 4096-token output cap
+    STAGE2_OUTPUT_BUDGET = 3500
+    STAGE2_TOKENS_PER_ITEM = 250
+
+    def __init__(self, client=None, db=None):
+        """`client` / `db` replace the Vertex AI and Firestore clients (e.g. ReplayClient / MemoryFirestore)."""
         self.model_name = "gemini-2.0-flash-001"
         # Use us-central1 as default for AI if not specified,
         # as gemini-2.0-flash and caching are more likely to be available there.
         self.ai_location = os.environ.get("AI_LOCATION") or "us-central1"
         self.project_id = PROJECT_ID
 
-        logger.info(f"🤖 Initializing GenAI Client (AI_LOCATION={self.ai_location})")
-        self.client = genai.Client(
-            vertexai=True,
-            project=self.project_id,
-            location=self.ai_location
-        )
-        self.cache = None
+        if client is None:
+            logger.info(f"🤖 Initializing GenAI Client (AI_LOCATION={self.ai_location})")
+            client = genai.Client(
+                vertexai=True,
+                project=self.project_id,
+                location=self.ai_location
+            )
+        self.client = client
+        # Context caches are bound to a model: one per model used for Stage 1
+        self.caches: Dict[str, Any] = {}
+        self.stage1_router = None
+        self.cache_ttl = 3 * 3600
+        self.delete_cache = False
+        self._cache_lock = threading.Lock()
+        self.prefilter = None
+        self.grounding_cache = None
+        self.area_planner = None
+        self.stage2_scheduler = None
+        self.pipeline_stats = None
+        self.journal = None
+        self.delta_state = None
+        self._delta = None
+        self.work_queue = None
+        self.stage1_executor = None
+        self.limiter = None
+        self.retry_policy = RetryPolicy()
+        self._stage1_hit_ratio = 0.5
+        self.stage2_batch_size = 1
+        self._stage2_tokens_per_item = float(self.STAGE2_TOKENS_PER_ITEM)
+        self.metrics = GenAIMetrics()
 
         # Initialize Firestore
-        if not firebase_admin._apps:
-            firebase_admin.initialize_app(options={'projectId': PROJECT_ID})
-        self.db = firestore.client()
+        if db is None:
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app(options={'projectId': PROJECT_ID})
+            db = firestore.client()
+        self.db = db
+
+    def _paged_stream(self, query, fields: List[str]):
+        """Stream a projected query page by page (cursor on document ID) to bound memory and RPC size."""
+        query = query.select(fields).order_by('__name__').limit(self.LOAD_PAGE_SIZE)
+        last = None
+        while True:
+            page = list((query.start_after(last) if last else query).stream())
+            yield from page
+            if len(page) < self.LOAD_PAGE_SIZE:
+                return
+            last = page[-1]
 
     def load_data(self, filters: Dict[str, Any]):
         """Fetch points and creatures from Firestore based on hierarchy-aware filters."""
         logger.info("📡 Fetching data from Firestore...")
 
-        # 1. Load Creatures (All for context cache)
-        creatures_ref = self.db.collection('creatures')
-        self.creatures = [doc.to_dict() | {"id": doc.id} for doc in creatures_ref.stream()]
-
-        # 2. Load hierarchy-aware Master data if needed (small collections)
-        areas_dict = {doc.id: doc.to_dict() for doc in self.db.collection('areas').stream()}
-        zones_dict = {doc.id: doc.to_dict() for doc in self.db.collection('zones').stream()}
+        # 1. Load Creatures (All for context cache), only the fields the prompts and pre-filter use
+        started = time.monotonic()
+        self.creatures = [doc.to_dict() | {"id": doc.id}
+                          for doc in self._paged_stream(self.db.collection('creatures'), self.CREATURE_FIELDS)]
+        logger.info(f"  📥 creatures: {len(self.creatures)} docs in {time.monotonic() - started:.2f}s")
 
-        # 3. Load Points: Use Firestore queries for better performance
+        # 2. Load Points: Use Firestore queries for better performance
+        started = time.monotonic()
         points_ref = self.db.collection('points')
         if filters.get('pointId'):
-            # 3.1 Specific point: direct access
-            doc = points_ref.document(filters['pointId']).get()
+            # 2.1 Specific point: direct access
+            doc = points_ref.document(filters['pointId']).get(field_paths=self.POINT_FIELDS)
             self.points = [doc.to_dict() | {"id": doc.id}] if doc.exists else []
         else:
-            # 3.2 Hierarchical query (Optimized)
+            # 2.2 Hierarchical query (Optimized). Filters use the denormalized IDs on points,
+            # so the areas / zones collections are not needed.
             query = points_ref
             if filters.get('area'):
                 query = query.where('areaId', '==', filters['area'])
@@ -69,46 +1563,107 @@ class CleansingPipeline:
             if filters.get('region'):
                 query = query.where('regionId', '==', filters['region'])
 
-            self.points = [doc.to_dict() | {"id": doc.id} for doc in query.stream()]
+            self.points = [doc.to_dict() | {"id": doc.id} for doc in self._paged_stream(query, self.POINT_FIELDS)]
+        logger.info(f"  📥 points: {len(self.points)} docs in {time.monotonic() - started:.2f}s")
 
+        self.creature_index = {c['id']: c for c in self.creatures}
         logger.info(f"📊 Loaded {len(self.creatures)} creatures and {len(self.points)} target points.")
         logger.info(f"🔎 Applied Filters: {json.dumps(filters, indent=2)}")
 
-    def create_context_cache(self):
-        """Creates a context cache for biological data to save token costs."""
-        logger.info("💾 Creating Context Cache for Biological Dictionary...")
+    def _cache_contents(self):
         system_instruction = (
             "あなたは海洋生物学者です。提供された生物リストの生態に基づき、"
             "特定のダイビングポイントに生息しているか判定します。出力は必ずJSON形式で。"
         )
+        creatures_context = "\n".join([self._creature_context_line(c) for c in self.creatures])
+        return system_instruction, creatures_context
 
-        creatures_context = "\n".join([
-            f"ID:{c['id']} - {c['name']}: {c.get('description', '')} (水深:{json.dumps(c.get('depthRange'))})"
-            for c in self.creatures
-        ])
+    @property
+    def cache(self):
+        """Context cache of the main model."""
+        return self.caches.get(self.model_name)
 
-        try:
-            self.cache = self.client.caches.create(
-                model=self.model_name,
-                config=types.CreateCachedContentConfig(
-                    display_name=f"bio_cache_{datetime.now(timezone.utc).strftime('%Y%m%d%H')}",
-                    system_instruction=system_instruction,
-                    contents=[creatures_context],
-                    ttl="86400s",
+    @cache.setter
+    def cache(self, value):
+        self.caches[self.model_name] = value
+
+    def create_context_cache(self, model: Optional[str] = None):
+        """Reuses (or creates) a context cache for biological data to save token costs.
+
+        The display name carries a hash of the model and cached contents, so any job with
+        the same creature dictionary picks up a live cache instead of building its own.
+        `model` defaults to the main model; the cache is stored in `self.caches[model]`.
+        """
+        model = model or self.model_name
+        system_instruction, creatures_context = self._cache_contents()
+        digest = hashlib.sha256(f"{model}\n{system_instruction}\n{creatures_context}".encode()).hexdigest()[:16]
+        display_name = f"bio_cache_{digest}"
+
+        with self._cache_lock:
+            # 1. Reuse a live cache with identical contents
+            try:
+                min_expiry = datetime.now(timezone.utc) + timedelta(seconds=self.CACHE_MIN_REMAINING_SECONDS)
+                for cached in self.client.caches.list():
+                    if cached.display_name == display_name and cached.expire_time and cached.expire_time > min_expiry:
+                        self.caches[model] = cached
+                        logger.info(f"♻️ Reusing Context Cache: {cached.name} (expires {cached.expire_time.isoformat()})")
+                        try:
+                            self.caches[model] = self.client.caches.update(
+                                name=cached.name,
+                                config=types.UpdateCachedContentConfig(ttl=f"{self.cache_ttl}s"),
+                            )
+                        except Exception as e:
+                            logger.warning(f"⚠️ Failed to extend cache TTL: {e}")
+                        return
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to list context caches: {e}")
+
+            # 2. Only build a cache if it pays off
+            if len(self.points) < 2:
+                logger.info("💡 Single point run: skipping Context Cache creation.")
+                self.caches[model] = None
+                return
+            try:
+                tokens = self.client.models.count_tokens(model=model, contents=[creatures_context]).total_tokens
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to count context tokens: {e}")
+                tokens = None
+            if tokens is not None and tokens < self.MIN_CACHE_TOKENS:
+                logger.info(f"💡 Creature context is only {tokens} tokens (< {self.MIN_CACHE_TOKENS}): skipping Context Cache.")
+                self.caches[model] = None
+                return
+
+            logger.info(f"💾 Creating Context Cache for Biological Dictionary ({model}, {tokens} tokens)...")
+            try:
+                self.caches[model] = self.client.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=display_name,
+                        system_instruction=system_instruction,
+                        contents=[creatures_context],
+                        ttl=f"{self.cache_ttl}s",
+                    )
                 )
-            )
-            logger.info(f"✅ Context Cache created: {self.cache.name}")
-        except Exception as e:
-            logger.warning(f"⚠️ Context Caching not available or failed: {e}. Proceeding without cache (higher token cost).")
-            self.cache = None
+                logger.info(f"✅ Context Cache created: {self.caches[model].name}")
+            except Exception as e:
+                logger.warning(f"⚠️ Context Caching not available or failed: {e}. Proceeding without cache (higher token cost).")
+                self.caches[model] = None
+
+    @staticmethod
+    def _creature_context_line(c: Dict[str, Any]) -> str:
+        return f"ID:{c['id']} - {c['name']}: {c.get('description', '')} (水深:{json.dumps(c.get('depthRange'))})"
 
     def cleanup_cache(self):
-        """Deletes the context cache to free up resources immediately."""
-        if self.cache:
+        """Deletes the context caches (only with --delete-cache; by default they are kept for the next run)."""
+        if not self.delete_cache:
+            return
+        for model, cache in list(self.caches.items()):
+            if not cache:
+                continue
             try:
-                logger.info(f"🧹 Deleting Context Cache: {self.cache.name}")
-                self.client.caches.delete(name=self.cache.name)
-                self.cache = None
+                logger.info(f"🧹 Deleting Context Cache: {cache.name}")
+                self.client.caches.delete(name=cache.name)
+                self.caches[model] = None
             except Exception as e:
                 logger.warning(f"⚠️ Failed to delete cache: {e}")
 
@@ -128,16 +1683,10 @@ class CleansingPipeline:
             try:
                 return json.loads(clean_text)
             except json.JSONDecodeError as e:
-                # If nested in a list and truncated, try to close it
+                # If it is a truncated list, keep every element that is complete
                 if clean_text.startswith("[") and not clean_text.endswith("]"):
-                    logger.warning("🔍 Attempting to recover from truncated JSON array...")
-                    # Find the last complete object
-                    last_brace = clean_text.rfind("}")
-                    if last_brace != -1:
-                        recovered = clean_text[:last_brace+1] + "]"
-                        try:
-                            return json.loads(recovered)
-                        except: pass
+                    logger.warning("🔍 Recovering complete elements from truncated JSON array...")
+                    return parse_json_array(clean_text)
 
                 # If nested in an object and truncated, try to close it
                 if clean_text.startswith("{") and not clean_text.endswith("}"):
@@ -150,48 +1699,283 @@ class CleansingPipeline:
                             return json.loads(recovered)
                         except: pass
 
-                raise e
+                raise e
+        except Exception as e:
+            logger.error(f"Failed to parse JSON: {e}\nRaw Text Preview: {text[:500]}... [Total Length: {len(text)}]")
+            return None
+
+    def _normalize_rarity(self, rarity_text: str) -> str:
+        """Ensure rarity is a valid enum value by searching for keywords."""
+        valid_rarities = ["Common", "Rare", "Epic", "Legendary"]
+        if not rarity_text:
+            return "Rare"
+
+        text = str(rarity_text).lower()
+        # Search for exact matches first
+        for r in valid_rarities:
+            if r.lower() in text:
+                return r
+
+        return "Rare"
+
+    STAGE1_ITEM_SCHEMA = {
+        "type": "OBJECT",
+        "properties": {
+            "creature_id": {"type": "STRING"},
+            "is_possible": {"type": "BOOLEAN"},
+            "rarity": {"type": "STRING"},
+            "confidence": {"type": "NUMBER"},
+            "reasoning": {"type": "STRING"}
+        },
+        "required": ["creature_id", "is_possible", "rarity", "confidence", "reasoning"]
+    }
+
+    def _stage1_filter_instr(self, point, candidate_ids: Optional[List[str]]) -> str:
+        # Incorporate filters into instructions to focus the AI
+        if point.get('specific_creature_name'):
+            return f"- 今回の判定対象は「{point['specific_creature_name']}」1種類のみです。他の生物は一切リストに含めないでください。"
+        filter_instr = "- ポイントの環境に合致する生物をリストから漏れなく抽出してください。"
+        if candidate_ids is not None:
+            filter_instr += f"\n        - 判定対象は次のIDの生物のみです（それ以外は出力しないでください）: {', '.join(candidate_ids)}"
+        return filter_instr
+
+    def _inline_dictionary(self, candidate_ids: Optional[List[str]], model: Optional[str] = None) -> str:
+        """Without the context cache the model has no dictionary; inline it (pre-filtered if possible)."""
+        if self.caches.get(model or self.model_name):
+            return ""
+        ids = candidate_ids if candidate_ids is not None else list(self.creature_index)
+        lines = [self._creature_context_line(self.creature_index[cid]) for cid in ids]
+        return "\n        【生物リスト】\n" + "\n".join(lines)
+
+    def _on_retry(self, stage: str, model: Optional[str] = None):
+        def on_retry(error, attempt, delay):
+            self.metrics.retry(stage, model or self.model_name)
+            limit = f" (in-flight limit {self.limiter.limit})" if self.limiter else ""
+            logger.warning(f"  ⏳ {stage} call failed: {error}. Retry {attempt}/{self.retry_policy.max_attempts - 1} "
+                           f"in {delay:.1f}s{limit}.")
+        return on_retry
+
+    def _generate(self, stage: str, prompt: str, config: types.GenerateContentConfig):
+        """`generate_content` with its latency and token usage recorded under `stage`.
+
+        Calls go through the adaptive in-flight limiter and are retried with backoff on
+        429 / transient errors, up to the retry policy's attempt budget.
+        """
+        def call():
+            if config.tools and self.stage2_scheduler:
+                self.stage2_scheduler.charge()
+            started = time.monotonic()
+            try:
+                response = self.client.models.generate_content(model=self.model_name, contents=prompt, config=config)
+            except Exception:
+                self.metrics.record(stage, self.model_name, time.monotonic() - started, grounded=bool(config.tools), error=True)
+                raise
+            self.metrics.record(stage, self.model_name, time.monotonic() - started,
+                                getattr(response, 'usage_metadata', None), grounded=bool(config.tools))
+            return response
+
+        return self.retry_policy.call(call, self.limiter, on_retry=self._on_retry(stage))
+
+    def _stream_stage1(self, prompt: str, response_schema: Dict[str, Any], on_item, stage: str = "stage1",
+                       model: Optional[str] = None) -> bool:
+        """Run a streamed Stage 1 request against the context cache of `model` (default: the main model).
+
+        `on_item` is called with each array element as soon as it is complete in the stream.
+        Returns True if the output was truncated at max_output_tokens (complete elements
+        have still been delivered). Failures before the first element are retried like
+        `_generate`; an expired context cache is re-created before its retry.
+        """
+        model = model or self.model_name
+        delivered = 0
+
+        def call():
+            nonlocal delivered
+            config = types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=response_schema,
+                max_output_tokens=8192,
+            )
+            # Use cache only if available
+            if self.caches.get(model):
+                config.cached_content = self.caches[model].name
+
+            parser = JsonArrayStreamParser()
+            truncated = False
+            usage = None
+            started = time.monotonic()
+            try:
+                for chunk in self.client.models.generate_content_stream(
+                    model=model,
+                    contents=prompt,
+                    config=config
+                ):
+                    # Usage is reported on the last chunk
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    if chunk.candidates and chunk.candidates[0].finish_reason == types.FinishReason.MAX_TOKENS:
+                        truncated = True
+                    for item in parser.feed(chunk.text or ""):
+                        delivered += 1
+                        on_item(item)
+            except Exception:
+                self.metrics.record(stage, model, time.monotonic() - started, usage, error=True)
+                raise
+            self.metrics.record(stage, model, time.monotonic() - started, usage)
+            return truncated
+
+        def retryable(error) -> bool:
+            # Elements already handed to on_item cannot be taken back
+            if delivered:
+                return False
+            if "expired" in str(error).lower() and self.caches.get(model):
+                logger.warning(f"⚠️ Cache expired during processing. Re-creating cache to maintain cost efficiency...")
+                self.create_context_cache(model)
+                return True
+            return is_transient(error)
+
+        return self.retry_policy.call(call, self.limiter, retryable, self._on_retry(stage, model))
+
+    def _generate_stage1(self, prompt: str, response_schema: Dict[str, Any], stage: str = "stage1",
+                         model: Optional[str] = None):
+        """Non-incremental variant of `_stream_stage1`: returns (items, truncated)."""
+        items = []
+        truncated = self._stream_stage1(prompt, response_schema, items.append, stage, model)
+        return items, truncated
+
+    def _stage1_shard_size(self) -> int:
+        # Sized so that even if the observed share of listed candidates (with 50% headroom) comes
+        # back, the output stays within STAGE1_OUTPUT_BUDGET.
+        ratio = min(1.0, self._stage1_hit_ratio * 1.5)
+        return max(self.STAGE1_MIN_SHARD, int(self.STAGE1_OUTPUT_BUDGET / (self.STAGE1_TOKENS_PER_RESULT * ratio)))
+
+    def run_stage1_batch(self, point, candidate_ids: Optional[List[str]] = None,
+                         model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Stage 1: Batch physical constraint filtering via Cache.
+
+        The candidate creatures (pre-filtered or the whole catalog) are split into shards
+        small enough not to hit the output-token cap; shards run concurrently and their
+        results are merged, keeping the most confident entry per creature_id.
+        """
+        if point.get('specific_creature_name'):
+            return self._run_stage1_shard(point, candidate_ids, model=model)
+
+        ids = self._stage1_ids(point, candidate_ids)
+        size = self._stage1_shard_size()
+        shards = [ids[i:i + size] for i in range(0, len(ids), size)]
+        if len(shards) <= 1:
+            return self._run_stage1_shard(point, candidate_ids, model=model)
+
+        logger.info(f"  🧩 Stage 1 for {point['name']}: {len(ids)} creatures in {len(shards)} shards of ≤{size}.")
+        if self.stage1_executor:
+            shard_results = list(self.stage1_executor.map(
+                lambda shard: self._run_stage1_shard(point, shard, observe=False, model=model), shards))
+        else:
+            shard_results = [self._run_stage1_shard(point, shard, observe=False, model=model) for shard in shards]
+        # Observed once per point, so shard sizes do not depend on which shard finished first
+        self._observe_stage1_hits(sum(len(result) for result in shard_results), ids)
+
+        merged: Dict[str, Dict[str, Any]] = {}
+        for result in shard_results:
+            for item in result:
+                creature_id = item.get("creature_id")
+                current = merged.get(creature_id)
+                if current is None or item.get("confidence", 0) > current.get("confidence", 0):
+                    merged[creature_id] = item
+        return list(merged.values())
+
+    def _run_stage1_shard(self, point, candidate_ids: Optional[List[str]], observe: bool = True,
+                          model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """One Stage 1 request. If the output is truncated anyway, the creatures it did not reach are asked again."""
+        prompt, response_schema = self._stage1_prompt(point, candidate_ids, model)
+        logger.debug(f"Stage 1 Prompt for {point['name']}: {prompt}")
+        try:
+            result, truncated = self._generate_stage1(prompt, response_schema, model=model)
         except Exception as e:
-            logger.error(f"Failed to parse JSON: {e}\nRaw Text Preview: {text[:500]}... [Total Length: {len(text)}]")
-            return None
+            logger.warning(f"⚠️ Stage 1 Error for {point['name']}: {e}")
+            return []
 
-    def _normalize_rarity(self, rarity_text: str) -> str:
-        """Ensure rarity is a valid enum value by searching for keywords."""
-        valid_rarities = ["Common", "Rare", "Epic", "Legendary"]
-        if not rarity_text:
-            return "Rare"
+        if truncated:
+            seen = {item.get("creature_id") for item in result}
+            result += [item for item in self._stage1_remainder(point, candidate_ids, seen, model)
+                       if item.get("creature_id") not in seen]
 
-        text = str(rarity_text).lower()
-        # Search for exact matches first
-        for r in valid_rarities:
-            if r.lower() in text:
-                return r
+        if observe:
+            self._observe_stage1_hits(len(result), candidate_ids)
+        return result
 
-        return "Rare"
+    def _stage1_ids(self, point, candidate_ids: Optional[List[str]]) -> List[str]:
+        """The creatures a Stage 1 request for `point` judges."""
+        if point.get('specific_creature_name'):
+            return [cid for cid, c in self.creature_index.items() if c['name'] == point['specific_creature_name']]
+        return candidate_ids if candidate_ids is not None else list(self.creature_index)
 
-    def run_stage1_batch(self, point) -> List[Dict[str, Any]]:
-        """Stage 1: Batch physical constraint filtering via Cache."""
-        response_schema = {
-            "type": "ARRAY",
-            "items": {
-                "type": "OBJECT",
-                "properties": {
-                    "creature_id": {"type": "STRING"},
-                    "is_possible": {"type": "BOOLEAN"},
-                    "rarity": {"type": "STRING"},
-                    "confidence": {"type": "NUMBER"},
-                    "reasoning": {"type": "STRING"}
-                },
-                "required": ["creature_id", "is_possible", "rarity", "confidence", "reasoning"]
-            }
-        }
+    def _stage1_remainder(self, point, candidate_ids: Optional[List[str]], seen: set,
+                          model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Re-ask a truncated Stage 1 request for the creatures missing from its output.
 
-        # Incorporate filters into instructions to focus the AI
-        filter_instr = ""
-        if point.get('specific_creature_name'):
-             filter_instr = f"- 今回の判定対象は「{point['specific_creature_name']}」1種類のみです。他の生物は一切リストに含めないでください。"
+        The remainder goes out as one request (split again if it is truncated too); only
+        when nothing came back at all is the list halved, so every retry makes progress.
+        """
+        ids = self._stage1_ids(point, candidate_ids)
+        remainder = [cid for cid in ids if cid not in seen]
+        if not remainder or len(ids) <= 1:
+            logger.warning(f"  ✂️ Stage 1 output truncated for {point['name']}. Nothing left to split; keeping {len(seen)} results.")
+            return []
+        if len(remainder) < len(ids):
+            logger.warning(f"  ✂️ Stage 1 output truncated for {point['name']} after {len(seen)} results. "
+                           f"Re-asking the remaining {len(remainder)} of {len(ids)} candidates.")
+            shards = [remainder]
         else:
-             filter_instr = "- ポイントの環境に合致する生物をリストから漏れなく抽出してください。"
+            half = len(ids) // 2
+            logger.warning(f"  ✂️ Stage 1 output truncated for {point['name']} ({len(ids)} candidates). Splitting shard.")
+            shards = [ids[:half], ids[half:]]
+        return [item for shard in shards for item in self._run_stage1_shard(point, shard, observe=False, model=model)]
+
+    def _observe_stage1_hits(self, results: int, candidate_ids: Optional[List[str]]):
+        if candidate_ids:
+            self._stage1_hit_ratio = 0.8 * self._stage1_hit_ratio + 0.2 * min(1.0, results / len(candidate_ids))
+
+    def iter_stage1(self, point, candidate_ids: Optional[List[str]] = None,
+                    model: Optional[str] = None, start: bool = True) -> Stage1Stream:
+        """Stage 1 results for one point, yielded as soon as each array element has streamed in.
+
+        The request starts right away on a reader thread (or, with `start=False`, wherever the
+        caller invokes `run()`), so generation keeps going while the consumer runs existence
+        checks / Stage 2 on the elements already received. Sharded requests (large candidate
+        lists) deliver the merged `run_stage1_batch` result.
+        """
+        stream = Stage1Stream(lambda put: self._produce_stage1(point, candidate_ids, model, put))
+        return stream.start(f"stage1-stream-{point['id']}") if start else stream
+
+    def _produce_stage1(self, point, candidate_ids: Optional[List[str]], model: Optional[str], put):
+        if not point.get('specific_creature_name') and len(self._stage1_ids(point, candidate_ids)) > self._stage1_shard_size():
+            for item in self.run_stage1_batch(point, candidate_ids, model):
+                put(item)
+            return
+
+        prompt, response_schema = self._stage1_prompt(point, candidate_ids, model)
+        logger.debug(f"Stage 1 Prompt for {point['name']}: {prompt}")
+        seen = set()
+
+        def on_item(item):
+            seen.add(item.get("creature_id"))
+            put(item)
+
+        try:
+            truncated = self._stream_stage1(prompt, response_schema, on_item, model=model)
+        except Exception as e:
+            logger.warning(f"⚠️ Stage 1 Error for {point['name']}: {e}")
+            return
+        if truncated:
+            for item in self._stage1_remainder(point, candidate_ids, seen, model):
+                if item.get("creature_id") not in seen:
+                    seen.add(item.get("creature_id"))
+                    put(item)
+            return
+        self._observe_stage1_hits(len(seen), candidate_ids)
+
+    def _stage1_prompt(self, point, candidate_ids: Optional[List[str]], model: Optional[str] = None):
+        response_schema = {"type": "ARRAY", "items": self.STAGE1_ITEM_SCHEMA}
+        filter_instr = self._stage1_filter_instr(point, candidate_ids) + self._inline_dictionary(candidate_ids, model)
 
         prompt = f"""
         あなたは海洋生物学者です。ダイビングポイント「{point['name']}」の環境条件に基づき、提供された生物リストの中から生息可能なものを【IDを正確に保持したまま】抽出してください。
@@ -219,37 +2003,77 @@ class CleansingPipeline:
           }}
         ]
         """
+        return prompt, response_schema
 
-        logger.debug(f"Stage 1 Prompt for {point['name']}: {prompt}")
-        try:
-            config = types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=response_schema,
-                max_output_tokens=8192,
-            )
-            # Use cache only if available
-            if self.cache:
-                config.cached_content = self.cache.name
+    def run_stage1_multi(self, group: List[tuple], model: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Stage 1 for several (point, candidate_ids) pairs in one request, keyed by point ID.
 
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt,
-                config=config
-            )
-            text = getattr(response, 'text', '') or response.candidates[0].content.parts[0].text
-            result = self._safe_json_parse(text)
-            return result if isinstance(result, list) else []
-        except Exception as e:
-            # Check if it is a cache expiration error
-            error_msg = str(e)
-            if "expired" in error_msg.lower() and self.cache:
-                logger.warning(f"⚠️ Cache expired during processing. Re-creating cache to maintain cost efficiency...")
-                self.create_context_cache()
-                # Retry with the newly created cache (if creation succeeded)
-                return self.run_stage1_batch(point)
+        Points missing from the response (e.g. truncated output) are simply absent from
+        the returned dict so the caller can fall back to `run_stage1_batch`.
+        """
+        response_schema = {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "point_id": {"type": "STRING"},
+                    "creatures": {"type": "ARRAY", "items": self.STAGE1_ITEM_SCHEMA}
+                },
+                "required": ["point_id", "creatures"]
+            }
+        }
 
-            logger.warning(f"⚠️ Stage 1 Error for {point['name']}: {e}")
-            return []
+        point_blocks = []
+        all_candidates = set()
+        for p, candidate_ids in group:
+            point_blocks.append(f"""
+        ■ point_id: {p['id']}
+        - 名前: {p['name']}
+        - 最大水深: {p.get('maxDepth', 40)}m
+        - 地形: {json.dumps(p.get('topography', []))}
+        {self._stage1_filter_instr(p, candidate_ids)}""")
+            all_candidates.update(candidate_ids if candidate_ids is not None else self.creature_index)
+        ordered_candidates = [cid for cid in self.creature_index if cid in all_candidates]
+
+        prompt = f"""
+        あなたは海洋生物学者です。以下の{len(group)}件のダイビングポイントそれぞれについて、環境条件に基づき、提供された生物リストの中から生息可能なものを【IDを正確に保持したまま】抽出してください。
+
+        【ポイント情報】{"".join(point_blocks)}
+
+        【指示】
+        - ポイントごとに point_id をそのまま付けて、全てのポイントの結果を返してください。{self._inline_dictionary(ordered_candidates, model)}
+        - IDを一切変更せず、そのまま使用してください（例：c12345）。
+        - 生息可能（is_possible=true）な生物のみをリストアップしてください。
+        - 期待される希少度(rarity)、確信度(confidence: 0.0-1.0)、理由(reasoning)を含めてください。
+        - **理由(reasoning)は100文字以内で簡潔に記述してください。**
+        - 出力形式は以下のJSON配列のみとし、それ以外のテキスト（Markdownの装飾等）は含めないでください。
+
+        [
+          {{
+            "point_id": "p12345",
+            "creatures": [
+              {{
+                "creature_id": "c12345",
+                "is_possible": true,
+                "rarity": "Common",
+                "confidence": 0.9,
+                "reasoning": "〇〇は浅瀬の岩場に生息するため、このポイントに適しています。"
+              }}
+            ]
+          }}
+        ]
+        """
+
+        logger.debug(f"Stage 1 Multi-point Prompt ({len(group)} points): {prompt}")
+        try:
+            # Only complete point elements are delivered, so a truncated response just misses points
+            items, _ = self._generate_stage1(prompt, response_schema, stage="stage1_multi", model=model)
+        except Exception as e:
+            logger.warning(f"⚠️ Stage 1 Error for batch of {len(group)} points: {e}")
+            return {}
+        items = [item for item in items if isinstance(item, dict)]
+        requested = {p['id'] for p, _ in group}
+        return {item['point_id']: item.get('creatures') or [] for item in items if item.get('point_id') in requested}
 
     def run_stage2_grounding(self, point, creature) -> Dict[str, Any]:
         """Stage 2: Factual verification via Google Search Tool."""
@@ -271,120 +2095,1043 @@ class CleansingPipeline:
 
         logger.debug(f"Stage 2 Prompt for {creature['name']}: {prompt}")
         try:
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    tools=[types.Tool(google_search=types.GoogleSearch())],
-                    response_mime_type="application/json",
-                    response_schema=response_schema,
-                    max_output_tokens=4096,
-                )
-            )
+            response = self._generate("stage2", prompt, types.GenerateContentConfig(
+                tools=[types.Tool(google_search=types.GoogleSearch())],
+                response_mime_type="application/json",
+                response_schema=response_schema,
+                max_output_tokens=4096,
+            ))
             text = getattr(response, 'text', '') or response.candidates[0].content.parts[0].text
             result = self._safe_json_parse(text)
-            return result if isinstance(result, dict) else {"actual_existence": False, "evidence": "Parse Error", "rarity": "Unknown"}
+            return result if isinstance(result, dict) else {"actual_existence": False, "evidence": "Parse Error", "rarity": "Unknown", "error": True}
+        except Stage2BudgetExhausted:
+            raise
         except Exception as e:
             logger.warning(f"⚠️ Stage 2 Error for {creature['name']}: {e}")
-            return {"actual_existence": False, "evidence": str(e), "rarity": "Unknown"}
+            return {"actual_existence": False, "evidence": str(e), "rarity": "Unknown", "error": True}
 
-    def process(self, mode: str, filters: Dict[str, Any], limit: int):
-        processed_count = 0
+    def _stage2_batch_limit(self) -> int:
+        return max(1, min(self.stage2_batch_size, int(self.STAGE2_OUTPUT_BUDGET / self._stage2_tokens_per_item)))
+
+    def _run_grounded_batch(self, stage: str, label: str, prompt: str, properties: Dict[str, Any],
+                            creatures: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """One grounded request answering an array of `properties` per creature, keyed by creature_id."""
+        response_schema = {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"creature_id": {"type": "STRING"}, **properties},
+                "required": ["creature_id", *properties]
+            }
+        }
         try:
-            self.load_data(filters)
-            self.create_context_cache()
+            response = self._generate(stage, prompt, types.GenerateContentConfig(
+                tools=[types.Tool(google_search=types.GoogleSearch())],
+                response_mime_type="application/json",
+                response_schema=response_schema,
+                max_output_tokens=4096,
+            ))
+            text = getattr(response, 'text', '') or response.candidates[0].content.parts[0].text
+            if response.candidates and response.candidates[0].finish_reason == types.FinishReason.MAX_TOKENS:
+                # Verdicts are longer than estimated: send fewer creatures per request from now on
+                self._stage2_tokens_per_item *= 1.5
+                logger.warning(f"  ✂️ Stage 2 batch truncated. Batch size lowered to {self._stage2_batch_limit()}.")
+            items = self._safe_json_parse(text)
+        except Stage2BudgetExhausted:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Stage 2 Batch Error for {label}: {e}")
+            return {}
+        if not isinstance(items, list):
+            return {}
+        requested = {c['id'] for c in creatures}
+        return {item['creature_id']: {k: v for k, v in item.items() if k != 'creature_id'}
+                for item in items if isinstance(item, dict) and item.get('creature_id') in requested}
 
-            for p in self.points:
-                if processed_count >= limit: break
-                logger.info(f"🔎 Processing Point: {p['name']} ({p['id']})")
-
-                # Add target creature name to point info for Stage 1 focus
-                p['specific_creature_name'] = None
-                if filters.get('creatureId'):
-                    creature = next((c for c in self.creatures if c['id'] == filters['creatureId']), None)
-                    if creature:
-                        p['specific_creature_name'] = creature['name']
-
-                s1_results = self.run_stage1_batch(p)
-                if not s1_results:
-                    logger.warning(f"  ⚠️ Stage 1 returned 0 results for {p['name']}.")
+    def run_stage2_batch(self, point, creatures: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Stage 2 for several creatures of one point in a single grounded request.
+
+        Returns verdicts keyed by creature_id; creatures missing from the response are left
+        out so the caller can fall back to `run_stage2_grounding`.
+        """
+        creature_lines = "\n".join(f"        - {c['id']}: {c['name']}" for c in creatures)
+        prompt = f"""
+        「{point['name']}」（{point.get('region','')}, {point.get('area','')}）において、
+        以下の生物それぞれの目撃実績や生息情報をGoogle検索で精査してください。
+{creature_lines}
+        生物ごとに creature_id を含めて、必ず指定されたJSON形式（配列）で回答してください。
+        """
+
+        logger.debug(f"Stage 2 Batch Prompt ({len(creatures)} creatures): {prompt}")
+        return self._run_grounded_batch("stage2_batch", point['name'], prompt, {
+            "actual_existence": {"type": "BOOLEAN"},
+            "evidence": {"type": "STRING"},
+            "rarity": {"type": "STRING"}
+        }, creatures)
+
+    def run_stage2_area_batch(self, point, creatures: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Stage 2 for a whole area and for this point of it, for several creatures in one grounded request.
+
+        Each item carries the area-level `presence` shared with the sibling points and the
+        point-level `actual_existence` of the asking point. Creatures missing from the
+        response are left out.
+        """
+        siblings = "、".join(self.area_planner.sibling_names(point['areaId']))
+        creature_lines = "\n".join(f"        - {c['id']}: {c['name']}" for c in creatures)
+        prompt = f"""
+        エリア「{point.get('area','')}」（{point.get('region','')}, {point.get('zone','')}）の
+        ダイビングポイント（{siblings} など）において、
+        以下の生物それぞれの目撃実績や生息情報をGoogle検索で精査してください。
+{creature_lines}
+        presence はエリア全体について以下から選択してください:
+        - widespread: エリア内の多くのポイントで見られる
+        - localized: 特定のポイントや環境でのみ見られる、または判断できない
+        - absent: エリア内での目撃実績がない
+        actual_existence はそのうち「{point['name']}」で見られるかを回答してください。
+        生物ごとに creature_id を含めて、必ず指定されたJSON形式（配列）で回答してください。
+        """
+
+        logger.debug(f"Stage 2 Area Batch Prompt ({len(creatures)} creatures): {prompt}")
+        return self._run_grounded_batch("stage2_area", point.get('area', ''), prompt, {
+            "presence": {"type": "STRING", "enum": ["widespread", "localized", "absent"]},
+            "actual_existence": {"type": "BOOLEAN"},
+            "evidence": {"type": "STRING"},
+            "rarity": {"type": "STRING"}
+        }, creatures)
+
+    def _query_area_verdicts(self, point, area_id: str, creatures: List[Dict[str, Any]],
+                             point_verdicts: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Area verdicts of the creatures this point is the first to ask for, keyed by creature_id.
+
+        Cached area verdicts are used first. The rest go through batched area requests, whose
+        point-level answers for this point are stored in `point_verdicts`.
+        """
+        subject_id = f"area-{area_id}"
+        results, todo = {}, []
+        for creature in creatures:
+            cached = self.grounding_cache.get(subject_id, creature['id'], STAGE2_AREA_PROMPT_VERSION) if self.grounding_cache else None
+            if cached is not None:
+                logger.info(f"  📦 Grounding cache hit: {creature['name']}")
+                results[creature['id']] = cached
+            else:
+                todo.append(creature)
+
+        size = self._stage2_batch_limit()
+        for i in range(0, len(todo), size):
+            batch = todo[i:i + size]
+            logger.info(f"  🗺️ Stage 2 area batch: {len(batch)} creatures of {point.get('area', area_id)} in one grounded request.")
+            for creature_id, item in self.run_stage2_area_batch(point, batch).items():
+                area = {"presence": item.get("presence"), "evidence": item.get("evidence"), "rarity": item.get("rarity")}
+                results[creature_id] = area
+                point_verdicts[creature_id] = {"actual_existence": bool(item.get("actual_existence")),
+                                               "evidence": item.get("evidence"), "rarity": item.get("rarity")}
+                if self.grounding_cache:
+                    self.grounding_cache.put(subject_id, creature_id, area, STAGE2_AREA_PROMPT_VERSION)
+        return results
+
+    def _area_verdict(self, creature, area: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """The verdict implied by the shared area verdict, or None when the point needs its own Stage 2 query."""
+        if not area or area.get("error"):
+            return None
+        presence = area.get("presence")
+        if presence not in ("widespread", "absent") and self.area_planner.confirm_ambiguous:
+            logger.info(f"  🗺️ Area verdict for {creature['name']} is ambiguous. Confirming for this point.")
+            self.area_planner.confirmed()
+            return None
+        logger.info(f"  🗺️ Area verdict for {creature['name']}: {presence}")
+        return {
+            "actual_existence": presence != "absent",
+            "evidence": area.get("evidence"),
+            "rarity": area.get("rarity"),
+        }
+
+    def grounded_verdicts(self, point, creatures: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Stage 2 verdicts keyed by creature_id.
+
+        Area verdicts and cached verdicts are used first; the remaining creatures are verified
+        in multi-creature grounded requests, with a single-creature retry for any creature
+        missing from a batch response. Creatures not reached before the Stage 2 scheduler's
+        budget ran out are left out.
+        """
+        verdicts = {}
+        try:
+            self._grounded_verdicts(point, creatures, verdicts)
+        except Stage2BudgetExhausted:
+            logger.info(f"  🎯 Stage 2 budget exhausted: {len(creatures) - len(verdicts)} creatures of {point['name']} left unverified.")
+        return verdicts
+
+    def _grounded_verdicts(self, point, creatures: List[Dict[str, Any]], verdicts: Dict[str, Dict[str, Any]]):
+        # Area-level verdicts: the first point of an area to ask gets its own verdicts from the same request
+        area_id = self.area_planner.area_of(point) if self.area_planner else None
+        areas, point_verdicts = {}, {}
+        if area_id:
+            by_id = {c['id']: c for c in creatures}
+            areas = self.area_planner.verdicts(area_id, list(by_id), lambda owned: self._query_area_verdicts(
+                point, area_id, [by_id[cid] for cid in owned], point_verdicts))
+
+        # Look up verdicts of the prompt this run sends; each verdict is cached under the prompt that produced it
+        version = STAGE2_BATCH_PROMPT_VERSION if self.stage2_batch_size > 1 else STAGE2_PROMPT_VERSION
+        todo = []
+        for creature in creatures:
+            verdict = point_verdicts.get(creature['id'])
+            if verdict is not None:
+                logger.info(f"  🗺️ Point verdict for {creature['name']} from the area batch: {verdict['actual_existence']}")
+            else:
+                verdict = self._area_verdict(creature, areas.get(creature['id']))
+            if verdict is None and self.grounding_cache:
+                verdict = self.grounding_cache.get(point['id'], creature['id'], version)
+                if verdict is not None:
+                    logger.info(f"  📦 Grounding cache hit: {creature['name']}")
+            if verdict is None:
+                todo.append(creature)
+            else:
+                verdicts[creature['id']] = verdict
+
+        size = self._stage2_batch_limit()
+        for i in range(0, len(todo), size):
+            batch = todo[i:i + size]
+            results = {}
+            if len(batch) > 1:
+                logger.info(f"  🌐 Stage 2 batch: {len(batch)} creatures in one grounded request.")
+                results = self.run_stage2_batch(point, batch)
+                if len(results) < len(batch):
+                    logger.warning(f"  ⚠️ {len(batch) - len(results)} creatures missing from the Stage 2 batch. Verifying them one by one.")
+            for creature in batch:
+                verdict = results.get(creature['id'])
+                version = STAGE2_BATCH_PROMPT_VERSION
+                if not verdict:
+                    verdict = self.run_stage2_grounding(point, creature)
+                    version = STAGE2_PROMPT_VERSION
+                if self.grounding_cache and not verdict.get("error"):
+                    self.grounding_cache.put(point['id'], creature['id'], verdict, version)
+                verdicts[creature['id']] = verdict
+
+    def grounded_verdict(self, point, creature) -> Dict[str, Any]:
+        return self.grounded_verdicts(point, [creature])[creature['id']]
+
+    @staticmethod
+    def shard_of(point_id: str, shard_count: int) -> int:
+        """Stable shard assignment (independent of PYTHONHASHSEED and of the query order)."""
+        return int(hashlib.sha1(point_id.encode()).hexdigest(), 16) % shard_count
+
+    def apply_shard(self, shard_index: int, shard_count: int):
+        total = len(self.points)
+        self.points = [p for p in self.points if self.shard_of(p['id'], shard_count) == shard_index]
+        logger.info(f"🧩 Shard {shard_index + 1}/{shard_count}: {len(self.points)} of {total} points.")
+
+    def run_summary(self) -> Dict[str, Any]:
+        summary = {
+            "points": len(self.points),
+            "processed": self.processed_count,
+            "committed": self.sink.committed,
+            "failed": self.sink.failed,
+        }
+        if self.grounding_cache:
+            summary["groundingCacheHits"] = self.grounding_cache.hits
+            summary["groundingCacheMisses"] = self.grounding_cache.misses
+        if self.area_planner:
+            summary["areaGroundingQueries"] = self.area_planner.queries
+            summary["areaGroundingReused"] = self.area_planner.reused
+            summary["areaGroundingConfirmations"] = self.area_planner.confirmations
+        if self.stage2_scheduler:
+            summary["stage2Queued"] = self.stage2_scheduler.queued
+            summary["stage2Verified"] = self.stage2_scheduler.verified
+            summary["stage2Requests"] = self.stage2_scheduler.calls
+        if self.stage1_router:
+            summary["stage1Escalated"] = sum(self.stage1_router.escalations.values())
+            summary["stage1RoutedPoints"] = self.stage1_router.points
+        if self.pipeline_stats:
+            for name, stats in self.pipeline_stats["queues"].items():
+                summary[f"{name}QueueMaxDepth"] = stats["maxDepth"]
+                summary[f"{name}QueueAvgDepth"] = stats["avgDepth"]
+                summary[f"{name}QueueBlockedSeconds"] = stats["blockedSeconds"]
+            for stage, seconds in self.pipeline_stats["busySeconds"].items():
+                summary[f"{stage}BusySeconds"] = seconds
+        if self.work_queue:
+            for key, value in self.work_queue.stats().items():
+                summary[f"queue{key.capitalize()}"] = value
+        if self.limiter:
+            summary["genaiThrottled"] = self.limiter.throttled
+            summary["genaiInflightLimit"] = self.limiter.limit
+        totals = self.metrics.summary()["totals"]
+        for key in ("calls", "promptTokens", "cachedTokens", "outputTokens", "estimatedCostUsd"):
+            summary[f"genai{key[0].upper()}{key[1:]}"] = totals[key]
+        return summary
+
+    # Per-task levels rather than counts: the run-level value is the largest task's, not a sum
+    SHARD_MAX_FIELDS = ("genaiInflightLimit", "QueueMaxDepth", "QueueAvgDepth")
+
+    def report_shard_summary(self, run_id: str, shard_index: int, shard_count: int):
+        """Record this task's summary and fold it into the run-level totals.
+
+        Totals are merged with server-side increments (maximums for `SHARD_MAX_FIELDS`), so
+        tasks never need to coordinate; whichever task sees all shards completed logs the
+        merged summary. Per-task values stay under `tasks/{shardIndex}`.
+        """
+        summary = self.run_summary()
+        run_ref = self.db.collection('cleansing_runs').document(run_id)
+        run_ref.collection('tasks').document(str(shard_index)).set(summary | {"finishedAt": firestore.SERVER_TIMESTAMP})
+        run_ref.set({
+            "taskCount": shard_count,
+            "tasksCompleted": firestore.Increment(1),
+            "totals": {k: firestore.Maximum(v) if k.endswith(self.SHARD_MAX_FIELDS) else firestore.Increment(v)
+                       for k, v in summary.items()},
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+
+        merged = run_ref.get().to_dict() or {}
+        if merged.get("tasksCompleted", 0) >= shard_count:
+            logger.info(f"🧩 All {shard_count} shards of {run_id} finished. Merged summary: {json.dumps(merged.get('totals', {}))}")
+
+    def _open_journal(self, run_id: str, mode: str, filters: Dict[str, Any], resume: bool):
+        try:
+            completed = self.journal.open(run_id, mode, filters, resume)
+        except ValueError:
+            raise
+        except Exception as e:
+            if not isinstance(self.journal, FirestoreProgressJournal):
+                raise
+            logger.warning(f"⚠️ Firestore progress journal unavailable ({e}). Falling back to a local journal file.")
+            self.journal = LocalProgressJournal(DEFAULT_CACHE_DIR)
+            completed = self.journal.open(run_id, mode, filters, resume)
+
+        logger.info(f"📝 Progress journal: run_id={run_id} (resume with --resume {run_id})")
+        if completed:
+            before = len(self.points)
+            self.points = [p for p in self.points if p['id'] not in completed]
+            logger.info(f"⏩ Resuming: skipping {before - len(self.points)} already completed points.")
+
+    # Above this many points one projected scan of point_creatures is cheaper than `in` queries
+    PRIORITY_IN_QUERY_MAX_POINTS = 3000
+
+    def _point_mapping_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Latest mapping update and approved-mapping count per point (one projected read per mapping)."""
+        fields = ['pointId', 'status', 'updatedAt']
+        collection = self.db.collection('point_creatures')
+        point_ids = [p['id'] for p in self.points]
+        if len(point_ids) <= self.PRIORITY_IN_QUERY_MAX_POINTS:
+            queries = [collection.where('pointId', 'in', point_ids[i:i + 30]) for i in range(0, len(point_ids), 30)]
+        else:
+            queries = [collection]
+        wanted = set(point_ids)
+        stats: Dict[str, Dict[str, Any]] = {}
+        for query in queries:
+            for doc in self._paged_stream(query, fields):
+                data = doc.to_dict() or {}
+                if data.get('pointId') not in wanted:
                     continue
+                entry = stats.setdefault(data['pointId'], {"latest": None, "approved": 0})
+                updated = data.get('updatedAt')
+                if isinstance(updated, datetime) and (entry["latest"] is None or updated > entry["latest"]):
+                    entry["latest"] = updated
+                entry["approved"] += int(data.get('status') == 'approved')
+        return stats
 
-                possible_count = sum(1 for r in s1_results if r.get("is_possible"))
-                logger.info(f"  ✅ Stage 1: {len(s1_results)} checked, {possible_count} potentially possible.")
+    def prioritize_points(self):
+        started = time.monotonic()
+        stats = self._point_mapping_stats()
+        self.points = PointPrioritizer(stats).order(self.points)
+        never = sum(1 for p in self.points if p['id'] not in stats)
+        logger.info(f"📌 Point priority: {len(self.points)} points ordered by staleness, bookmarks and approved mappings "
+                    f"({never} never processed, {time.monotonic() - started:.2f}s).")
 
-                for res in s1_results:
-                    if processed_count >= limit: break
-                    creature_id = res.get("creature_id")
+    def _prepare_point(self, p, filters: Dict[str, Any]) -> Optional[List[str]]:
+        """Set the Stage 1 focus of a point and return its pre-filter candidates (None = whole catalog)."""
+        # Add target creature name to point info for Stage 1 focus
+        p['specific_creature_name'] = None
+        if filters.get('creatureId'):
+            creature = self.creature_index.get(filters['creatureId'])
+            if creature:
+                p['specific_creature_name'] = creature['name']
 
-                    if not res.get("is_possible"):
-                        logger.debug(f"  ❌ Skipping: {creature_id} (not possible according to AI)")
-                        continue
+        candidates = None
+        if self.prefilter and not p['specific_creature_name']:
+            candidates = self.prefilter.candidates(p)
+        # Delta cleansing: unchanged points are only judged against new / changed creatures
+        only = self._delta["restrict"].get(p['id']) if self._delta else None
+        if only is not None:
+            if p['specific_creature_name']:
+                return None if filters['creatureId'] in only else []
+            candidates = [cid for cid in (candidates if candidates is not None else self.creature_index) if cid in only]
+        return candidates
+
+    def _plan_delta(self, filters: Dict[str, Any], shard_index: int, shard_count: int, run_id: str):
+        """Narrow the run to changed points (full catalog) and new / changed creatures (all other points)."""
+        scope = DeltaState.scope_key(filters, shard_index, shard_count)
+        try:
+            self.delta_state.open(scope)
+        except Exception as e:
+            if not isinstance(self.delta_state, FirestoreDeltaState):
+                raise
+            logger.warning(f"⚠️ Firestore delta state unavailable ({e}). Falling back to a local state file.")
+            self.delta_state = LocalDeltaState(DEFAULT_CACHE_DIR)
+            self.delta_state.open(scope)
+
+        point_fps = {p['id']: DeltaState.fingerprint(p, DeltaState.POINT_FIELDS) for p in self.points}
+        creature_fps = {c['id']: DeltaState.fingerprint(c, DeltaState.CREATURE_FIELDS) for c in self.creatures}
+        changed_creatures = {cid for cid, fp in creature_fps.items() if self.delta_state.creatures.get(cid) != fp}
+        restrict, selected = {}, []
+        for p in self.points:
+            if self.delta_state.points.get(p['id']) == point_fps[p['id']]:
+                if not changed_creatures:
+                    continue
+                restrict[p['id']] = changed_creatures
+            selected.append(p)
+
+        watermark = self.delta_state.watermark or {}
+        logger.info(f"🔺 Delta since {watermark.get('at', 'the beginning')} ({watermark.get('runId') or '-'}): "
+                    f"{len(selected) - len(restrict)} changed points x all creatures, {len(restrict)} points x "
+                    f"{len(changed_creatures)} new/changed creatures, {len(self.points) - len(selected)} points skipped.")
+        self.points = selected
+        self._delta = {
+            "points": point_fps,
+            "creatures": creature_fps,
+            "restrict": restrict,
+            "completed": 0,
+            "watermark": {"at": datetime.now(timezone.utc).isoformat(), "runId": run_id},
+        }
+
+    def _advance_delta(self):
+        """Move the creature baseline and watermark forward once every point in scope is done."""
+        if self.work_queue:
+            # Points are spread over workers: whichever worker sees the queue fully done advances
+            remaining = int(self.work_queue.unfinished(include_failed=True))
+        else:
+            remaining = len(self.points) - self._delta["completed"]
+        if remaining > 0:
+            logger.info(f"🔺 Delta baseline kept: {remaining} points not completed; their creatures are re-checked next run.")
+            return
+        self.delta_state.save_creatures(self._delta["creatures"], self._delta["watermark"])
+        logger.info(f"🔺 Delta watermark advanced to {self._delta['watermark']['at']}.")
+
+    def _stage1_output_estimate(self, p, candidate_ids: Optional[List[str]]) -> float:
+        if p.get('specific_creature_name'):
+            expected = 1
+        elif candidate_ids is not None:
+            expected = min(len(candidate_ids), self._stage1_results_avg)
+        else:
+            expected = self._stage1_results_avg
+        return expected * self.STAGE1_TOKENS_PER_RESULT + self.STAGE1_TOKENS_PER_POINT
+
+    def _stage1_groups(self, filters: Dict[str, Any], points_per_request: int):
+        """Yield lists of (point, candidate_ids) that share one Stage 1 request.
+
+        Points are grouped by area (falling back to zone / region) and each group is
+        filled until the estimated output reaches STAGE1_OUTPUT_BUDGET. The estimate
+        uses the running average of Stage 1 results per point, so later groups adapt.
+        """
+        if points_per_request <= 1:
+            for p in self.points:
+                yield [(p, self._prepare_point(p, filters))]
+            return
+
+        buckets: Dict[str, List[tuple]] = {}
+        for p in self.points:
+            key = p.get('areaId') or p.get('zoneId') or p.get('regionId') or ''
+            buckets.setdefault(key, []).append((p, self._prepare_point(p, filters)))
+
+        for bucket in buckets.values():
+            group, budget = [], self.STAGE1_OUTPUT_BUDGET
+            for p, candidate_ids in bucket:
+                cost = self._stage1_output_estimate(p, candidate_ids)
+                if group and (len(group) >= points_per_request or cost > budget):
+                    yield group
+                    group, budget = [], self.STAGE1_OUTPUT_BUDGET
+                group.append((p, candidate_ids))
+                budget -= cost
+            if group:
+                yield group
+
+    def _run_stage1_group(self, group: List[tuple], start: bool = True) -> Dict[str, Iterable[Dict[str, Any]]]:
+        """Stage 1 results per point ID: lists for batched points, `Stage1Stream`s otherwise.
+
+        With a Stage 1 router the group runs on the cheap model first, and only the points
+        whose answers it flags are re-run (streamed) on the main model. With `start=False`
+        the streams are returned unstarted, for the caller to `run()` on its own thread.
+        """
+        todo = [(p, candidate_ids) for p, candidate_ids in group if candidate_ids != []]
+        if not self.stage1_router:
+            return self._stage1_results(todo, start=start)
+
+        results = self._stage1_results(todo, self.stage1_router.cheap_model)
+        for p, candidate_ids in todo:
+            items = list(results[p['id']])
+            allowed = set(candidate_ids) if candidate_ids is not None else self.creature_index
+            reason = self.stage1_router.review(items, allowed)
+            if reason:
+                logger.info(f"  🪜 Escalating Stage 1 for {p['name']} to {self.model_name} ({reason} answer from {self.stage1_router.cheap_model}).")
+                results[p['id']] = self.iter_stage1(p, candidate_ids, start=start)
+            else:
+                results[p['id']] = items
+        return results
+
+    def _stage1_results(self, todo: List[tuple], model: Optional[str] = None,
+                        start: bool = True) -> Dict[str, Iterable[Dict[str, Any]]]:
+        results = {}
+        if len(todo) > 1:
+            logger.info(f"🧺 Stage 1 batch: {len(todo)} points in one request.")
+            results = self.run_stage1_multi(todo, model)
+            missing = len(todo) - len(results)
+            if missing:
+                logger.warning(f"  ⚠️ {missing} points missing from the batch response. Falling back to single-point requests.")
+        for p, candidate_ids in todo:
+            if p['id'] not in results:
+                results[p['id']] = self.iter_stage1(p, candidate_ids, model, start=start)
+        return results
+
+    def _evaluate_point(self, p, candidate_ids: Optional[List[str]], s1_results: Iterable[Dict[str, Any]],
+                        mode: str, filters: Dict[str, Any], budget, emit) -> bool:
+        """Run Stage 2 for a single point's Stage 1 results and hand every accepted mapping to `emit`.
+
+        `s1_results` may be a streaming iterator, so work starts on the first elements
+        while the rest of the Stage 1 response is still being generated. Uncertain
+        creatures are queued and verified in multi-creature Stage 2 requests; mappings
+        are still emitted in Stage 1 order.
+
+        `budget()` returns how many more mappings may be stored, so that `--limit` stops
+        the (expensive) Stage 2 calls as early as the serial loop used to.
+        Returns True if the point was fully evaluated (i.e. it can be journaled as completed).
+        """
+        logger.info(f"🔎 Processing Point: {p['name']} ({p['id']})")
+
+        if candidate_ids is not None:
+            logger.info(f"  🧮 Habitat pre-filter: {len(candidate_ids)}/{len(self.creatures)} creatures remain.")
+            if not candidate_ids:
+                return True
+            allowed = set(candidate_ids)
+            s1_results = (r for r in s1_results if r.get("creature_id") in allowed or r.get("creature_id") not in self.creature_index)
+
+        # One ID-only query per point instead of one document read per candidate
+        existing_keys = self._existing_mapping_keys(p['id']) if mode == "new" else set()
+
+        # [key, Stage 1 result, creature, Stage 2 verdict or None while queued], in Stage 1 order
+        pending = []
+
+        def flush() -> bool:
+            queued = [m for m in pending if m[3] is None]
+            if queued:
+                verdicts = self.grounded_verdicts(p, [m[2] for m in queued])
+                for m in queued:
+                    m[3] = verdicts[m[2]['id']]
+            for key, res, creature, s2 in pending:
+                if budget() <= 0: return False
+                emit(key, self._mapping_entry(p, creature, res, s2), creature)
+            pending.clear()
+            return True
+
+        checked = possible_count = 0
+        for res in s1_results:
+            checked += 1
+            if budget() <= len(pending):
+                flush()
+                return False
+            creature_id = res.get("creature_id")
+
+            if not res.get("is_possible"):
+                logger.debug(f"  ❌ Skipping: {creature_id} (not possible according to AI)")
+                continue
+            possible_count += 1
+
+            if not creature_id:
+                raise ValueError(f"AI returned an empty creature_id for point {p['name']}")
+
+            # Optional: pinpoint creature filter
+            if filters.get('creatureId') and creature_id != filters['creatureId']:
+                continue
+
+            key = f"{p['id']}_{creature_id}"
+
+            # Skip mappings that already exist if mode is 'new'
+            if mode == "new" and key in existing_keys:
+                logger.debug(f"  ⏭️ Skipping existing: {creature_id}")
+                continue
+
+            creature = self.creature_index.get(creature_id)
+            if not creature:
+                raise ValueError(f"Creature ID '{creature_id}' returned by AI was NOT found in the biological dictionary. AI may be hallucinating IDs.")
+            # Stage 1 may list the same creature twice; treat it as existing from now on
+            existing_keys.add(key)
+
+            # Stage 2: Fact-check with Grounding (Only if Stage 1 is unsure)
+            if res.get("confidence", 0) >= 0.85:
+                logger.info(f"  ✨ AI is confident ({res.get('confidence')}) for {creature['name']}. Saving without search.")
+                pending.append([key, res, creature, {
+                    "actual_existence": True,
+                    "evidence": res.get("reasoning"),
+                    "rarity": res.get("rarity")
+                }])
+            elif self.stage2_scheduler:
+                logger.info(f"  🎯 AI is unsure. Deferred to the Stage 2 scheduler: {creature['name']}")
+                self.stage2_scheduler.add(p, key, res, creature)
+            else:
+                logger.info(f"  🌐 AI is unsure. Queued for Google Search Grounding: {creature['name']}...")
+                pending.append([key, res, creature, None])
+
+            queued = sum(1 for m in pending if m[3] is None)
+            if queued == 0 or queued >= min(self._stage2_batch_limit(), budget()):
+                if not flush(): return False
+
+        if not flush(): return False
+        if not checked:
+            logger.warning(f"  ⚠️ Stage 1 returned 0 results for {p['name']}.")
+            # A handful of new creatures (delta run) can legitimately all be unsuitable
+            return bool(self._delta and p['id'] in self._delta["restrict"])
+        logger.info(f"  ✅ Stage 1: {checked} checked, {possible_count} potentially possible.")
+        # Exponential moving average of results per point, used to size later multi-point batches
+        self._stage1_results_avg = 0.8 * self._stage1_results_avg + 0.2 * checked
+        return True
+
+    def _mapping_entry(self, p, creature, res: Dict[str, Any], s2: Dict[str, Any]) -> Dict[str, Any]:
+        # Save result to Firestore
+        status = "pending" if s2.get("actual_existence") else "rejected"
+        raw_rarity = s2.get("rarity") or res.get("rarity") or "Rare"
+        local_rarity = self._normalize_rarity(raw_rarity)
 
-                    if not creature_id:
-                        raise ValueError(f"AI returned an empty creature_id for point {p['name']}")
+        # Final check: if rejected but high confidence in S1, maybe it's just 'Rare'
+        if status == "rejected" and res.get("confidence", 0) > 0.8:
+            logger.info(f"  💡 High confidence S1 result kept as 'pending' despite no web evidence.")
+            status = "pending"
 
-                    # Optional: pinpoint creature filter
-                    if filters.get('creatureId') and creature_id != filters['creatureId']:
+        return {
+            "pointId": p['id'],
+            "creatureId": creature['id'],
+            "localRarity": local_rarity,
+            "status": status,
+            "reasoning": s2.get("evidence") or res.get("reasoning"),
+            "confidence": (res.get("confidence", 0.5) + (0.3 if s2.get("actual_existence") else 0)) / 1.3,
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+            "method": "python-batch-v1"
+        }
+
+    def _existing_mapping_keys(self, point_id: str) -> set:
+        """Fetch the IDs of all point_creatures already mapped to a point (no field data)."""
+        query = self.db.collection('point_creatures').where('pointId', '==', point_id).select([])
+        return {doc.id for doc in query.stream()}
+
+    def _point_completed(self, point_id: str):
+        # Journaled only once the sink has committed everything written so far.
+        if self.stage2_scheduler and self.stage2_scheduler.outstanding(point_id):
+            self.stage2_scheduler.hold(point_id)
+        elif self.journal or self._delta or self.work_queue:
+            self._awaiting_commit.append(point_id)
+
+    def _checkpoint(self, ok: bool):
+        points, self._awaiting_commit = self._awaiting_commit, []
+        if not ok or not points:
+            # Points whose writes failed stay unjournaled and are redone on resume.
+            return
+        if self.journal:
+            try:
+                self.journal.mark_completed(points)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to journal {len(points)} completed points: {e}")
+        if self._delta:
+            self._delta["completed"] += len(points)
+            fingerprints = {pid: self._delta["points"][pid] for pid in points
+                            if pid in self._delta["points"] and self.delta_state.points.get(pid) != self._delta["points"][pid]}
+            try:
+                self.delta_state.save_points(fingerprints)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to save delta fingerprints of {len(fingerprints)} points: {e}")
+        if self.work_queue:
+            try:
+                self.work_queue.complete(points)
+            except Exception as e:
+                # Their leases expire and another worker redoes them (same mapping keys, no duplicates)
+                logger.warning(f"⚠️ Failed to mark {len(points)} work items done: {e}")
+
+    def _on_commit(self, ok: bool):
+        mappings, self._awaiting_store = self._awaiting_store, []
+        if ok:
+            for mapping in mappings:
+                logger.info(f"  🚀 [STORED] {mapping}")
+        elif mappings:
+            logger.warning(f"  ⚠️ {len(mappings)} queued mappings were not confirmed as stored.")
+        self._checkpoint(ok)
+
+    def _store_mapping(self, key: str, entry: Dict[str, Any], creature: Dict[str, Any]):
+        # Logged as stored by `_on_commit` once the sink has committed the write
+        mapping = f"key={key} | {creature['name']} ({creature['id']}) -> status:{entry['status']}"
+        self._awaiting_store.append(mapping)
+        logger.info(f"  📤 [QUEUED] {mapping}")
+        self.sink.write(key, entry)
+        self.processed_count += 1
+
+    def _process_serial(self, mode: str, filters: Dict[str, Any], limit: int, points_per_request: int):
+        for group in self._stage1_groups(filters, points_per_request):
+            if self.processed_count >= limit: break
+            s1 = self._run_stage1_group(group)
+            for p, candidate_ids in group:
+                if self.processed_count >= limit: break
+                if self._evaluate_point(p, candidate_ids, s1.get(p['id'], []), mode, filters,
+                                        lambda: limit - self.processed_count, self._store_mapping):
+                    self._point_completed(p['id'])
+
+    def _process_concurrent(self, mode: str, filters: Dict[str, Any], limit: int, concurrency: int,
+                            points_per_request: int):
+        """Evaluate up to `concurrency` Stage 1 groups in parallel, but store their mappings in point order.
+
+        Committing in the original order keeps `--limit` selecting exactly the same
+        mappings as the serial path; workers only use the committed count as an upper
+        bound to avoid Stage 2 calls that can no longer be stored.
+        """
+        stop = threading.Event()
+
+        def evaluate(group):
+            s1 = self._run_stage1_group(group)
+            outcomes = []
+            emitted = [0]
+
+            def budget():
+                return 0 if stop.is_set() else limit - self.processed_count - emitted[0]
+
+            def emit(*mapping):
+                pending.append(mapping)
+                emitted[0] += 1
+
+            for p, candidate_ids in group:
+                pending = []
+                complete = self._evaluate_point(p, candidate_ids, s1.get(p['id'], []), mode, filters, budget, emit)
+                outcomes.append((p['id'], complete, pending))
+            return outcomes
+
+        groups = self._stage1_groups(filters, points_per_request)
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cleansing") as executor:
+            def submit_more():
+                # Keep a small look-ahead so a slow point does not idle the other workers.
+                while not stop.is_set() and len(in_flight) < concurrency * 2:
+                    group = next(groups, None)
+                    if group is None: return
+                    in_flight.append(executor.submit(evaluate, group))
+
+            try:
+                submit_more()
+                while in_flight and self.processed_count < limit:
+                    for point_id, complete, pending in in_flight.popleft().result():
+                        stored = 0
+                        for mapping in pending:
+                            if self.processed_count >= limit: break
+                            self._store_mapping(*mapping)
+                            stored += 1
+                        if complete and stored == len(pending):
+                            self._point_completed(point_id)
+                        if self.processed_count >= limit:
+                            break
+                    submit_more()
+            finally:
+                stop.set()
+                for future in in_flight:
+                    future.cancel()
+
+    def _run_stage2_scheduler(self, limit: int, concurrency: int):
+        def store(point, key, res, creature, s2) -> bool:
+            if self.processed_count >= limit:
+                return False
+            self._store_mapping(key, self._mapping_entry(point, creature, res, s2), creature)
+            return True
+
+        done = self.stage2_scheduler.run(self.grounded_verdicts, store, self._stage2_batch_limit, concurrency)
+        for point_id in done:
+            self._point_completed(point_id)
+
+    def _process_leased(self, run_id: str, mode: str, filters: Dict[str, Any], limit: int, claim_size: int,
+                        process_points):
+        """Elastic mode: process whatever the shared work queue leases to this worker, `claim_size` points at a time.
+
+        Each claimed chunk runs through the regular serial / concurrent / pipelined path and is
+        flushed before the next claim, so completed points are marked done only after their
+        mappings are committed. The worker leaves when the queue is drained (waiting while other
+        workers still hold leases, in case they die) or when `--limit` is reached.
+        """
+        scope = {p['id']: p for p in self.points}
+        added = self.work_queue.open(run_id, ProgressJournal.fingerprint(mode, filters), list(scope))
+        logger.info(f"📬 Work queue '{run_id}': worker {self.work_queue.worker_id}, lease "
+                    f"{self.work_queue.lease_seconds:.0f}s" + (f", enqueued {added} points." if added else "."))
+        poll = min(10.0, self.work_queue.lease_seconds / 4)
+        interrupted = True
+        try:
+            with self.work_queue.heartbeat():
+                while self.processed_count < limit:
+                    claimed = self.work_queue.claim(claim_size)
+                    if not claimed:
+                        if not self.work_queue.unfinished():
+                            break
+                        # Everything left is leased by other workers: wait in case one of them dies
+                        time.sleep(poll)
                         continue
+                    # Points that left this worker's scope (e.g. another worker's delta already covered them)
+                    self._awaiting_commit.extend(pid for pid in claimed if pid not in scope)
+                    self.points = [scope[pid] for pid in claimed if pid in scope]
+                    logger.info(f"📬 Claimed {len(claimed)} points ({len(self.points)} in scope).")
+                    process_points()
+                    self.sink.flush()
+                    self._checkpoint(True)
+                    # Whatever is still held failed to complete (write errors, partial points)
+                    self.work_queue.release(claimed, attempted=self.processed_count < limit)
+            interrupted = False
+        finally:
+            self.points = list(scope.values())
+            # Unstarted leftovers (limit reached) or an interrupted chunk go back to the queue right away
+            self.work_queue.release(list(self.work_queue.held), attempted=interrupted)
+            logger.info(f"📬 Work queue stats: {json.dumps(self.work_queue.stats())}")
+
+    def _process_pipelined(self, mode: str, filters: Dict[str, Any], limit: int, stage1_workers: int,
+                           stage2_workers: int, queue_size: int, points_per_request: int):
+        """Stage 1 workers → Stage 2 workers → writer, connected by bounded queues.
+
+        Each stage runs on its own threads, so a slow stage only fills the queue in front of
+        it (backpressure) instead of stalling the others. Mappings are written in completion
+        order, so `--limit` keeps whichever mappings finish first. When the limit is reached,
+        a worker fails or the run is interrupted, producers stop taking new work and
+        everything already queued is drained and written before returning.
+        """
+        stop = threading.Event()
+        groups = self._stage1_groups(filters, points_per_request)
+        groups_lock = threading.Lock()
+        to_stage2 = PipelineQueue("stage2", queue_size)
+        to_writer = PipelineQueue("writer", max(queue_size, BatchSink.MAX_BATCH_SIZE))
+        done = object()
+        errors = []
+        busy = {"stage1": 0.0, "stage2": 0.0, "writer": 0.0}
+        counters_lock = threading.Lock()
+        emitted = [0]
+
+        def fail(e):
+            logger.error(f"❌ Pipeline worker failed: {e}")
+            errors.append(e)
+            stop.set()
 
-                    key = f"{p['id']}_{creature_id}"
+        def add_busy(stage, started):
+            with counters_lock:
+                busy[stage] += time.monotonic() - started
 
-                    # Check existence in Firestore if mode is 'new'
-                    if mode == "new":
-                        existing = self.db.collection('point_creatures').document(key).get()
-                        if existing.exists:
-                            logger.debug(f"  ⏭️ Skipping existing: {creature_id}")
+        def stage1_worker():
+            try:
+                while not stop.is_set():
+                    with groups_lock:
+                        group = next(groups, None)
+                    if group is None:
+                        break
+                    # Single points come back as unstarted streams: they are handed to Stage 2 first,
+                    # so it starts on the first elements while this worker runs the requests
+                    started = time.monotonic()
+                    s1 = self._run_stage1_group(group, start=False)
+                    add_busy("stage1", started)
+                    for p, candidate_ids in group:
+                        to_stage2.put((p, candidate_ids, s1.get(p['id'], [])))
+                    for results in s1.values():
+                        if not isinstance(results, Stage1Stream):
+                            continue
+                        if stop.is_set():
+                            # A Stage 2 worker may already be waiting on it
+                            results.cancel()
                             continue
+                        started = time.monotonic()
+                        results.run()
+                        add_busy("stage1", started)
+            except Exception as e:
+                fail(e)
+
+        def budget():
+            with counters_lock:
+                return 0 if stop.is_set() else limit - emitted[0]
+
+        def stage2_worker():
+            while True:
+                item = to_stage2.get()
+                if item is done:
+                    break
+                if stop.is_set():
+                    continue
+                p, candidate_ids, s1 = item
+                count = [0]
+
+                def emit(*mapping):
+                    with counters_lock:
+                        emitted[0] += 1
+                    count[0] += 1
+                    to_writer.put(mapping)
+
+                started = time.monotonic()
+                try:
+                    complete = self._evaluate_point(p, candidate_ids, s1, mode, filters, budget, emit)
+                except Exception as e:
+                    fail(e)
+                    complete = False
+                add_busy("stage2", started)
+                to_writer.put((done, p['id'], complete, count[0]))
+            to_writer.put(done)
+
+        stage1_threads = [threading.Thread(target=stage1_worker, name=f"pipeline-stage1-{i}", daemon=True)
+                          for i in range(stage1_workers)]
+        stage2_threads = [threading.Thread(target=stage2_worker, name=f"pipeline-stage2-{i}", daemon=True)
+                          for i in range(stage2_workers)]
+        for thread in stage1_threads + stage2_threads:
+            thread.start()
+
+        def close_stage1():
+            for thread in stage1_threads:
+                thread.join()
+            for _ in stage2_threads:
+                to_stage2.put(done)
+
+        closer = threading.Thread(target=close_stage1, name="pipeline-stage1-close", daemon=True)
+        closer.start()
+
+        # The writer runs on the calling thread; it ends once every Stage 2 worker has finished
+        logger.info(f"🏭 Pipelined mode: {stage1_workers} Stage 1 workers → {stage2_workers} Stage 2 workers → writer "
+                    f"(queue size {queue_size}).")
+        stored_per_point: Dict[str, int] = {}
+        remaining_workers = len(stage2_threads)
+        try:
+            while remaining_workers:
+                item = to_writer.get()
+                if item is done:
+                    remaining_workers -= 1
+                    continue
+                if item[0] is done:
+                    _, point_id, complete, count = item
+                    if complete and stored_per_point.pop(point_id, 0) == count:
+                        self._point_completed(point_id)
+                    continue
+                if self.processed_count >= limit:
+                    stop.set()
+                    continue
+                started = time.monotonic()
+                self._store_mapping(*item)
+                add_busy("writer", started)
+                point_id = item[1]['pointId']
+                stored_per_point[point_id] = stored_per_point.get(point_id, 0) + 1
+                if self.processed_count >= limit:
+                    stop.set()
+        except BaseException:
+            # Interrupted: stop producers, but keep draining so the workers can exit
+            stop.set()
+            while remaining_workers:
+                item = to_writer.get()
+                if item is done:
+                    remaining_workers -= 1
+                elif item[0] is not done and self.processed_count < limit:
+                    self._store_mapping(*item)
+            raise
+        finally:
+            self.pipeline_stats = {
+                "queues": {q.name: q.stats() for q in (to_stage2, to_writer)},
+                "busySeconds": {stage: round(seconds, 3) for stage, seconds in busy.items()},
+                "workers": {"stage1": stage1_workers, "stage2": stage2_workers},
+            }
+            logger.info(f"🏭 Pipeline stats: {json.dumps(self.pipeline_stats)}")
+        closer.join()
+        if errors:
+            raise errors[0]
+
+    def process(self, mode: str, filters: Dict[str, Any], limit: int, concurrency: int = 1,
+                sink: str = "batch", flush_interval: float = 5.0, min_habitat_score: float = 0.0,
+                shard_index: int = 0, shard_count: int = 1, run_id: Optional[str] = None, resume: bool = False,
+                points_per_request: int = 1, stage1_shard_concurrency: int = 4, area_grounding: str = "off",
+                stage2_batch_size: int = 1, metrics_out: Optional[str] = None, stage2_budget: Optional[str] = None,
+                max_inflight: int = 32, max_attempts: int = 5, stage1_model: Optional[str] = None,
+                escalation_share: float = 0.3, pipeline: bool = False, stage2_workers: int = 0, queue_size: int = 0,
+                point_order: str = "natural", claim_size: int = 0):
+        self.processed_count = 0
+        self.metrics = GenAIMetrics()
+        self.stage2_scheduler = None
+        self._delta = None
+        self.pipeline_stats = None
+        self.stage1_router = None
+        if stage1_model and stage1_model != self.model_name:
+            self.stage1_router = Stage1Router(stage1_model, self.model_name, escalation_share)
+        # Gemini calls in flight adapt to quota feedback, starting from the point concurrency
+        self.limiter = AdaptiveConcurrencyLimiter(initial=concurrency, maximum=max_inflight)
+        self.retry_policy = RetryPolicy(max_attempts=max_attempts)
+        self._stage1_results_avg = float(self.STAGE1_EXPECTED_RESULTS)
+        self._stage1_hit_ratio = 0.5
+        self.stage2_batch_size = stage2_batch_size
+        self._stage2_tokens_per_item = float(self.STAGE2_TOKENS_PER_ITEM)
+        self.stage1_executor = ThreadPoolExecutor(max_workers=stage1_shard_concurrency, thread_name_prefix="stage1-shard")
+        self.sink = SINKS[sink](self.db, flush_interval=flush_interval)
+        self._awaiting_commit = []
+        self._awaiting_store = []
+        if shard_count > 1:
+            # Split --limit across shards so the whole run still stores at most `limit` mappings.
+            limit = limit // shard_count + (1 if shard_index < limit % shard_count else 0)
+        try:
+            self.load_data(filters)
+            if shard_count > 1:
+                self.apply_shard(shard_index, shard_count)
+            if self.journal:
+                self._open_journal(run_id, mode, filters, resume)
+            if self.delta_state:
+                self._plan_delta(filters, shard_index, shard_count, run_id)
+            self.sink.on_commit = self._on_commit
+            if point_order == "priority":
+                self.prioritize_points()
+            self.prefilter = HabitatPreFilter(self.creatures, min_habitat_score) if min_habitat_score > 0 else None
+            if area_grounding != "off":
+                self.area_planner = AreaGroundingPlanner(self.points, confirm_ambiguous=(area_grounding == "confirm"))
+            if stage2_budget:
+                max_calls, max_seconds = Stage2Scheduler.parse_budget(stage2_budget)
+                self.stage2_scheduler = Stage2Scheduler(self.points, max_calls=max_calls, max_seconds=max_seconds)
+            self.create_context_cache()
+            if self.stage1_router:
+                self.create_context_cache(self.stage1_router.cheap_model)
 
-                    creature = next((c for c in self.creatures if c['id'] == creature_id), None)
-                    if not creature:
-                        raise ValueError(f"Creature ID '{creature_id}' returned by AI was NOT found in the biological dictionary. AI may be hallucinating IDs.")
-
-                    # Stage 2: Fact-check with Grounding (Only if Stage 1 is unsure)
-                    if res.get("confidence", 0) >= 0.85:
-                        logger.info(f"  ✨ AI is confident ({res.get('confidence')}) for {creature['name']}. Saving without search.")
-                        s2 = {
-                            "actual_existence": True,
-                            "evidence": res.get("reasoning"),
-                            "rarity": res.get("rarity")
-                        }
-                    else:
-                        logger.info(f"  🌐 AI is unsure. Running Google Search Grounding: {creature['name']}...")
-                        s2 = self.run_stage2_grounding(p, creature)
-
-                    # Save result to Firestore
-                    status = "pending" if s2.get("actual_existence") else "rejected"
-                    raw_rarity = s2.get("rarity") or res.get("rarity") or "Rare"
-                    local_rarity = self._normalize_rarity(raw_rarity)
-
-                    # Final check: if rejected but high confidence in S1, maybe it's just 'Rare'
-                    if status == "rejected" and res.get("confidence", 0) > 0.8:
-                        logger.info(f"  💡 High confidence S1 result kept as 'pending' despite no web evidence.")
-                        status = "pending"
-
-                    new_entry = {
-                        "pointId": p['id'],
-                        "creatureId": creature['id'],
-                        "localRarity": local_rarity,
-                        "status": status,
-                        "reasoning": s2.get("evidence") or res.get("reasoning"),
-                        "confidence": (res.get("confidence", 0.5) + (0.3 if s2.get("actual_existence") else 0)) / 1.3,
-                        "updatedAt": firestore.SERVER_TIMESTAMP,
-                        "method": "python-batch-v1"
-                    }
-
-                    self.db.collection('point_creatures').document(key).set(new_entry)
-                    logger.info(f"  🚀 [STORED] key={key} | {creature['name']} ({creature_id}) -> status:{status}")
-                    processed_count += 1
-
-                    # Small sleep to be nice to API quotas (adjust as needed)
-                    time.sleep(0.5)
+            stage2_workers = stage2_workers or concurrency
+
+            def process_points():
+                if pipeline:
+                    self._process_pipelined(mode, filters, limit, concurrency, stage2_workers,
+                                            queue_size or 2 * stage2_workers, points_per_request)
+                elif concurrency > 1:
+                    self._process_concurrent(mode, filters, limit, concurrency, points_per_request)
+                else:
+                    self._process_serial(mode, filters, limit, points_per_request)
+
+            if concurrency > 1 and not pipeline:
+                logger.info(f"⚡ Concurrent mode: up to {concurrency} points in flight.")
+            if self.work_queue:
+                # Enough points per claim to keep every worker thread (and packed requests) busy
+                claim_size = claim_size or max(4, 2 * concurrency * points_per_request)
+                self._process_leased(run_id, mode, filters, limit, claim_size, process_points)
+            else:
+                process_points()
+            if self.stage2_scheduler:
+                self._run_stage2_scheduler(limit, concurrency)
 
         finally:
+            self.stage1_executor.shutdown(wait=False, cancel_futures=True)
+            self.stage1_executor = None
+            self.sink.close()
+            if self.journal or self._delta or self.work_queue:
+                self._checkpoint(True)
             self.cleanup_cache()
 
-        logger.info(f"🏁 Finished. Processed {processed_count} mappings.")
+        logger.info(f"🏁 Finished. Processed {self.processed_count} mappings "
+                    f"(committed: {self.sink.committed}, failed: {self.sink.failed}).")
+        if self._delta:
+            self._advance_delta()
+        if self.grounding_cache:
+            logger.info(f"📦 Grounding cache: {self.grounding_cache.hits} hits, {self.grounding_cache.misses} misses.")
+        if self.area_planner:
+            logger.info(f"🗺️ Area grounding: {self.area_planner.queries} area queries, {self.area_planner.reused} reused, "
+                        f"{self.area_planner.confirmations} per-point confirmations.")
+        if self.stage2_scheduler:
+            logger.info(f"🎯 Stage 2 scheduler: {self.stage2_scheduler.verified}/{self.stage2_scheduler.queued} "
+                        f"uncertain creatures verified within the budget.")
+        logger.info(f"🚦 In-flight limit: {json.dumps(self.limiter.stats())}")
+        metrics = self.metrics.summary(self.run_summary())
+        if self.stage1_router:
+            routing = self.stage1_router.summary(metrics)
+            metrics["run"]["stage1Routing"] = routing
+            logger.info(f"🪜 Model routing: {json.dumps(routing)}")
+        logger.info(f"📊 Metrics: {json.dumps(metrics['totals'])}")
+        if metrics_out:
+            self.metrics.write(metrics_out, metrics["run"])
+            logger.info(f"📊 Metrics summary written to {metrics_out}")
+
+        if shard_count > 1 and run_id:
+            self.report_shard_summary(run_id, shard_index, shard_count)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="WeDive AI Cleansing Pipeline (Bulk / Specific)")
@@ -395,19 +3142,76 @@ if __name__ == "__main__":
     parser.add_argument("--region", help="Filter points by region")
     parser.add_argument("--zone", help="Filter points by zone")
     parser.add_argument("--area", help="Filter points by area")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of points evaluated in parallel (1 = serial)")
+    parser.add_argument("--sink", choices=list(SINKS), default="batch", help="direct: one write per mapping, batch: WriteBatch of up to 500 (default; was direct), bulk: BulkWriter (parallel commits). Mappings are logged as [QUEUED] when written to the sink and as [STORED] once committed")
+    parser.add_argument("--max-inflight", type=int, default=32, help="Upper bound of Gemini calls in flight. The actual limit starts at --concurrency, grows while calls succeed and halves on 429 / RESOURCE_EXHAUSTED")
+    parser.add_argument("--max-attempts", type=int, default=5, help="Attempts per Gemini call on 429 / transient errors (jittered exponential backoff)")
+    parser.add_argument("--pipeline", action="store_true", help="Run Stage 1 (--concurrency workers), Stage 2 (--stage2-workers) and writes as separate stages connected by bounded queues. Mappings are written in completion order")
+    parser.add_argument("--stage2-workers", type=int, default=0, help="Stage 2 workers with --pipeline (default: --concurrency)")
+    parser.add_argument("--queue-size", type=int, default=0, help="Capacity of the Stage 1 → Stage 2 queue with --pipeline (default: 2 x --stage2-workers)")
+    parser.add_argument("--point-order", choices=["natural", "priority"], default="natural", help="priority: process stale (or never processed), bookmarked points with few approved mappings first, so --limit fills the most visible gaps. Costs one read per existing mapping in scope")
+    parser.add_argument("--points-per-request", type=int, default=1, help="Max points of the same area packed into one Stage 1 request (batch size also bounded by the output-token budget)")
+    parser.add_argument("--stage1-shard-concurrency", type=int, default=4, help="Parallel Stage 1 requests per point when the creature list is split into shards")
+    parser.add_argument("--min-habitat-score", type=float, default=0.0, help="Habitat pre-filter threshold before Stage 1, e.g. 0.35 (0 = disabled)")
+    parser.add_argument("--stage2-batch-size", type=int, default=1, help="Max uncertain creatures of a point verified in one grounded Stage 2 request (default 1 = one request per creature; also bounded by the output-token budget)")
+    parser.add_argument("--area-grounding", choices=["confirm", "reuse", "off"], default="off", help="Share one Stage 2 query per (area, creature) among sibling points. off: per-point queries only, confirm: re-check per point when the area verdict is 'localized', reuse: always apply the area verdict")
+    parser.add_argument("--model-routing", choices=["tiered", "off"], default="off", help="off: main model only, tiered: run Stage 1 on --stage1-model first and escalate ambiguous / invalid answers to the main model")
+    parser.add_argument("--stage1-model", default="gemini-2.0-flash-lite-001", help="Cheap model tried first for Stage 1 with --model-routing tiered")
+    parser.add_argument("--escalation-share", type=float, default=0.3, help="Escalate a point when more than this share of its possible creatures has a confidence in the ambiguous band (0.5-0.85)")
+    parser.add_argument("--stage2-budget", help="Verify uncertain creatures of the whole run in priority order (confidence near the threshold, creature popularity, point bookmarks) within this budget: a number of grounded requests (e.g. 500) or a duration (e.g. 90s, 30m, 2h)")
+    parser.add_argument("--grounding-cache", choices=["firestore", "sqlite", "none"], default="none", help="Where Stage 2 verdicts are cached between runs (default: not cached)")
+    parser.add_argument("--grounding-cache-path", default=os.path.join(DEFAULT_CACHE_DIR, "grounding_cache.sqlite"), help="SQLite file for --grounding-cache sqlite")
+    parser.add_argument("--grounding-ttl-days", type=float, default=30, help="How long cached Stage 2 verdicts stay valid")
+    parser.add_argument("--cache-ttl", type=int, default=3 * 3600, help="TTL in seconds of the reusable creature context cache")
+    parser.add_argument("--delete-cache", action="store_true", help="Delete the context cache when the run finishes instead of keeping it for reuse")
+    parser.add_argument("--metrics-out", help="Write token/cost/latency metrics of the run to this file (Prometheus text if it ends in .prom, JSON otherwise)")
+    parser.add_argument("--flush-interval", type=float, default=5.0, help="Seconds before buffered writes are flushed (batch/bulk sinks)")
 
+    parser.add_argument("--shard-index", type=int, default=int(os.environ.get("CLOUD_RUN_TASK_INDEX", 0)), help="This task's shard (default: CLOUD_RUN_TASK_INDEX)")
+    parser.add_argument("--shard-count", type=int, default=int(os.environ.get("CLOUD_RUN_TASK_COUNT", 1)), help="Total number of shards (default: CLOUD_RUN_TASK_COUNT)")
+    parser.add_argument("--run-id", default=os.environ.get("CLOUD_RUN_EXECUTION"), help="ID under which shard summaries are merged (default: CLOUD_RUN_EXECUTION)")
+
+    parser.add_argument("--resume", metavar="RUN_ID", help="Resume an interrupted run, skipping points it already completed")
+    parser.add_argument("--journal", choices=["firestore", "file", "none"], default="none", help="Where completed points are recorded so the run can be resumed (needed by --resume; default: not recorded)")
+    parser.add_argument("--work-queue", choices=["firestore", "sqlite", "none"], default="none", help="Elastic mode instead of static sharding: points in scope are enqueued once per --run-id and every worker started with the same --run-id claims them under time-limited leases. Workers can join or leave mid-run; leases of dead workers expire and are claimed again. Ignores --shard-index / --shard-count; --limit applies per worker")
+    parser.add_argument("--work-queue-path", default=os.path.join(DEFAULT_CACHE_DIR, "work_queue.sqlite"), help="SQLite file shared by the local workers of --work-queue sqlite")
+    parser.add_argument("--lease-seconds", type=float, default=600, help="Lease of claimed points with --work-queue (renewed every third of it while the worker is alive)")
+    parser.add_argument("--claim-size", type=int, default=0, help="Points claimed at a time with --work-queue (default: 2 x --concurrency x --points-per-request, at least 4)")
+    parser.add_argument("--worker-id", help="Name of this worker in the work queue (default: host-pid-random)")
+    parser.add_argument("--delta", choices=["firestore", "file", "none"], default="none", help="Incremental cleansing: only points changed since the last delta run of the same filters (against all creatures) plus new/changed creatures (against all points). Value = where the fingerprints and watermark are kept")
+    parser.add_argument("--genai", choices=["vertex", "record", "replay"], default="vertex", help="vertex: live calls, record: live calls saved to --fixtures, replay: answer from --fixtures without network")
+    parser.add_argument("--fixtures", default=os.path.join(DEFAULT_CACHE_DIR, "genai_fixtures.jsonl"), help="Recorded Gemini responses for --genai record / replay")
+    parser.add_argument("--replay-latency", type=float, default=0.0, help="Seconds added to every replayed Gemini call")
+    parser.add_argument("--replay-error-rate", type=float, default=0.0, help="Probability that a replayed Gemini call fails (error injection)")
+    parser.add_argument("--firestore", choices=["live", "memory"], default="live", help="memory: in-process Firestore filled from --seed-dir (nothing is written to the project)")
+    parser.add_argument("--seed-dir", default=DEFAULT_SEED_DIR, help="Directory with creatures_seed.json / locations_seed.json for --firestore memory")
     parser.add_argument("--project", help="Firebase Project ID")
     args = parser.parse_args()
+    if args.stage2_budget:
+        try:
+            Stage2Scheduler.parse_budget(args.stage2_budget)
+        except ValueError:
+            parser.error(f"--stage2-budget must be a number of requests or a duration like 90s / 30m / 2h: {args.stage2_budget}")
+    if args.resume and args.journal == "none":
+        parser.error("--resume needs the --journal (firestore / file) the interrupted run was started with")
+    if args.work_queue != "none":
+        # Replaces static sharding: every task (e.g. all CLOUD_RUN_TASK_COUNT tasks) draws from the same queue
+        args.shard_index, args.shard_count = 0, 1
+        if args.stage2_budget:
+            parser.error("--stage2-budget needs the whole scope in one worker and cannot be combined with --work-queue")
+        if not (args.run_id or args.resume):
+            parser.error("--work-queue needs a --run-id shared by all workers (CLOUD_RUN_EXECUTION on Cloud Run)")
+    offline = args.genai == "replay" and args.firestore == "memory"
 
     # Priority: 1. CLI Arg, 2. Env Var
     if args.project:
         PROJECT_ID = args.project
 
-    if not PROJECT_ID:
+    if not PROJECT_ID and not offline:
         print("❌ FATAL: PROJECT_ID is not set. Checked: GCLOUD_PROJECT (env) or --project (arg)", flush=True)
         sys.exit(1)
 
-    if not LOCATION:
+    if not LOCATION and not offline:
         print("❌ FATAL: LOCATION is not set. Checked: LOCATION, AI_AGENT_LOCATION", flush=True)
         sys.exit(1)
 
@@ -428,5 +3232,49 @@ if __name__ == "__main__":
         "area": args.area
     }
 
-    pipeline = CleansingPipeline()
-    pipeline.process(mode=args.mode, filters=filters, limit=args.limit)
+    run_id = args.resume or args.run_id or datetime.now(timezone.utc).strftime("run-%Y%m%d-%H%M%S")
+
+    client = db = None
+    if args.genai == "replay":
+        from common.genai_replay import FixtureStore, ReplayClient
+        client = ReplayClient(FixtureStore(args.fixtures), latency=args.replay_latency, error_rate=args.replay_error_rate)
+        logger.info(f"📼 Replaying {len(client.store)} recorded Gemini responses from {args.fixtures}")
+    if args.firestore == "memory":
+        from common.memory_firestore import MemoryFirestore, load_seed
+        db = MemoryFirestore()
+        logger.info(f"🧪 In-memory Firestore seeded from {args.seed_dir}: {json.dumps(load_seed(db, args.seed_dir))}")
+
+    pipeline = CleansingPipeline(client=client, db=db)
+    if args.genai == "record":
+        from common.genai_replay import FixtureStore, RecordingClient
+        pipeline.client = RecordingClient(pipeline.client, FixtureStore(args.fixtures))
+        logger.info(f"📼 Recording Gemini responses to {args.fixtures}")
+    if args.journal == "firestore":
+        pipeline.journal = FirestoreProgressJournal(pipeline.db)
+    elif args.journal == "file":
+        pipeline.journal = LocalProgressJournal(DEFAULT_CACHE_DIR)
+    if args.work_queue == "firestore":
+        pipeline.work_queue = FirestoreWorkQueue(pipeline.db, args.lease_seconds, args.worker_id)
+    elif args.work_queue == "sqlite":
+        pipeline.work_queue = SQLiteWorkQueue(args.work_queue_path, args.lease_seconds, args.worker_id)
+    if args.delta == "firestore":
+        pipeline.delta_state = FirestoreDeltaState(pipeline.db)
+    elif args.delta == "file":
+        pipeline.delta_state = LocalDeltaState(DEFAULT_CACHE_DIR)
+    pipeline.cache_ttl = args.cache_ttl
+    pipeline.delete_cache = args.delete_cache
+    if args.grounding_cache == "firestore":
+        pipeline.grounding_cache = FirestoreGroundingCache(pipeline.db, args.grounding_ttl_days)
+    elif args.grounding_cache == "sqlite":
+        pipeline.grounding_cache = SQLiteGroundingCache(args.grounding_cache_path, args.grounding_ttl_days)
+    pipeline.process(mode=args.mode, filters=filters, limit=args.limit, concurrency=args.concurrency,
+                     sink=args.sink, flush_interval=args.flush_interval, min_habitat_score=args.min_habitat_score,
+                     shard_index=args.shard_index, shard_count=args.shard_count,
+                     run_id=run_id, resume=bool(args.resume), points_per_request=args.points_per_request,
+                     stage1_shard_concurrency=args.stage1_shard_concurrency, area_grounding=args.area_grounding,
+                     stage2_batch_size=args.stage2_batch_size, metrics_out=args.metrics_out,
+                     stage2_budget=args.stage2_budget, max_inflight=args.max_inflight, max_attempts=args.max_attempts,
+                     stage1_model=args.stage1_model if args.model_routing == "tiered" else None,
+                     escalation_share=args.escalation_share, pipeline=args.pipeline,
+                     stage2_workers=args.stage2_workers, queue_size=args.queue_size, point_order=args.point_order,
+                     claim_size=args.claim_size)
@@ -0,0 +1,147 @@
+"""AIMD concurrency limiting and bounded retries for quota-limited API calls (e.g. Vertex AI Gemini).
+
+`AdaptiveConcurrencyLimiter` caps the number of calls in flight. The cap grows additively
+while calls succeed and is cut multiplicatively when the API reports 429 / RESOURCE_EXHAUSTED,
+so callers converge on the highest rate the quota allows. `RetryPolicy` retries throttled and
+transiently failing calls with jittered exponential backoff under a fixed attempt budget.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+THROTTLE_MARKERS = ("429", "resource_exhausted", "resource exhausted", "quota", "rate limit")
+TRANSIENT_MARKERS = ("503", "unavailable", "deadline_exceeded", "deadline exceeded", "500 internal")
+
+
+def is_throttled(error: BaseException) -> bool:
+    """True for quota / rate-limit errors (HTTP 429, gRPC RESOURCE_EXHAUSTED)."""
+    if getattr(error, "code", None) == 429:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in THROTTLE_MARKERS)
+
+
+def is_transient(error: BaseException) -> bool:
+    """True for errors worth retrying: throttling plus 5xx / deadline failures."""
+    if is_throttled(error) or getattr(error, "code", None) in (500, 503, 504):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Additive-increase / multiplicative-decrease limit on concurrent calls.
+
+    Every successful call raises the limit by `increase / limit` (about +`increase` per round
+    of `limit` calls); a throttled call multiplies it by `decrease`. Decreases are applied at
+    most once per `cooldown` seconds, because a burst of 429s usually reports one overload.
+    """
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32,
+                 increase: float = 1.0, decrease: float = 0.5, cooldown: float = 2.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._limit = float(min(max(initial, self.minimum), self.maximum))
+        self._in_flight = 0
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+        self.successes = 0
+        self.throttled = 0
+        self.decreases = 0
+        self.peak_limit = int(self._limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self):
+        with self._cond:
+            self.successes += 1
+            if self._limit < self.maximum:
+                self._limit = min(self.maximum, self._limit + self.increase / self._limit)
+                self.peak_limit = max(self.peak_limit, int(self._limit))
+                self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self.throttled += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self._limit = max(self.minimum, self._limit * self.decrease)
+                self.decreases += 1
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "peakLimit": self.peak_limit, "successes": self.successes,
+                "throttled": self.throttled, "decreases": self.decreases}
+
+
+class RetryPolicy:
+    """Jittered exponential backoff ("full jitter") under a bounded number of attempts."""
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 seed: Optional[int] = None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, attempt: int) -> float:
+        """Sleep before retry number `attempt` (1-based): uniform in [0, min(max_delay, base * 2^(attempt-1))]."""
+        with self._lock:
+            return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def call(self, fn: Callable[[], T], limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+             retryable: Callable[[BaseException], bool] = is_transient,
+             on_retry: Optional[Callable[[BaseException, int, float], None]] = None) -> T:
+        """Run `fn` (inside a limiter slot, if given) until it succeeds or the attempts are used up.
+
+        Throttled failures also shrink the limiter. `on_retry(error, attempt, delay)` is called
+        before each backoff sleep. The last error is re-raised.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if limiter is None:
+                    return fn()
+                with limiter.slot():
+                    result = fn()
+                limiter.on_success()
+                return result
+            except Exception as e:
+                if limiter is not None and is_throttled(e):
+                    limiter.on_throttle()
+                if attempt >= self.max_attempts or not retryable(e):
+                    raise
+                delay = self.delay(attempt)
+                if on_retry:
+                    on_retry(e, attempt, delay)
+                time.sleep(delay)
@@ -0,0 +1,181 @@
+"""Thread-safe pool of Gemini API (key, model) resources shared by the data-generation scripts.
+
+`GOOGLE_API_KEY` may hold several comma-separated keys. Every key is paired with every model
+of `DEFAULT_MODELS` (earlier models are preferred), and each (key, model) resource serves one
+request at a time. Concurrent callers therefore run on different keys at once, so N keys give
+close to N x the throughput of a single key. A resource that answers 429 is stopped for
+`QUOTA_STOP_SECONDS`, a model that does not exist is dropped, and after a success a resource
+rests for `success_pause` seconds before its next request (per-key pacing).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+from google import genai
+
+from common.adaptive_limiter import is_throttled
+from common.json_stream import parse_json_response
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Priority order: Flash > Flash-Lite
+DEFAULT_MODELS = ("gemini-2.5-flash", "gemini-2.5-flash-lite")
+QUOTA_STOP_SECONDS = 65
+
+
+def load_api_keys(env: str = "GOOGLE_API_KEY") -> List[str]:
+    """Comma-separated keys from the environment; raises ValueError when there are none."""
+    keys = [key.strip() for key in os.environ.get(env, "").split(",") if key.strip()]
+    if not keys:
+        raise ValueError(f"{env} environment variable is not set.")
+    return keys
+
+
+class APIResource:
+    def __init__(self, api_key: str, key_index: int, model_name: str, priority: int):
+        self.api_key = api_key
+        self.key_index = key_index
+        self.model_name = model_name
+        self.priority = priority
+        self.status = 'stand-by'  # 'stand-by' | 'active' | 'stop'
+        self.quota_exceed_dt = 0.0
+        self.ready_at = 0.0
+        self.last_used = 0.0
+
+    @property
+    def label(self) -> str:
+        return f"{self.model_name} (Key #{self.key_index})"
+
+
+class ResourcePool:
+    """Hands out the best free (key, model) resource to any number of threads.
+
+    `generate` runs one prompt with retries; `map` runs a function over many items on one
+    thread per key, so every key is busy at the same time.
+    """
+    def __init__(self, api_keys: Sequence[str], models: Sequence[str] = DEFAULT_MODELS,
+                 success_pause: float = 5.0, error_pause: float = 1.0, max_attempts: int = 5,
+                 client_factory: Optional[Callable[[str], Any]] = None):
+        self.api_keys = list(api_keys)
+        self.success_pause = success_pause
+        self.error_pause = error_pause
+        self.max_attempts = max_attempts
+        self.resources: List[APIResource] = [
+            APIResource(key, index + 1, model, priority)
+            for priority, model in enumerate(models, start=1)
+            for index, key in enumerate(self.api_keys)
+        ]
+        self._client_factory = client_factory or (lambda key: genai.Client(api_key=key))
+        self._clients = {}
+        self._cond = threading.Condition()
+        self._waiting_logged = 0.0
+
+    @classmethod
+    def from_env(cls, env: str = "GOOGLE_API_KEY", **kwargs) -> "ResourcePool":
+        return cls(load_api_keys(env), **kwargs)
+
+    def client(self, resource: APIResource):
+        with self._cond:
+            if resource.api_key not in self._clients:
+                self._clients[resource.api_key] = self._client_factory(resource.api_key)
+            return self._clients[resource.api_key]
+
+    def acquire(self) -> Optional[APIResource]:
+        """Block until a resource is free and mark it active. None once every model was dropped."""
+        with self._cond:
+            while True:
+                if not self.resources:
+                    return None
+                now = time.time()
+                for r in self.resources:
+                    if r.status == 'stop' and now - r.quota_exceed_dt > QUOTA_STOP_SECONDS:
+                        r.status = 'stand-by'
+                        r.quota_exceed_dt = 0.0
+                candidates = [r for r in self.resources if r.status == 'stand-by']
+                if candidates:
+                    # Best model first; among equals the one resting the shortest, then the least recently used key
+                    best = min(candidates, key=lambda r: (r.priority, max(r.ready_at - now, 0), r.last_used))
+                    best.status = 'active'
+                    break
+                stopped = [r for r in self.resources if r.status == 'stop']
+                if stopped and len(stopped) == len(self.resources):
+                    wait_seconds = min(r.quota_exceed_dt for r in stopped) + QUOTA_STOP_SECONDS - now
+                    if now - self._waiting_logged > 10:
+                        self._waiting_logged = now
+                        print(f"    ⏳ All resources exhausted. Waiting {wait_seconds:.1f}s for rate limit release...")
+                    self._cond.wait(timeout=max(wait_seconds, 0) + 1)
+                else:
+                    # Everything else is in use: wait for a release (or a stop to expire)
+                    timers = [r.quota_exceed_dt + QUOTA_STOP_SECONDS - now for r in stopped]
+                    self._cond.wait(timeout=max(min(timers), 0) + 0.1 if timers else None)
+        rest = best.ready_at - time.time()
+        if rest > 0:
+            time.sleep(rest)
+        return best
+
+    def release(self, resource: APIResource, error: Optional[BaseException] = None):
+        """Return a resource after a request; `error` decides whether it is paused, stopped or dropped."""
+        with self._cond:
+            now = time.time()
+            resource.last_used = now
+            if error is None:
+                resource.status = 'stand-by'
+                resource.ready_at = now + self.success_pause
+            elif is_throttled(error):
+                print(f"    ⚠️ Quota exceeded (429): {resource.model_name} (Key ends {resource.api_key[-4:]})")
+                resource.status = 'stop'
+                resource.quota_exceed_dt = now
+            elif "404" in str(error) or "not found" in str(error).lower():
+                print(f"    ℹ️ Model {resource.model_name} not found. Removing from pool.")
+                self.resources = [r for r in self.resources if r.model_name != resource.model_name]
+            else:
+                print(f"    ❌ Error with {resource.model_name}: {error}")
+                resource.status = 'stand-by'
+                resource.ready_at = now + self.error_pause
+            self._cond.notify_all()
+
+    def generate(self, prompt: str, parse: Callable[[str], Any] = parse_json_response,
+                 accept: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Run `prompt` on the best free resource and return `parse(response.text)`.
+
+        Quota errors move on to other resources without using an attempt; other errors and
+        results rejected by `accept` are retried up to `max_attempts` times. Returns [] when
+        every attempt failed or no model is left.
+        """
+        attempts = 0
+        while attempts < self.max_attempts:
+            resource = self.acquire()
+            if resource is None:
+                print("    ❌ All resources invalid/stopped. Aborting.")
+                return []
+            try:
+                response = self.client(resource).models.generate_content(model=resource.model_name, contents=prompt)
+                result = parse(response.text)
+                if accept is not None and not accept(result):
+                    raise ValueError("Empty or invalid result")
+            except Exception as e:
+                self.release(resource, e)
+                if not is_throttled(e):
+                    attempts += 1
+                continue
+            self.release(resource)
+            print(f"    ✅ Success with {resource.label}")
+            return result
+        print(f"    ❌ Giving up after {attempts} failed attempts.")
+        return []
+
+    def map(self, fn: Callable[[T], R], items: Iterable[T], workers: Optional[int] = None) -> Iterator[R]:
+        """`fn` over `items` on `workers` threads (default: one per key); results come back in input order.
+
+        If the caller stops early (break, exception), items not started yet are cancelled so they
+        do not spend quota; only the requests already running are waited for.
+        """
+        workers = workers or len(self.api_keys)
+        executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="gemini-pool")
+        try:
+            yield from executor.map(fn, items)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,242 @@
+"""Record / replay layer for google-genai clients, so Gemini pipelines can run offline.
+
+`RecordingClient` wraps a real `genai.Client` and appends every `generate_content`,
+`generate_content_stream` and `count_tokens` response to a `FixtureStore`.
+`ReplayClient` serves those responses back, keyed by model, contents and config,
+with configurable latency and error injection and an in-memory context cache service.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from google.genai import types
+
+
+class ReplayMissError(KeyError):
+    """No recorded response for a request (and no fallback configured)."""
+
+
+class InjectedError(Exception):
+    """Failure raised on purpose by `ReplayClient` to exercise error handling."""
+
+
+def fixture_key(kind: str, model: str, contents: Any, config: Any = None) -> str:
+    """Stable key of a request. The context cache name is left out: it differs on every run."""
+    if config is None:
+        config = {}
+    elif hasattr(config, "model_dump"):
+        config = config.model_dump(mode="json", exclude_none=True)
+    config = {k: v for k, v in dict(config).items() if k not in ("cached_content", "http_options")}
+    payload = json.dumps({"kind": kind, "model": model, "contents": contents, "config": config},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class FixtureStore:
+    """Recorded responses in a JSON-lines file: one {"key", "kind", "record"} object per line."""
+    def __init__(self, path: str):
+        self.path = path
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._records[entry["key"]] = entry["record"]
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._records.get(key)
+
+    def put(self, key: str, kind: str, record: Dict[str, Any]):
+        with self._lock:
+            self._records[key] = record
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "kind": kind, "record": record}, ensure_ascii=False) + "\n")
+
+
+def _dump(response) -> Dict[str, Any]:
+    return response.model_dump(mode="json", exclude_none=True)
+
+
+class _RecordingModels:
+    def __init__(self, models, store: FixtureStore):
+        self._models = models
+        self._store = store
+
+    def generate_content(self, *, model: str, contents, config=None):
+        response = self._models.generate_content(model=model, contents=contents, config=config)
+        self._store.put(fixture_key("generate", model, contents, config), "generate", {"response": _dump(response)})
+        return response
+
+    def generate_content_stream(self, *, model: str, contents, config=None):
+        chunks = []
+        for chunk in self._models.generate_content_stream(model=model, contents=contents, config=config):
+            chunks.append(_dump(chunk))
+            yield chunk
+        # Only complete streams are recorded
+        self._store.put(fixture_key("generate", model, contents, config), "generate", {"chunks": chunks})
+
+    def count_tokens(self, *, model: str, contents, config=None):
+        response = self._models.count_tokens(model=model, contents=contents, config=config)
+        self._store.put(fixture_key("count_tokens", model, contents), "count_tokens",
+                        {"total_tokens": response.total_tokens})
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class RecordingClient:
+    """Wraps a real client; everything except the recorded calls is passed through."""
+    def __init__(self, client, store: FixtureStore):
+        self._client = client
+        self.models = _RecordingModels(client.models, store)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def _text_response(text: str) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[types.Part(text=text)]),
+        finish_reason=types.FinishReason.STOP,
+    )])
+
+
+class _ReplayModels:
+    def __init__(self, client: "ReplayClient"):
+        self._client = client
+
+    def _record(self, model: str, contents, config) -> Dict[str, Any]:
+        self._client._before_call()
+        record = self._client.store.get(fixture_key("generate", model, contents, config))
+        if record is not None:
+            return record
+        if self._client.fallback is None:
+            raise ReplayMissError(f"No recorded response for this {model} request")
+        with self._client._lock:
+            self._client.misses += 1
+        answer = self._client.fallback(model, contents, config)
+        if not isinstance(answer, types.GenerateContentResponse):
+            answer = _text_response(answer)
+        return {"live": answer}
+
+    def generate_content(self, *, model: str, contents, config=None):
+        record = self._record(model, contents, config)
+        if "live" in record:
+            return record["live"]
+        if "response" in record:
+            return types.GenerateContentResponse.model_validate(record["response"])
+        # Recorded as a stream: join the chunk texts, keep the last chunk's metadata
+        last = types.GenerateContentResponse.model_validate(record["chunks"][-1])
+        text = "".join(types.GenerateContentResponse.model_validate(c).text or "" for c in record["chunks"])
+        response = _text_response(text)
+        response.candidates[0].finish_reason = last.candidates[0].finish_reason if last.candidates else None
+        response.usage_metadata = last.usage_metadata
+        return response
+
+    def generate_content_stream(self, *, model: str, contents, config=None):
+        record = self._record(model, contents, config)
+        if "live" in record:
+            yield record["live"]
+            return
+        chunks = record.get("chunks") or [record["response"]]
+        for chunk in chunks:
+            if self._client.chunk_latency:
+                time.sleep(self._client.chunk_latency)
+            yield types.GenerateContentResponse.model_validate(chunk)
+
+    def count_tokens(self, *, model: str, contents, config=None):
+        self._client._before_call()
+        record = self._client.store.get(fixture_key("count_tokens", model, contents))
+        # Rough estimate for unrecorded requests (about two characters per token)
+        total = record["total_tokens"] if record else len(json.dumps(contents, ensure_ascii=False)) // 2
+        return types.CountTokensResponse(total_tokens=total)
+
+
+class _ReplayCaches:
+    """In-memory context caches with the same create / list / update / delete surface."""
+    def __init__(self):
+        self._caches: Dict[str, types.CachedContent] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _expiry(ttl: Optional[str]) -> datetime:
+        seconds = float(ttl.rstrip("s")) if ttl else 3600
+        return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+    def create(self, *, model: str, config=None):
+        with self._lock:
+            name = f"cachedContents/replay-{len(self._caches) + 1}"
+            cache = types.CachedContent(name=name, model=model, display_name=getattr(config, "display_name", None),
+                                        expire_time=self._expiry(getattr(config, "ttl", None)))
+            self._caches[name] = cache
+            return cache
+
+    def list(self, config=None):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            return [c for c in self._caches.values() if c.expire_time > now]
+
+    def get(self, *, name: str, config=None):
+        return self._caches[name]
+
+    def update(self, *, name: str, config=None):
+        with self._lock:
+            cache = self._caches[name]
+            if getattr(config, "ttl", None):
+                cache.expire_time = self._expiry(config.ttl)
+            return cache
+
+    def delete(self, *, name: str, config=None):
+        with self._lock:
+            self._caches.pop(name, None)
+
+
+class ReplayClient:
+    """Serves recorded responses in place of `genai.Client`.
+
+    latency / jitter: seconds added to every call (uniform jitter on top of `latency`).
+    chunk_latency: seconds between streamed chunks.
+    error_rate: probability that a call raises `InjectedError` instead of answering.
+    fallback: `fallback(model, contents, config)` answers unrecorded requests with a text or a
+    complete GenerateContentResponse; without it they raise `ReplayMissError`.
+    """
+    def __init__(self, store: FixtureStore, latency: float = 0.0, jitter: float = 0.0, chunk_latency: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None,
+                 fallback: Optional[Callable[[str, Any, Any], Any]] = None):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_latency = chunk_latency
+        self.error_rate = error_rate
+        self.fallback = fallback
+        self.calls = 0
+        self.misses = 0
+        self.injected_errors = 0
+        self.models = _ReplayModels(self)
+        self.caches = _ReplayCaches()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _before_call(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+            if fail:
+                self.injected_errors += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise InjectedError("429 RESOURCE_EXHAUSTED (injected by ReplayClient)")
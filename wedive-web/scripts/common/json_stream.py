@@ -0,0 +1,93 @@
+import json
+from typing import Any, Iterable, Iterator, List
+
+
+class JsonArrayStreamParser:
+    """Incremental parser for a top-level JSON array that arrives in chunks (e.g. a streamed Gemini response).
+
+    `feed()` returns every array element that became complete with the given chunk, so
+    callers can act on elements before the response has finished. Anything before the
+    opening `[` (Markdown fences, prose) is ignored, and an element that is cut off by a
+    truncated response is simply never returned.
+    """
+    def __init__(self):
+        self.started = False   # saw the opening '['
+        self.closed = False    # saw the closing ']'
+        self._buf: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        elements = []
+        for ch in chunk:
+            if self.closed:
+                break
+            if not self.started:
+                self.started = ch == '['
+                continue
+
+            if self._in_string:
+                self._buf.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 0 and ch in ',]':
+                # Separator at array level: flush a pending primitive element (numbers, true, ...)
+                pending = ''.join(self._buf).strip()
+                if pending:
+                    elements.append(json.loads(pending))
+                self._buf = []
+                self.closed = ch == ']'
+                continue
+
+            self._buf.append(ch)
+            if ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    elements.append(json.loads(''.join(self._buf)))
+                    self._buf = []
+        return elements
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """Yield the elements of a JSON array as soon as each one is complete in the chunk stream."""
+    parser = JsonArrayStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.closed:
+            return
+
+
+def parse_json_array(text: str) -> List[Any]:
+    """All complete elements of a (possibly truncated) JSON array."""
+    return list(iter_json_array([text]))
+
+
+def parse_json_response(text: str) -> Any:
+    """Parse a model response that should be JSON.
+
+    Arrays go through the incremental parser so a truncated response keeps every complete
+    element; anything else (objects) is parsed strictly after removing Markdown fences.
+    """
+    clean_text = text.strip()
+    if clean_text.startswith("```"):
+        lines = clean_text.splitlines()
+        clean_text = "\n".join(lines[1:-1] if lines[-1].strip().startswith("```") else lines[1:])
+    clean_text = clean_text.strip()
+
+    if clean_text.startswith("["):
+        try:
+            return json.loads(clean_text)
+        except json.JSONDecodeError:
+            return parse_json_array(clean_text)
+    return json.loads(clean_text)
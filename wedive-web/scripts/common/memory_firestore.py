@@ -0,0 +1,389 @@
+"""In-memory stand-in for the parts of the Firestore client used by the scripts.
+
+Covers documents and sub-collections, `where` / `select` / `order_by` / `limit` /
+`start_after` queries, write batches, BulkWriter, the common field transforms
+(SERVER_TIMESTAMP, Increment, Maximum, Minimum, ArrayUnion, ArrayRemove, DELETE_FIELD),
+`create` and `last_update_time` / `exists` write preconditions. Everything
+runs in-process, so pipelines can be exercised and profiled without a network.
+`MemoryFirestore.ops` counts the billable operations (reads, writes, deletes) plus
+queries and commits, for op-per-item measurements.
+"""
+import copy
+import json
+import os
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from google.api_core import exceptions
+from google.cloud.firestore_v1 import transforms
+
+
+def _apply(doc: Dict[str, Any], field: str, value: Any):
+    """Set a (dotted) field, resolving Firestore transforms against the current value."""
+    *parents, leaf = field.split(".")
+    for name in parents:
+        doc = doc.setdefault(name, {})
+    current = doc.get(leaf)
+    if value is transforms.DELETE_FIELD:
+        doc.pop(leaf, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        doc[leaf] = datetime.now(timezone.utc)
+    elif isinstance(value, transforms.Increment):
+        doc[leaf] = (current if isinstance(current, (int, float)) else 0) + value.value
+    elif isinstance(value, transforms.Maximum):
+        doc[leaf] = value.value if not isinstance(current, (int, float)) else max(current, value.value)
+    elif isinstance(value, transforms.Minimum):
+        doc[leaf] = value.value if not isinstance(current, (int, float)) else min(current, value.value)
+    elif isinstance(value, transforms.ArrayUnion):
+        doc[leaf] = list(current or []) + [v for v in value.values if v not in (current or [])]
+    elif isinstance(value, transforms.ArrayRemove):
+        doc[leaf] = [v for v in (current or []) if v not in value.values]
+    elif isinstance(value, dict):
+        target = doc[leaf] = {}
+        for key, nested in value.items():
+            _apply(target, key, nested)
+    else:
+        doc[leaf] = copy.deepcopy(value)
+
+
+def _merge(doc: Dict[str, Any], data: Dict[str, Any]):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(doc.get(key), dict):
+            _merge(doc[key], value)
+        else:
+            _apply(doc, key, value)
+
+
+def _lookup(doc: Dict[str, Any], field: str):
+    for name in field.split("."):
+        if not isinstance(doc, dict) or name not in doc:
+            return None
+        doc = doc[name]
+    return doc
+
+
+def _matches(value, op: str, expected) -> bool:
+    try:
+        if op == "==": return value == expected
+        if op == "!=": return value is not None and value != expected
+        if op == "<": return value is not None and value < expected
+        if op == "<=": return value is not None and value <= expected
+        if op == ">": return value is not None and value > expected
+        if op == ">=": return value is not None and value >= expected
+        if op == "in": return value in expected
+        if op == "not-in": return value is not None and value not in expected
+        if op == "array_contains": return isinstance(value, list) and expected in value
+        if op == "array_contains_any": return isinstance(value, list) and any(v in value for v in expected)
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+class MemorySnapshot:
+    def __init__(self, reference: "MemoryDocumentReference", data: Optional[Dict[str, Any]], update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self.update_time = update_time
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        return copy.deepcopy(_lookup(self._data or {}, field))
+
+
+class MemoryDocumentReference:
+    def __init__(self, db: "MemoryFirestore", collection_path: str, doc_id: str):
+        self._db = db
+        self._collection_path = collection_path
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection_path}/{self.id}"
+
+    def collection(self, name: str) -> "MemoryCollection":
+        return MemoryCollection(self._db, f"{self.path}/{name}")
+
+    def get(self, field_paths: Optional[List[str]] = None, **kwargs) -> MemorySnapshot:
+        with self._db._lock:
+            self._db.ops["read"] += 1
+            data = self._db._docs.get(self._collection_path, {}).get(self.id)
+            if data is not None and field_paths is not None:
+                data = {f: copy.deepcopy(data[f]) for f in field_paths if f in data}
+            return MemorySnapshot(self, copy.deepcopy(data), self._db._update_time(self.path))
+
+    def _check(self, option: Optional["MemoryWriteOption"]):
+        if option is None:
+            return
+        exists = self.id in self._db._docs.get(self._collection_path, {})
+        if option.exists is not None and option.exists != exists:
+            raise exceptions.FailedPrecondition(f"Document {'does not exist' if option.exists else 'exists'}: {self.path}")
+        if option.last_update_time is not None and option.last_update_time != self._db._update_time(self.path):
+            raise exceptions.FailedPrecondition(f"Document was updated since it was read: {self.path}")
+
+    def create(self, data: Dict[str, Any]):
+        with self._db._lock:
+            if self.id in self._db._docs.get(self._collection_path, {}):
+                raise exceptions.AlreadyExists(f"Document already exists: {self.path}")
+            self.set(data)
+
+    def set(self, data: Dict[str, Any], merge: bool = False, option: Optional["MemoryWriteOption"] = None):
+        with self._db._lock:
+            self._check(option)
+            self._db.ops["write"] += 1
+            docs = self._db._docs.setdefault(self._collection_path, {})
+            if merge and self.id in docs:
+                _merge(docs[self.id], data)
+            else:
+                docs[self.id] = {}
+                _merge(docs[self.id], data)
+            self._db._touch(self.path)
+
+    def update(self, data: Dict[str, Any], option: Optional["MemoryWriteOption"] = None):
+        with self._db._lock:
+            self._check(option)
+            self._db.ops["write"] += 1
+            doc = self._db._docs.get(self._collection_path, {}).get(self.id)
+            if doc is None:
+                raise exceptions.NotFound(f"No document to update: {self.path}")
+            for field, value in data.items():
+                _apply(doc, field, value)
+            self._db._touch(self.path)
+
+    def delete(self, option: Optional["MemoryWriteOption"] = None):
+        with self._db._lock:
+            self._check(option)
+            self._db.ops["delete"] += 1
+            self._db._docs.get(self._collection_path, {}).pop(self.id, None)
+            self._db._update_times.pop(self.path, None)
+
+
+class MemoryQuery:
+    def __init__(self, db: "MemoryFirestore", collection_path: str, filters=(), fields=None, orders=(),
+                 limit_count=None, cursor=None):
+        self._db = db
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._fields = fields
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes) -> "MemoryQuery":
+        state = dict(filters=self._filters, fields=self._fields, orders=self._orders,
+                     limit_count=self._limit, cursor=self._cursor) | changes
+        return MemoryQuery(self._db, self._collection_path, **state)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def select(self, field_paths: List[str]) -> "MemoryQuery":
+        return self._copy(fields=list(field_paths))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "MemoryQuery":
+        return self._copy(orders=self._orders + ((field_path, direction == "DESCENDING"),))
+
+    def limit(self, count: int) -> "MemoryQuery":
+        return self._copy(limit_count=count)
+
+    def start_after(self, document) -> "MemoryQuery":
+        return self._copy(cursor=document)
+
+    def stream(self, **kwargs):
+        with self._db._lock:
+            self._db.ops["query"] += 1
+            rows = [(doc_id, copy.deepcopy(data)) for doc_id, data in self._db._docs.get(self._collection_path, {}).items()
+                    if all(_matches(doc_id if f == "__name__" else _lookup(data, f), op, v) for f, op, v in self._filters)]
+            update_times = {doc_id: self._db._update_time(f"{self._collection_path}/{doc_id}") for doc_id, _ in rows}
+        rows.sort(key=lambda row: row[0])
+        # Stable sorts from the last ordering to the first; missing fields sort first
+        for field, descending in reversed(self._orders):
+            value = (lambda row: row[0]) if field == "__name__" else (lambda row, f=field: _lookup(row[1], f))
+            rows.sort(key=lambda row: (value(row) is not None, value(row)), reverse=descending)
+        if self._cursor is not None:
+            cursor_id = getattr(self._cursor, "id", self._cursor)
+            ids = [doc_id for doc_id, _ in rows]
+            rows = rows[ids.index(cursor_id) + 1:] if cursor_id in ids else \
+                [row for row in rows if row[0] > cursor_id]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        with self._db._lock:
+            # Like Firestore, an empty result still bills one read
+            self._db.ops["read"] += max(1, len(rows))
+        for doc_id, data in rows:
+            if self._fields is not None:
+                data = {f: data[f] for f in self._fields if f in data}
+            yield MemorySnapshot(MemoryDocumentReference(self._db, self._collection_path, doc_id), data,
+                                 update_times[doc_id])
+
+    def get(self, **kwargs) -> List[MemorySnapshot]:
+        return list(self.stream())
+
+
+class MemoryCollection(MemoryQuery):
+    def __init__(self, db: "MemoryFirestore", path: str):
+        super().__init__(db, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> MemoryDocumentReference:
+        return MemoryDocumentReference(self._db, self._collection_path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+class MemoryWriteBatch:
+    def __init__(self, db: "MemoryFirestore"):
+        self._db = db
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(lambda: reference.set(data, merge=merge))
+
+    def update(self, reference, data):
+        self._ops.append(lambda: reference.update(data))
+
+    def delete(self, reference):
+        self._ops.append(reference.delete)
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        with self._db._lock:
+            self._db.ops["commit"] += 1
+        for op in ops:
+            op()
+
+    def __len__(self):
+        return len(self._ops)
+
+
+class MemoryBulkWriter(MemoryWriteBatch):
+    """Applies writes on flush and reports each one through the `on_write_result` callback."""
+    def __init__(self, db: "MemoryFirestore"):
+        super().__init__(db)
+        self._on_result = lambda reference, result, writer: None
+
+    def on_write_result(self, callback):
+        self._on_result = callback
+
+    def on_write_error(self, callback):
+        pass
+
+    def set(self, reference, data, merge=False):
+        self._ops.append((reference, lambda: reference.set(data, merge=merge)))
+
+    def update(self, reference, data):
+        self._ops.append((reference, lambda: reference.update(data)))
+
+    def delete(self, reference):
+        self._ops.append((reference, reference.delete))
+
+    def flush(self):
+        ops, self._ops = self._ops, []
+        if ops:
+            with self._db._lock:
+                self._db.ops["commit"] += 1
+        for reference, op in ops:
+            op()
+            self._on_result(reference, None, self)
+
+    def close(self):
+        self.flush()
+
+    commit = flush
+
+
+class MemoryWriteOption:
+    """Write precondition returned by `MemoryFirestore.write_option`."""
+    def __init__(self, last_update_time=None, exists: Optional[bool] = None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class MemoryFirestore:
+    """Drop-in for `firestore.client()` backed by nested dicts.
+
+    Every write stamps the document with a new `update_time`, so `last_update_time`
+    preconditions detect concurrent writers as they do against Firestore.
+    """
+    def __init__(self):
+        self._docs: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._update_times: Dict[str, datetime] = {}
+        self._clock = datetime.now(timezone.utc)
+        self._lock = threading.RLock()
+        self.ops = Counter()
+
+    def _touch(self, path: str):
+        # Strictly increasing, unlike the wall clock
+        self._clock = max(self._clock + timedelta(microseconds=1), datetime.now(timezone.utc))
+        self._update_times[path] = self._clock
+
+    def _update_time(self, path: str):
+        return self._update_times.get(path)
+
+    @staticmethod
+    def write_option(last_update_time=None, exists: Optional[bool] = None) -> MemoryWriteOption:
+        return MemoryWriteOption(last_update_time, exists)
+
+    def collection(self, name: str) -> MemoryCollection:
+        return MemoryCollection(self, name)
+
+    def batch(self) -> MemoryWriteBatch:
+        return MemoryWriteBatch(self)
+
+    def bulk_writer(self, **kwargs) -> MemoryBulkWriter:
+        return MemoryBulkWriter(self)
+
+    def get_all(self, references, field_paths=None, **kwargs):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def dump(self, collection: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(self._docs.get(collection, {}))
+
+
+def load_seed(db, data_dir: str) -> Dict[str, int]:
+    """Fill `creatures` and the location hierarchy from the seed JSON files in `data_dir`.
+
+    Points get the denormalized region / zone / area names and IDs, as in production.
+    Returns the number of documents written per collection.
+    """
+    counts = {}
+
+    def put(collection: str, doc: Dict[str, Any]):
+        data = {k: v for k, v in doc.items() if k not in ("id", "children", "type")}
+        db.collection(collection).document(doc["id"]).set(data)
+        counts[collection] = counts.get(collection, 0) + 1
+
+    with open(os.path.join(data_dir, "creatures_seed.json"), encoding="utf-8") as f:
+        for creature in json.load(f):
+            put("creatures", creature)
+
+    collections = {"Region": "regions", "Zone": "zones", "Area": "areas", "Point": "points"}
+
+    def walk(node: Dict[str, Any], parents: Dict[str, Any]):
+        kind = node.get("type")
+        if kind == "Point":
+            put("points", {k: v for k, v in parents.items() if k not in node or not node[k]} | node)
+        elif kind in collections:
+            put(collections[kind], parents | node)
+            key = kind.lower()
+            parents = parents | {key: node["name"], f"{key}Id": node["id"]}
+        for child in node.get("children", []):
+            walk(child, parents)
+
+    with open(os.path.join(data_dir, "locations_seed.json"), encoding="utf-8") as f:
+        for region in json.load(f):
+            walk(region, {})
+    return counts
@@ -1,9 +1,10 @@
 import json
 import os
-import time
 import math
-import google.generativeai as genai
-from typing import List, Dict, Optional
+from typing import List, Dict
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.gemini_pool import ResourcePool
 import argparse
 
 # Configuration
@@ -27,58 +28,14 @@ if "GOOGLE_API_KEY" not in os.environ:
         except Exception as e:
             print(f"⚠️ Failed to read env.ini: {e}")
 
-API_KEYS = os.environ.get("GOOGLE_API_KEY", "").split(",")
-if not API_KEYS or not API_KEYS[0]:
+if not os.environ.get("GOOGLE_API_KEY", "").strip(", "):
     print("❌ GOOGLE_API_KEY not found in env or env.ini")
-    # Don't raise error immediately to allow user to see message, but returns below will handle it
-    # allow falling through to validation check
-    pass
-else:
-    # Clean keys
-    API_KEYS = [k.strip() for k in API_KEYS if k.strip()]
 
-if not API_KEYS:
-     raise ValueError("GOOGLE_API_KEY environment variable is not set or empty.")
+# Comma-separated keys are used in parallel; each key rests 2s after a success (Lite cooldown)
+POOL = ResourcePool.from_env(success_pause=2.0)
 
 BATCH_SIZE = 10
 
-# --- API Handling Class (Shared Logic) ---
-class APIResource:
-    def __init__(self, api_key: str, model_name: str, priority: int):
-        self.api_key = api_key
-        self.model_name = model_name
-        self.priority = priority
-        self.status = 'stand-by'
-        self.quota_exceed_dt = 0.0
-
-RESOURCE_POOL: List[APIResource] = []
-# Priority: Flash > Lite
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash', 1))
-
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash-lite', 2))
-
-def get_best_resource() -> Optional[APIResource]:
-    current_time = time.time()
-    # Check for release
-    for r in RESOURCE_POOL:
-        if r.status == 'stop':
-            if current_time - r.quota_exceed_dt > 65:
-                r.status = 'stand-by'
-                r.quota_exceed_dt = 0.0
-
-    # Select best
-    candidates = [r for r in RESOURCE_POOL if r.status == 'stand-by']
-    if candidates:
-        candidates.sort(key=lambda x: x.priority)
-        best = candidates[0]
-        best.status = 'active'
-        return best
-    return None
-
 def generate_attributes_batch(creatures: List[Dict]) -> List[Dict]:
     """Gemini to generate missing attributes"""
 
@@ -118,63 +75,16 @@ def generate_attributes_batch(creatures: List[Dict]) -> List[Dict]:
     * Return ONLY the JSON Array.
     """
 
-    while True:
-        resource = get_best_resource()
-
-        if not resource:
-            # Handle exhaustion
-            stopped = [r for r in RESOURCE_POOL if r.status == 'stop']
-            if not stopped:
-                print("    ❌ All resources invalid. Aborting.")
-                return []
-
-            earliest = min(r.quota_exceed_dt for r in stopped) + 65
-            wait = earliest - time.time()
-            if wait > 0:
-                print(f"    ⏳ Waiting {wait:.1f}s for API release...")
-                time.sleep(wait + 1)
-                continue
-            else:
-                time.sleep(1)
-                continue
-
-        try:
-            genai.configure(api_key=resource.api_key)
-            model = genai.GenerativeModel(resource.model_name)
-            response = model.generate_content(prompt)
-
-            text = response.text.strip()
-            # Clean Markdown
-            if text.startswith("```json"): text = text[7:]
-            if text.startswith("```"): text = text[3:]
-            if text.endswith("```"): text = text[:-3]
-
-            try:
-                result = json.loads(text)
-            except json.JSONDecodeError:
-                # Basic fix for truncation
-                if text.strip().endswith("}"): text += "]"
-                result = json.loads(text)
-
-            resource.status = 'stand-by'
-            # Display Success
-            key_idx = API_KEYS.index(resource.api_key) + 1
-            print(f"    ✅ Generated data for {len(result)} items using {resource.model_name} (Key #{key_idx})")
-
-            time.sleep(2) # Lite cooldown
-            return result
-
-        except Exception as e:
-            if "429" in str(e):
-                print(f"    ⚠️ Quota Exceeded (429): {resource.model_name}")
-                resource.status = 'stop'
-                resource.quota_exceed_dt = time.time()
-            else:
-                print(f"    ❌ Error: {e}")
-                resource.status = 'stand-by'
-                time.sleep(1)
+    result = POOL.generate(prompt)
+    if result:
+        print(f"    📦 Generated data for {len(result)} items")
+    return result
 
 def main():
+    parser = argparse.ArgumentParser(description="Fill missing attributes of creatures_prepare.json.")
+    parser.add_argument("--workers", type=int, default=0, help="Parallel requests (default: one per API key)")
+    args = parser.parse_args()
+
     print("🚀 Starting Data Filling for PREPARE file...")
 
     if not os.path.exists(PREPARE_FILE):
@@ -192,15 +102,19 @@ def main():
     num_batches = math.ceil(len(targets) / BATCH_SIZE)
     updated_count = 0
 
-    for i in range(num_batches):
-        batch = targets[i*BATCH_SIZE : (i+1)*BATCH_SIZE]
+    batches = [targets[i*BATCH_SIZE : (i+1)*BATCH_SIZE] for i in range(num_batches)]
+
+    # Batches run in parallel across the API keys; results are merged (and saved) in order
+    def run_batch(i):
+        batch = batches[i]
         print(f"Processing Batch {i+1}/{num_batches} ({len(batch)} items)...")
 
         # Identify which ones actually need update (double check)
         # But split logic already ensures this.
 
-        generated_data = generate_attributes_batch(batch)
+        return generate_attributes_batch(batch)
 
+    for batch, generated_data in zip(batches, POOL.map(run_batch, range(num_batches), args.workers)):
         if not generated_data:
             print("    ⚠️ Empty result for batch.")
             continue
@@ -3,15 +3,16 @@ import json
 import time
 import math
 import hashlib
-import google.generativeai as genai
 from typing import List, Dict
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.json_stream import parse_json_response
+from common.gemini_pool import ResourcePool
 
 # --- 設定 ---
 # --- 設定 ---
-# API Key Handling
-API_KEYS = os.environ.get("GOOGLE_API_KEY", "").split(",")
-if not API_KEYS or not API_KEYS[0]:
-    raise ValueError("GOOGLE_API_KEY environment variable is not set.")
+# API Key Handling (comma-separated keys are used in parallel)
+POOL = ResourcePool.from_env()
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 CONFIG_DIR = os.path.join(BASE_DIR, "scripts/config")
@@ -57,49 +58,6 @@ SCHEMA_PROMPT = """
   }
 ]
 """
-# --- Class Definitions for Robust API Handling ---
-
-class APIResource:
-    def __init__(self, api_key: str, model_name: str, priority: int):
-        self.api_key = api_key
-        self.model_name = model_name
-        self.priority = priority
-        self.status = 'stand-by' # 'stand-by' | 'active' | 'stop'
-        self.quota_exceed_dt = 0.0
-
-RESOURCE_POOL: List[APIResource] = []
-
-# Initialize Pool
-# Priority: Flash > Flash-Lite
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash', 1))
-
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash-lite', 2))
-
-def get_best_resource() -> APIResource:
-    """Design: Priority & Status based selection"""
-    current_time = time.time()
-
-    # 1. Check for release from 'stop' state
-    for r in RESOURCE_POOL:
-        if r.status == 'stop':
-            if current_time - r.quota_exceed_dt > 65:
-                r.status = 'stand-by'
-                r.quota_exceed_dt = 0.0
-
-    # 2. Select 'stand-by' with highest priority
-    candidates = [r for r in RESOURCE_POOL if r.status == 'stand-by']
-    if candidates:
-        candidates.sort(key=lambda x: x.priority)
-        best = candidates[0]
-        best.status = 'active'
-        return best
-
-    return None
-
 def _call_gemini_api(target: str, count: int) -> List[Dict]:
     """Gemini APIを叩く"""
 
@@ -117,76 +75,11 @@ def _call_gemini_api(target: str, count: int) -> List[Dict]:
     {SCHEMA_PROMPT}
     """
 
-    while True:
-        resource = get_best_resource()
-
-        if not resource:
-            stopped_resources = [r for r in RESOURCE_POOL if r.status == 'stop']
-            if not stopped_resources:
-                print("    ❌ All resources invalid/stopped but no timer set. Aborting.")
-                return []
-
-            earliest_release = min(r.quota_exceed_dt for r in stopped_resources) + 65
-            wait_seconds = earliest_release - time.time()
-
-            if wait_seconds > 0:
-                print(f"    ⏳ All resources exhausted. Waiting {wait_seconds:.1f}s for rate limit release...")
-                time.sleep(wait_seconds + 1)
-                continue
-            else:
-                time.sleep(1)
-                continue
-
-        try:
-            # Execute Request
-            genai.configure(api_key=resource.api_key)
-            model = genai.GenerativeModel(resource.model_name)
-
-            response = model.generate_content(prompt)
-            text = response.text.strip()
-            # Remove markdown if present
-            if text.startswith("```json"): text = text[7:]
-            if text.startswith("```"): text = text[3:]
-            if text.endswith("```"): text = text[:-3]
-            if text.strip().endswith("}"): text += "]"
-
-            data = json.loads(text)
-            result = data if isinstance(data, list) else [data]
-            if result:
-                # Success
-                key_display_idx = API_KEYS.index(resource.api_key) + 1
-                print(f"    ✅ Success with {resource.model_name} (Key #{key_display_idx})")
-
-                resource.status = 'stand-by'
-
-                # 🛑 RATE LIMIT HANDLING: Wait 5 seconds after success
-                time.sleep(5)
-                return result
+    def parse(text):
+        data = parse_json_response(text)
+        return data if isinstance(data, list) else [data]
 
-        except Exception as e:
-            error_str = str(e)
-            if "429" in error_str:
-                print(f"    ⚠️ Quota exceeded (429): {resource.model_name} (Key ends {resource.api_key[-4:]})")
-                # print(f"    DEBUG Info: {error_str[:200]}...") # Uncomment to see full error details if needed
-
-                resource.status = 'stop'
-                resource.quota_exceed_dt = time.time()
-
-                # PREVIOUSLY: We stopped all models with this key.
-                # CHANGE: Only stop THIS specific model/key combo to allow fallback to Lite (which has separate RPM).
-                # for r in RESOURCE_POOL:
-                #    if r.api_key == resource.api_key:
-                #        r.status = 'stop'
-                #        r.quota_exceed_dt = time.time()
-
-            elif "404" in error_str or "not found" in error_str.lower():
-                print(f"    ℹ️ Model {resource.model_name} not found. Removing from pool.")
-                if resource in RESOURCE_POOL:
-                    RESOURCE_POOL.remove(resource)
-            else:
-                print(f"    ❌ Error with {resource.model_name}: {e}")
-                resource.status = 'stand-by'
-                time.sleep(1)
+    return POOL.generate(prompt, parse=parse, accept=bool)
 
 def generate_creatures_by_group(target: str, total_count: int) -> List[Dict]:
     """バッチ処理で生成"""
@@ -211,8 +104,6 @@ def generate_creatures_by_group(target: str, total_count: int) -> List[Dict]:
         else:
             print(f"    -> Batch {i+1}/{num_batches}: Failed.")
 
-        time.sleep(2)
-
     return combined_data
 
 import argparse
@@ -224,7 +115,6 @@ import json
 import time
 import math
 import hashlib
-import google.generativeai as genai
 from typing import List, Dict
 
 # ... (rest of imports/constants up to main)
@@ -233,12 +123,9 @@ def main():
     parser = argparse.ArgumentParser(description="Generate creature data based on taxonomy.")
     parser.add_argument("--mode", choices=["append", "overwrite", "clean"], default="append",
                         help="Generation mode: append (default), overwrite, or clean.")
+    parser.add_argument("--workers", type=int, default=0, help="Families generated in parallel (default: one per API key)")
     args = parser.parse_args()
 
-    if not API_KEYS:
-        print("⚠️ API Key missing.")
-        return
-
     # Clean mode: Backup and delete existing file
     if args.mode == "clean":
         if os.path.exists(OUTPUT_FILE):
@@ -295,17 +182,18 @@ def main():
         if os.path.exists(PROCESSED_LOG):
             os.remove(PROCESSED_LOG)
 
+    pending_groups = []
     for group in target_groups:
         if args.mode == "append" and group in processed_groups:
              print(f"    ⏭️  Skipping {group} (Already processed).")
              continue
+        pending_groups.append(group)
 
-        # Check if we need to generate for this group at all (optimization for append)
-        # Note: Since we generate by group, checking individual items happens after fetching,
-        # or we could try to skip the whole group if we knew it was fully populated.
-        # For now, we'll fetch and then filter/merge.
+    # Groups are generated in parallel across the API keys; items are fetched first, then filtered/merged
+    # (and saved) group by group in order.
+    generated = POOL.map(lambda g: generate_creatures_by_group(g, COUNT_PER_GROUP), pending_groups, args.workers)
 
-        new_items = generate_creatures_by_group(group, COUNT_PER_GROUP)
+    for group, new_items in zip(pending_groups, generated):
 
         # Mark as processed ONLY if we successfully got items.
         # If new_items is empty (e.g. due to API errors), do NOT mark as processed so we can retry.
@@ -1,16 +1,15 @@
 import json
 import os
-import time
 import math
-import google.generativeai as genai
 from typing import List, Dict
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.gemini_pool import ResourcePool
 
 # 設定
 # 設定
-# API Key Handling
-API_KEYS = os.environ.get("GOOGLE_API_KEY", "").split(",")
-if not API_KEYS or not API_KEYS[0]:
-    raise ValueError("GOOGLE_API_KEY environment variable is not set.")
+# API Key Handling (comma-separated keys are used in parallel)
+POOL = ResourcePool.from_env()
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 CONFIG_DIR = os.path.join(BASE_DIR, "scripts/config")
@@ -25,49 +24,6 @@ def get_target_regions() -> List[str]:
     with open(TARGET_REGIONS_FILE, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-# --- Class Definitions for Robust API Handling ---
-
-class APIResource:
-    def __init__(self, api_key: str, model_name: str, priority: int):
-        self.api_key = api_key
-        self.model_name = model_name
-        self.priority = priority
-        self.status = 'stand-by' # 'stand-by' | 'active' | 'stop'
-        self.quota_exceed_dt = 0.0
-
-RESOURCE_POOL: List[APIResource] = []
-
-# Initialize Pool
-# Priority: Flash > Flash-Lite
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash', 1))
-
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash-lite', 2))
-
-def get_best_resource() -> APIResource:
-    """Design: Priority & Status based selection"""
-    current_time = time.time()
-
-    # 1. Check for release from 'stop' state
-    for r in RESOURCE_POOL:
-        if r.status == 'stop':
-            if current_time - r.quota_exceed_dt > 65:
-                r.status = 'stand-by'
-                r.quota_exceed_dt = 0.0
-
-    # 2. Select 'stand-by' with highest priority
-    candidates = [r for r in RESOURCE_POOL if r.status == 'stand-by']
-    if candidates:
-        candidates.sort(key=lambda x: x.priority)
-        best = candidates[0]
-        best.status = 'active'
-        return best
-
-    return None
-
 def map_regions_batch(creatures: List[Dict], region_list: List[str]) -> List[Dict]:
     """Geminiにバッチで生息域を判定させる"""
 
@@ -91,79 +47,13 @@ def map_regions_batch(creatures: List[Dict], region_list: List[str]) -> List[Dic
     ]
     """
 
-    while True:
-        resource = get_best_resource()
-
-        if not resource:
-            stopped_resources = [r for r in RESOURCE_POOL if r.status == 'stop']
-            if not stopped_resources:
-                print("    ❌ All resources invalid/stopped but no timer set. Aborting.")
-                return []
-
-            earliest_release = min(r.quota_exceed_dt for r in stopped_resources) + 65
-            wait_seconds = earliest_release - time.time()
-
-            if wait_seconds > 0:
-                print(f"    ⏳ All resources exhausted. Waiting {wait_seconds:.1f}s for rate limit release...")
-                time.sleep(wait_seconds + 1)
-                continue
-            else:
-                time.sleep(1)
-                continue
-
-        try:
-            # Execute Request
-            genai.configure(api_key=resource.api_key)
-            model = genai.GenerativeModel(resource.model_name)
-
-            response = model.generate_content(prompt)
-            text = response.text.strip()
-            if text.startswith("```json"): text = text[7:]
-            if text.startswith("```"): text = text[3:]
-            if text.endswith("```"): text = text[:-3]
-
-            result = json.loads(text)
-
-            # Success
-            key_display_idx = API_KEYS.index(resource.api_key) + 1
-            print(f"    ✅ Success with {resource.model_name} (Key #{key_display_idx})")
-
-            resource.status = 'stand-by'
-
-            # 🛑 RATE LIMIT HANDLING: Wait 5 seconds after success
-            time.sleep(5)
-            return result
-        except Exception as e:
-            error_str = str(e)
-            if "429" in error_str:
-                print(f"    ⚠️ Quota exceeded (429): {resource.model_name} (Key ends {resource.api_key[-4:]})")
-                resource.status = 'stop'
-                resource.quota_exceed_dt = time.time()
-
-                # PREVIOUSLY: We stopped all models with this key.
-                # CHANGE: Only stop THIS specific model/key combo to allow fallback to Lite.
-                # for r in RESOURCE_POOL:
-                #    if r.api_key == resource.api_key:
-                #        r.status = 'stop'
-                #        r.quota_exceed_dt = time.time()
-
-            elif "404" in error_str or "not found" in error_str.lower():
-                print(f"    ℹ️ Model {resource.model_name} not found. Removing from pool.")
-                if resource in RESOURCE_POOL:
-                    RESOURCE_POOL.remove(resource)
-            else:
-                print(f"    ❌ Error with {resource.model_name}: {e}")
-                resource.status = 'stand-by'
-                time.sleep(1)
+    return POOL.generate(prompt)
 
 import argparse
-import shutil
 # ... (imports remain)
 import json
 import os
-import time
 import math
-import google.generativeai as genai
 from typing import List, Dict
 
 # ... (imports/constants up to main)
@@ -172,6 +62,7 @@ def main():
     parser = argparse.ArgumentParser(description="Map creatures to regions.")
     parser.add_argument("--mode", choices=["append", "overwrite", "clean"], default="append",
                         help="Mode: append (skip existing), overwrite (re-map all), clean (reset all regions first).")
+    parser.add_argument("--workers", type=int, default=0, help="Parallel requests (default: one per API key)")
     args = parser.parse_args()
 
     if not os.path.exists(CREATURES_FILE):
@@ -195,6 +86,7 @@ def main():
 
     updated_count = 0
     num_batches = math.ceil(len(creatures) / BATCH_SIZE)
+    batches = []
 
     for i in range(num_batches):
         batch_slice = creatures[i*BATCH_SIZE : (i+1)*BATCH_SIZE]
@@ -209,10 +101,15 @@ def main():
         if not targets:
             print(f"Skipping batch {i+1} (No targets for {args.mode}).")
             continue
+        batches.append((i, targets))
 
+    # Batches run in parallel across the API keys; results are merged in order
+    def run_batch(batch):
+        i, targets = batch
         print(f"Processing Batch {i+1}/{num_batches} ({len(targets)} items)...")
-        results = map_regions_batch(targets, target_regions)
+        return map_regions_batch(targets, target_regions)
 
+    for (i, targets), results in zip(batches, POOL.map(run_batch, batches, args.workers)):
         # 結果のマージ
         result_map = {r["name"]: r["regions"] for r in results}
 
@@ -221,8 +118,6 @@ def main():
                 c["regions"] = result_map[c["name"]]
                 updated_count += 1
 
-        time.sleep(2)
-
     # 保存
     with open(CREATURES_FILE, 'w', encoding='utf-8') as f:
         json.dump(creatures, f, indent=2, ensure_ascii=False)
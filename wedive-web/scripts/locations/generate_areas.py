@@ -2,16 +2,16 @@ import os
 import json
 import time
 import hashlib
-import google.generativeai as genai
 import argparse
 import shutil
 from typing import List, Dict
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.gemini_pool import ResourcePool
 
 # --- 設定 ---
 # API Key
-API_KEYS = os.environ.get("GOOGLE_API_KEY", "").split(",")
-if not API_KEYS or not API_KEYS[0]:
-    raise ValueError("GOOGLE_API_KEY environment variable is not set.")
+POOL = ResourcePool.from_env()
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 CONFIG_DIR = os.path.join(BASE_DIR, "scripts/config")
@@ -20,49 +20,6 @@ INPUT_FILE = os.path.join(CONFIG_DIR, "target_zones.json")
 OUTPUT_FILE = os.path.join(DATA_DIR, "locations_seed.json")
 PRODUCED_AREAS_FILE = os.path.join(CONFIG_DIR, "target_areas.json")
 
-# --- Class Definitions for Robust API Handling ---
-
-class APIResource:
-    def __init__(self, api_key: str, model_name: str, priority: int):
-        self.api_key = api_key
-        self.model_name = model_name
-        self.priority = priority
-        self.status = 'stand-by' # 'stand-by' | 'active' | 'stop'
-        self.quota_exceed_dt = 0.0
-
-RESOURCE_POOL: List[APIResource] = []
-
-# Initialize Pool
-# Priority: Flash > Flash-Lite
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash', 1))
-
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash-lite', 2))
-
-def get_best_resource() -> APIResource:
-    """Design: Priority & Status based selection"""
-    current_time = time.time()
-
-    # 1. Check for release from 'stop' state
-    for r in RESOURCE_POOL:
-        if r.status == 'stop':
-            if current_time - r.quota_exceed_dt > 65:
-                r.status = 'stand-by'
-                r.quota_exceed_dt = 0.0
-
-    # 2. Select 'stand-by' with highest priority
-    candidates = [r for r in RESOURCE_POOL if r.status == 'stand-by']
-    if candidates:
-        candidates.sort(key=lambda x: x.priority)
-        best = candidates[0]
-        best.status = 'active'
-        return best
-
-    return None
-
 def generate_areas(region: str, zone: str) -> List[Dict]:
     prompt = f"""
     あなたはダイビング旅行プランナーです。
@@ -85,78 +42,13 @@ def generate_areas(region: str, zone: str) -> List[Dict]:
     - 決してMarkdownのコードブロック(```json ... ```)を含めないでください。純粋なJSON文字列のみを返してください。
     """
 
-    while True:
-        resource = get_best_resource()
-
-        if not resource:
-            stopped_resources = [r for r in RESOURCE_POOL if r.status == 'stop']
-            if not stopped_resources:
-                print("    ❌ All resources invalid/stopped but no timer set. Aborting.")
-                return []
-
-            earliest_release = min(r.quota_exceed_dt for r in stopped_resources) + 65
-            wait_seconds = earliest_release - time.time()
-
-            if wait_seconds > 0:
-                print(f"    ⏳ All resources exhausted. Waiting {wait_seconds:.1f}s for rate limit release...")
-                time.sleep(wait_seconds + 1)
-                continue
-            else:
-                time.sleep(1)
-                continue
-
-        try:
-            # Execute Request
-            genai.configure(api_key=resource.api_key)
-            model = genai.GenerativeModel(resource.model_name)
-
-            response = model.generate_content(prompt)
-            text = response.text.strip()
-            # Remove markdown if present
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.endswith("```"):
-                text = text[:-3]
-
-            result = json.loads(text)
-            if result:
-                # Success
-                key_display_idx = API_KEYS.index(resource.api_key) + 1
-                print(f"    ✅ Success with {resource.model_name} (Key #{key_display_idx})")
-
-                resource.status = 'stand-by'
-
-                # 🛑 RATE LIMIT HANDLING: Wait 5 seconds after success
-                time.sleep(5)
-                return result
-
-        except Exception as e:
-            error_str = str(e)
-            if "429" in error_str:
-                print(f"    ⚠️ Quota exceeded (429): {resource.model_name} (Key ends {resource.api_key[-4:]})")
-                resource.status = 'stop'
-                resource.quota_exceed_dt = time.time()
-
-                # PREVIOUSLY: We stopped all models with this key.
-                # CHANGE: Only stop THIS specific model/key combo to allow fallback to Lite.
-                # for r in RESOURCE_POOL:
-                #    if r.api_key == resource.api_key:
-                #        r.status = 'stop'
-                #        r.quota_exceed_dt = time.time()
-
-            elif "404" in error_str or "not found" in error_str.lower():
-                print(f"    ℹ️ Model {resource.model_name} not found. Removing from pool.")
-                if resource in RESOURCE_POOL:
-                    RESOURCE_POOL.remove(resource)
-            else:
-                print(f"    ❌ Error with {resource.model_name}: {e}")
-                resource.status = 'stand-by'
-                time.sleep(1)
+    return POOL.generate(prompt, accept=bool)
 
 def main():
     parser = argparse.ArgumentParser(description="Generate Areas data.")
     parser.add_argument("--mode", choices=["append", "overwrite", "clean"], default="append",
                         help="Execution mode: append (skip existing), overwrite (replace existing), clean (start fresh)")
+    parser.add_argument("--workers", type=int, default=0, help="Zones generated in parallel (default: one per API key)")
     args = parser.parse_args()
 
     if not os.path.exists(INPUT_FILE):
@@ -185,6 +77,8 @@ def main():
     produced_areas_list = []
     print(f"🚀 Generating Areas for {len(target_zones)} zones... [Mode: {args.mode.upper()}]")
 
+    # In target order: the next-step entries of a skipped zone, or a zone to generate
+    steps, jobs = [], []
     for target in target_zones:
         region_name = target["region"]
         zone_name = target["zone"]
@@ -207,17 +101,25 @@ def main():
         if args.mode == "append" and len(existing_areas) > 0:
             print(f"    ⏭️  Skipping (Areas already exist).")
             # Next Step用に記録
-            for a in existing_areas:
-                produced_areas_list.append({"region": region_name, "zone": zone_name, "area": a["name"]})
+            steps.append([{"region": region_name, "zone": zone_name, "area": a["name"]} for a in existing_areas])
             continue
 
         # Mode: Overwrite - Clear existing areas
         if args.mode == "overwrite" and len(existing_areas) > 0:
             print(f"    ♻️  Overwriting areas...")
             existing_areas = []
-
-        # Generate
-        new_areas = generate_areas(region_name, zone_name)
+        jobs.append((region_name, zone_name, zone_node, existing_areas))
+        steps.append(jobs[-1])
+
+    # Generate in parallel across the API keys; results are merged (and saved) in order
+    generated = POOL.map(lambda job: generate_areas(job[0], job[1]), jobs, args.workers)
+    for step in steps:
+        if isinstance(step, list):
+            produced_areas_list.extend(step)
+            continue
+        region_name, zone_name, zone_node, existing_areas = step
+        new_areas = next(generated)
+        print(f"  Merging {region_name} > {zone_name}...")
 
         # Merge (Overwriteの場合は空配列への追加になるので実質新規)
         existing_area_names = {a["name"] for a in existing_areas}
@@ -243,8 +145,6 @@ def main():
             json.dump(all_locations, f, indent=2, ensure_ascii=False)
         print(f"    💾 Progress saved to {OUTPUT_FILE}")
 
-        time.sleep(2)
-
     # Save Config for Next Step (Final)
     with open(PRODUCED_AREAS_FILE, 'w', encoding='utf-8') as f:
         json.dump(produced_areas_list, f, indent=2, ensure_ascii=False)
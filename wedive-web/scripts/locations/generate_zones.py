@@ -2,14 +2,14 @@ import os
 import json
 import time
 import hashlib
-import google.generativeai as genai
 from typing import List, Dict
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.gemini_pool import ResourcePool
 
 # --- 設定 ---
 # API Key Handling　　APIKEY　カンマ区切りで複数指定可
-API_KEYS = os.environ.get("GOOGLE_API_KEY", "").split(",")
-if not API_KEYS or not API_KEYS[0]:
-    raise ValueError("GOOGLE_API_KEY environment variable is not set.")
+POOL = ResourcePool.from_env()
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 CONFIG_DIR = os.path.join(BASE_DIR, "scripts/config")
@@ -18,50 +18,7 @@ INPUT_FILE = os.path.join(CONFIG_DIR, "target_regions.json")
 OUTPUT_FILE = os.path.join(DATA_DIR, "locations_seed.json")
 PRODUCED_ZONES_FILE = os.path.join(CONFIG_DIR, "target_zones.json")
 
-# --- Class Definitions for Robust API Handling ---
-
-class APIResource:
-    def __init__(self, api_key: str, model_name: str, priority: int):
-        self.api_key = api_key
-        self.model_name = model_name
-        self.priority = priority
-        self.status = 'stand-by' # 'stand-by' | 'active' | 'stop'
-        self.quota_exceed_dt = 0.0
-
-RESOURCE_POOL: List[APIResource] = []
-
-# Initialize Pool
-# Priority: Flash > Flash-Lite
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash', 1))
-
-for key in API_KEYS:
-    if not key: continue
-    RESOURCE_POOL.append(APIResource(key, 'gemini-2.5-flash-lite', 2))
-
-def get_best_resource() -> APIResource:
-    """Design: Priority & Status based selection"""
-    current_time = time.time()
-
-    # 1. Check for release from 'stop' state
-    for r in RESOURCE_POOL:
-        if r.status == 'stop':
-            if current_time - r.quota_exceed_dt > 65:
-                r.status = 'stand-by'
-                r.quota_exceed_dt = 0.0
-
-    # 2. Select 'stand-by' with highest priority
-    candidates = [r for r in RESOURCE_POOL if r.status == 'stand-by']
-    if candidates:
-        candidates.sort(key=lambda x: x.priority)
-        best = candidates[0]
-        best.status = 'active'
-        return best
-
-    return None
-
-def generate_zones(region: str, zone: str) -> List[Dict]:
+def generate_zones(region: str, zone: str = None) -> List[Dict]:
     # Note: `zone` parameter here seems redundant or misused potentially based on variable name,
     # but maintaining signature. The prompt uses 'region'.
 
@@ -85,66 +42,7 @@ def generate_zones(region: str, zone: str) -> List[Dict]:
     - 決してMarkdownのコードブロック(```json ... ```)を含めないでください。純粋なJSON文字列のみを返してください。
     """
 
-    while True:
-        resource = get_best_resource()
-
-        if not resource:
-            stopped_resources = [r for r in RESOURCE_POOL if r.status == 'stop']
-            if not stopped_resources:
-                print("    ❌ All resources invalid/stopped but no timer set. Aborting.")
-                return []
-
-            earliest_release = min(r.quota_exceed_dt for r in stopped_resources) + 65
-            wait_seconds = earliest_release - time.time()
-
-            if wait_seconds > 0:
-                print(f"    ⏳ All resources exhausted. Waiting {wait_seconds:.1f}s for rate limit release...")
-                time.sleep(wait_seconds + 1)
-                continue
-            else:
-                time.sleep(1)
-                continue
-
-        try:
-            # Execute Request
-            genai.configure(api_key=resource.api_key)
-            model = genai.GenerativeModel(resource.model_name)
-
-            response = model.generate_content(prompt)
-            text = response.text.strip()
-            # Remove markdown if present
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.endswith("```"):
-                text = text[:-3]
-
-            result = json.loads(text)
-            if result:
-                # Success
-                key_display_idx = API_KEYS.index(resource.api_key) + 1
-                print(f"    ✅ Success with {resource.model_name} (Key #{key_display_idx})")
-
-                resource.status = 'stand-by'
-
-                # 🛑 RATE LIMIT HANDLING: Wait 5 seconds after success
-                time.sleep(5)
-                return result
-
-        except Exception as e:
-            error_str = str(e)
-            if "429" in error_str:
-                print(f"    ⚠️ Quota exceeded (429): {resource.model_name} (Key ends {resource.api_key[-4:]})")
-                resource.status = 'stop'
-                resource.quota_exceed_dt = time.time()
-
-            elif "404" in error_str or "not found" in error_str.lower():
-                print(f"    ℹ️ Model {resource.model_name} not found. Removing from pool.")
-                if resource in RESOURCE_POOL:
-                    RESOURCE_POOL.remove(resource)
-            else:
-                print(f"    ❌ Error with {resource.model_name}: {e}")
-                resource.status = 'stand-by'
-                time.sleep(1)
+    return POOL.generate(prompt, accept=bool)
 
 import argparse
 import shutil
@@ -153,6 +51,7 @@ def main():
     parser = argparse.ArgumentParser(description="Generate Zones data.")
     parser.add_argument("--mode", choices=["append", "overwrite", "clean"], default="append",
                         help="Execution mode: append (skip existing), overwrite (replace existing), clean (start fresh)")
+    parser.add_argument("--workers", type=int, default=0, help="Regions generated in parallel (default: one per API key)")
     args = parser.parse_args()
 
     if not os.path.exists(INPUT_FILE):
@@ -182,6 +81,12 @@ def main():
 
     print(f"🚀 Generating Zones for {len(target_regions)} regions... [Mode: {args.mode.upper()}]")
 
+    # Regions to generate; existing ones are skipped in append mode
+    existing_names = {r["name"] for r in all_locations}
+    pending_regions = [r for r in target_regions if not (args.mode == "append" and r in existing_names)]
+    # Generated (Clean, Overwrite, or Append-new) in parallel across the API keys; merged (and saved) in order
+    results = POOL.map(generate_zones, pending_regions, args.workers)
+
     for region_name in target_regions:
         print(f"  Processing {region_name}...")
 
@@ -189,7 +94,7 @@ def main():
         existing_region = next((r for r in all_locations if r["name"] == region_name), None)
 
         # Mode: Append - Skip if exists
-        if args.mode == "append" and existing_region:
+        if args.mode == "append" and region_name in existing_names:
             print(f"    ⏭️  Skipping {region_name} (Already exists).")
             # Next step用に既存Zoneをリストアップ
             for z in existing_region.get("children", []):
@@ -203,8 +108,7 @@ def main():
             all_locations = [r for r in all_locations if r["name"] != region_name]
             existing_region = None
 
-        # Generate (Clean, Overwrite, or Append-new)
-        zones_data = generate_zones(region_name)
+        zones_data = next(results)
         if not zones_data: continue
 
         if existing_region:
@@ -248,8 +152,6 @@ def main():
             json.dump(all_locations, f, indent=2, ensure_ascii=False)
         print(f"    💾 Progress saved to {OUTPUT_FILE}")
 
-        time.sleep(2)
-
     # Save Config for Next Step (Final)
     with open(PRODUCED_ZONES_FILE, 'w', encoding='utf-8') as f:
         json.dump(produced_zones_list, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,84 @@
+"""Offline checks of the cleansing pipeline (in-memory Firestore, synthetic Gemini answers)."""
+import os
+import sys
+import threading
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SCRIPTS_DIR, os.path.join(SCRIPTS_DIR, "benchmarks")]
+
+import cleansing_pipeline as cp
+from bench_cleansing_pipeline import SyntheticModel, build_catalog
+from common.genai_replay import FixtureStore, ReplayClient
+from common.memory_firestore import MemoryFirestore
+
+
+def make_pipeline(tmp_path, n_points=16, n_creatures=60, latency=0.02):
+    db = MemoryFirestore()
+    creature_ids = build_catalog(db, n_points, n_creatures)
+    client = ReplayClient(FixtureStore(str(tmp_path / "none.jsonl")), latency=latency,
+                          fallback=SyntheticModel(creature_ids, 0.1, 0.0, 0))
+    return cp.CleansingPipeline(client=client, db=db)
+
+
+def test_pipelined_stage1_runs_on_stage1_workers(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    threads = []
+    stream = pipeline._stream_stage1
+
+    def spy(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return stream(*args, **kwargs)
+
+    pipeline._stream_stage1 = spy
+    pipeline.process(mode="all", filters={}, limit=10 ** 6, concurrency=2, pipeline=True, stage2_workers=2)
+
+    assert len(threads) == len(pipeline.points)
+    assert all(name.startswith("pipeline-stage1-") for name in threads), threads
+    assert pipeline.pipeline_stats["busySeconds"]["stage1"] > 0
+
+
+def test_grounding_cache_keeps_prompt_versions_apart(tmp_path):
+    cache = cp.SQLiteGroundingCache(str(tmp_path / "cache.sqlite"))
+    verdict = {"actual_existence": True, "evidence": "batch", "rarity": "Common"}
+    cache.put("p1", "c1", verdict, cp.STAGE2_BATCH_PROMPT_VERSION)
+
+    assert cache.get("p1", "c1") is None
+    assert cache.get("p1", "c1", cp.STAGE2_BATCH_PROMPT_VERSION) == verdict
+
+
+def test_area_grounding_batches_area_queries(tmp_path):
+    grounded = {}
+    for mode in ("off", "reuse", "confirm"):
+        pipeline = make_pipeline(tmp_path, latency=0.0)
+        pipeline.process(mode="all", filters={}, limit=10**6, concurrency=4, area_grounding=mode, stage2_batch_size=10)
+        grounded[mode] = pipeline.metrics.summary()["totals"]["grounded"]
+
+    # One area request per batch of creatures, answered for the asking point as well
+    assert grounded["reuse"] <= grounded["off"]
+    assert grounded["confirm"] <= 2 * grounded["off"]
+
+
+def test_batch_sink_logs_mappings_as_stored_after_commit(tmp_path, caplog):
+    pipeline = make_pipeline(tmp_path, latency=0.0)
+    with caplog.at_level("INFO", logger=cp.logger.name):
+        pipeline.process(mode="all", filters={}, limit=10**6, concurrency=2, sink="batch", flush_interval=3600)
+
+    messages = [r.getMessage() for r in caplog.records]
+    queued = [i for i, m in enumerate(messages) if "[QUEUED]" in m]
+    stored = [i for i, m in enumerate(messages) if "[STORED]" in m]
+    committed = [i for i, m in enumerate(messages) if "Committed batch" in m]
+    assert len(queued) == len(stored) == pipeline.processed_count > 0
+    assert committed and max(queued) < committed[0] < min(stored)
+
+
+def test_habitat_prefilter_ignores_scalar_water_temperatures():
+    prefilter = cp.HabitatPreFilter([
+        {"id": "tropical", "waterTempRange": {"min": 24, "max": 30}},
+        {"id": "cold", "waterTempRange": {"min": 5, "max": 12}},
+        {"id": "unknown", "waterTempRange": "20-25"},
+    ], min_score=0.5)
+
+    assert list(prefilter.score({"waterTemp": "24"})) == [1.0, 1.0, 1.0]
+    assert list(prefilter.score({"waterTemp": 24})) == [1.0, 1.0, 1.0]
+    # A scalar waterTemp does not hide the point's waterTempRange
+    assert prefilter.candidates({"waterTemp": "24", "waterTempRange": {"min": 24, "max": 28}}) == ["tropical", "unknown"]